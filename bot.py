@@ -1,36 +1,40 @@
 import asyncio
 from telegram import Bot
 from telegram.error import TelegramError
-from typing import List, Dict
+from typing import List, Dict, Union
 import config
+from product import Product
 
 class TelegramBot:
-    def __init__(self, token: str):
+    def __init__(self, token: str, db=None):
         self.bot = Bot(token=token)
-        self._db = None  # Ленивая инициализация базы данных
+        # Общая с ботом база данных (AsyncProductDatabase); без нее - ленивая инициализация своей
+        self._db = db
     
-    def _unsubscribe_user(self, user_id: int):
+    async def _unsubscribe_user(self, user_id: int):
         """Отписать пользователя от рассылки (внутренний метод)"""
         try:
-            from database import ProductDatabase
-            import config
             if self._db is None:
-                self._db = ProductDatabase(config.DB_FILE)
-            self._db.unsubscribe_user(user_id)
+                from database import AsyncProductDatabase, ProductDatabase
+                self._db = AsyncProductDatabase(ProductDatabase(config.DB_FILE))
+            await self._db.unsubscribe_user(user_id)
         except Exception as e:
             print(f"Ошибка при отписке пользователя {user_id}: {e}")
     
-    async def send_product_to_user(self, user_id: int, product: Dict, parser) -> bool:
-        """Отправка одного товара конкретному пользователю"""
+    async def send_product_to_user(self, user_id: int, product: Union[Product, Dict], parser, header: str = None) -> bool:
+        """Отправка одного товара конкретному пользователю; header - строка перед описанием товара"""
         try:
+            product = Product.coerce(product)
             message = parser.format_product_message(product)
+            if header:
+                message = f"{header}\n\n{message}"
             
             # Если есть изображение, отправляем с фото
-            if product.get('image'):
+            if product.image:
                 try:
                     await self.bot.send_photo(
                         chat_id=user_id,
-                        photo=product['image'],
+                        photo=product.image,
                         caption=message,
                         parse_mode='HTML'
                     )
@@ -40,7 +44,7 @@ class TelegramBot:
                     # Если пользователь заблокировал бота или удалил чат, отписываем его
                     if "Chat not found" in error_message or "bot was blocked" in error_message.lower() or "chat not found" in error_message.lower():
                         print(f"Пользователь {user_id} заблокировал бота или удалил чат, отписываем...")
-                        self._unsubscribe_user(user_id)
+                        await self._unsubscribe_user(user_id)
                         return False
                     print(f"Ошибка при отправке фото пользователю {user_id}, пробуем без фото: {e}")
             
@@ -57,7 +61,7 @@ class TelegramBot:
                 error_message = str(e)
                 if "Chat not found" in error_message or "bot was blocked" in error_message.lower() or "chat not found" in error_message.lower():
                     print(f"Пользователь {user_id} заблокировал бота или удалил чат, отписываем...")
-                    self._unsubscribe_user(user_id)
+                    await self._unsubscribe_user(user_id)
                     return False
                 raise
             
@@ -66,7 +70,7 @@ class TelegramBot:
             # Если пользователь заблокировал бота или удалил чат, отписываем его
             if "Chat not found" in error_message or "bot was blocked" in error_message.lower() or "chat not found" in error_message.lower():
                 print(f"Пользователь {user_id} заблокировал бота или удалил чат, отписываем...")
-                self._unsubscribe_user(user_id)
+                await self._unsubscribe_user(user_id)
             else:
                 print(f"Ошибка Telegram при отправке товара пользователю {user_id}: {e}")
             return False
@@ -74,11 +78,12 @@ class TelegramBot:
             print(f"Общая ошибка при отправке товара пользователю {user_id}: {e}")
             return False
     
-    async def send_product_to_all_users(self, user_ids: List[int], product: Dict, parser) -> int:
+    async def send_product_to_all_users(self, user_ids: List[int], product: Union[Product, Dict], parser,
+                                        header: str = None) -> int:
         """Отправка товара всем пользователям"""
         sent_count = 0
         for user_id in user_ids:
-            success = await self.send_product_to_user(user_id, product, parser)
+            success = await self.send_product_to_user(user_id, product, parser, header)
             if success:
                 sent_count += 1
                 # Небольшая задержка между сообщениями, чтобы не превысить лимиты API
@@ -86,7 +91,7 @@ class TelegramBot:
         
         return sent_count
     
-    async def send_products_to_all_users(self, user_ids: List[int], products: List[Dict], parser, max_per_batch: int = 5) -> int:
+    async def send_products_to_all_users(self, user_ids: List[int], products: List[Union[Product, Dict]], parser, max_per_batch: int = 5) -> int:
         """Отправка нескольких товаров всем пользователям"""
         total_sent = 0
         for product in products[:max_per_batch]:
@@ -111,7 +116,7 @@ class TelegramBot:
             # Если пользователь заблокировал бота или удалил чат, отписываем его
             if "Chat not found" in error_message or "bot was blocked" in error_message.lower() or "chat not found" in error_message.lower():
                 print(f"Пользователь {user_id} заблокировал бота или удалил чат, отписываем...")
-                self._unsubscribe_user(user_id)
+                await self._unsubscribe_user(user_id)
             else:
                 print(f"Ошибка Telegram при отправке сообщения пользователю {user_id}: {e}")
             return False
@@ -0,0 +1,112 @@
+"""
+Поиск брендов, категорий и стоп-слов в названии/описании товара за один проход (автомат Ахо-Корасик)
+"""
+from collections import deque, namedtuple
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# brand - найденный бренд из фильтра (None - не найден), category - категория (обувь и т.п.),
+# excluded - в названии есть стоп-слово (категория, навигация, а не товар)
+BrandMatch = namedtuple('BrandMatch', ['brand', 'category', 'excluded'])
+
+
+class AhoCorasick:
+    """Автомат Ахо-Корасик: все вхождения набора строк в текст за один линейный проход"""
+
+    def __init__(self, patterns: Iterable[Tuple[str, object]]):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pattern, value in patterns:
+            if not pattern:
+                continue
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[node][char] = next_node
+                node = next_node
+            self._out[node].append((len(pattern), value))
+
+        # Суффиксные ссылки в порядке обхода в ширину: у более короткого префикса они уже посчитаны
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, next_node in self._goto[node].items():
+                queue.append(next_node)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_node] = self._goto[fail].get(char, 0)
+                self._out[next_node] = self._out[next_node] + self._out[self._fail[next_node]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, object]]:
+        """(начало, конец, значение) каждого вхождения"""
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for length, value in out[node]:
+                yield index + 1 - length, index + 1, value
+
+
+class BrandMatcher:
+    """Фильтр брендов: бренды (с вариантами написания), ключевые слова категорий и стоп-слова в одном автомате"""
+
+    def __init__(self, brands: List[Dict], aliases: Dict[str, List[str]] = None,
+                 category_keywords: Dict[str, List[str]] = None, exclude_words: Iterable[str] = ()):
+        aliases = aliases or {}
+        # (бренд, требуемая категория) в порядке фильтра
+        self._brands = [(brand_info['name'].lower(), brand_info.get('category')) for brand_info in brands]
+
+        patterns = []
+        for brand, _ in self._brands:
+            for variant in [brand] + list(aliases.get(brand, [])):
+                patterns.append((variant.lower(), ('brand', brand)))
+        for category, keywords in (category_keywords or {}).items():
+            for keyword in keywords:
+                patterns.append((keyword.lower(), ('category', category)))
+        for word in exclude_words:
+            patterns.append((word.lower(), ('exclude', word)))
+        self._automaton = AhoCorasick(patterns)
+
+    def classify(self, title: str, description: str = '') -> BrandMatch:
+        """Бренд и категория по названию и описанию; стоп-слова ищутся только в названии"""
+        title = (title or '').lower()
+        text = f"{title} {(description or '').lower()}"
+
+        brands = set()
+        categories = []
+        excluded = False
+        for _, end, (kind, name) in self._automaton.iter_matches(text):
+            if kind == 'brand':
+                brands.add(name)
+            elif kind == 'category':
+                if name not in categories:
+                    categories.append(name)
+            elif end <= len(title):
+                excluded = True
+
+        detected_category = categories[0] if categories else None
+        for brand, required_category in self._brands:
+            if brand not in brands:
+                continue
+            if required_category is None:
+                return BrandMatch(brand, detected_category, excluded)
+            # Бренд с ограничением по категории (например, только обувь)
+            if required_category in categories:
+                return BrandMatch(brand, required_category, excluded)
+        return BrandMatch(None, detected_category, excluded)
+
+
+def apply_brand_match(product: Dict, match: BrandMatch):
+    """Записать найденные бренд и категорию в товар (для маршрутизации дальше по конвейеру)"""
+    if match.brand:
+        product['brand'] = match.brand
+    if match.category:
+        product['category'] = match.category
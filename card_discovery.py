@@ -0,0 +1,167 @@
+"""
+Поиск карточек товаров за один обход дерева: все стратегии проверяются на каждом узле одновременно
+"""
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from html_backend import iter_tags, node_key
+
+
+def class_string(node) -> str:
+    """Значение class в нижнем регистре (BeautifulSoup отдает список, lxml/selectolax - строку)"""
+    value = node.get('class')
+    if not value:
+        return ''
+    if isinstance(value, (list, tuple)):
+        value = ' '.join(value)
+    return value.lower()
+
+
+class CardStrategy:
+    """Стратегия поиска карточек: проверка одного узла (тег, слова в class, data-атрибут, ссылка с картинкой)"""
+
+    def __init__(self, name: str, tags: Iterable[str], class_words: Iterable[str] = (), attr: str = None,
+                 href_filter: Callable[[str], bool] = None):
+        self.name = name
+        self.tags = frozenset(tags)
+        self.class_words = tuple(class_words)
+        self.attr = attr
+        # Если задан - узел должен быть ссылкой с картинкой и текстом длиннее 10 символов
+        self.href_filter = href_filter
+
+    def card_for(self, node, context: '_NodeContext'):
+        """Карточка для узла или None, если узел не подходит"""
+        if node.name not in self.tags:
+            return None
+        if self.class_words and not any(word in context.class_value for word in self.class_words):
+            return None
+        if self.attr and node.get(self.attr) is None:
+            return None
+        if self.href_filter and not context.is_product_link(self.href_filter):
+            return None
+        return node
+
+
+class ContainerLinkStrategy(CardStrategy):
+    """Запасная стратегия: ссылки на товары внутри контейнеров-списков (list/grid/...).
+    Карточкой считается родитель ссылки, если он один из parent_tags"""
+
+    def __init__(self, name: str, container_tags: Iterable[str], container_words: Iterable[str],
+                 href_filter: Callable[[str], bool], parent_tags: Iterable[str]):
+        super().__init__(name, ('a',), href_filter=href_filter)
+        self.container_tags = frozenset(container_tags)
+        self.container_words = tuple(container_words)
+        self.parent_tags = frozenset(parent_tags)
+
+    def _in_container(self, node) -> bool:
+        parent = node.parent
+        while parent is not None:
+            if parent.name in self.container_tags:
+                value = class_string(parent)
+                if value and any(word in value for word in self.container_words):
+                    return True
+            parent = parent.parent
+        return False
+
+    def card_for(self, node, context: '_NodeContext'):
+        if node.name != 'a' or not context.is_product_link(self.href_filter):
+            return None
+        if not self._in_container(node):
+            return None
+        parent = node.parent
+        return parent if parent is not None and parent.name in self.parent_tags else node
+
+
+class _NodeContext:
+    """Общие для всех стратегий вычисления по одному узлу (считаются один раз и только при необходимости)"""
+    __slots__ = ('node', '_class_value', '_has_content')
+
+    def __init__(self, node):
+        self.node = node
+        self._class_value = None
+        self._has_content = None
+
+    @property
+    def class_value(self) -> str:
+        if self._class_value is None:
+            self._class_value = class_string(self.node)
+        return self._class_value
+
+    def is_product_link(self, href_filter: Callable[[str], bool]) -> bool:
+        href = self.node.get('href')
+        if href is None or not href_filter(href):
+            return False
+        if self._has_content is None:
+            # Картинка и текст - самые дорогие проверки, поэтому после фильтра по href
+            text = self.node.get_text(strip=True)
+            self._has_content = bool(self.node.find('img')) and len(text) > 10
+        return self._has_content
+
+
+class DiscoveryStats:
+    """Сколько раз каждая стратегия находила карточки - по сайтам"""
+
+    def __init__(self):
+        self._hits = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, site: str, strategy: Optional[str]):
+        with self._lock:
+            self._hits[(site, strategy or 'none')] += 1
+
+    def drain(self) -> Dict[Tuple[str, str], int]:
+        """Забрать накопленные счетчики и обнулить их (процесс-обработчик передает их в основной процесс)"""
+        with self._lock:
+            hits = dict(self._hits)
+            self._hits.clear()
+        return hits
+
+    def merge(self, hits: Dict[Tuple[str, str], int]):
+        with self._lock:
+            for key, count in hits.items():
+                self._hits[key] += count
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """{сайт: {стратегия: число страниц}}"""
+        result = defaultdict(dict)
+        with self._lock:
+            for (site, strategy), count in self._hits.items():
+                result[site][strategy] = count
+        return dict(result)
+
+
+# Глобальная статистика стратегий поиска карточек
+stats = DiscoveryStats()
+
+
+def discover_cards(root, strategies: List[CardStrategy], site: str = None) -> Tuple[Optional[str], List]:
+    """Один обход дерева: карточки первой по приоритету стратегии, которая что-то нашла.
+    Возвращает (имя стратегии, карточки) или (None, [])"""
+    found = [[] for _ in strategies]
+    # Стратегии ниже уже сработавшей проверять не нужно - они не выиграют
+    active = len(strategies)
+    seen = [set() for _ in strategies]
+
+    if root is not None:
+        for node in iter_tags(root):
+            context = _NodeContext(node)
+            for index in range(active):
+                card = strategies[index].card_for(node, context)
+                if card is None:
+                    continue
+                # Несколько ссылок могут дать одного и того же родителя
+                key = node_key(card)
+                if key in seen[index]:
+                    continue
+                seen[index].add(key)
+                found[index].append(card)
+                active = index + 1
+
+    for strategy, cards in zip(strategies, found):
+        if cards:
+            if site:
+                stats.record(site, strategy.name)
+            return strategy.name, cards
+    if site:
+        stats.record(site, None)
+    return None, []
@@ -9,10 +9,17 @@ TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '8511531317:AAGBdl_GnJ-UQZV
 
 # Parser Configuration
 BUNJANG_URL = 'https://globalbunjang.com/'
+BUNJANG_USE_API = os.getenv('BUNJANG_USE_API', 'True').lower() == 'true'  # Искать через JSON API вместо HTML страницы
+BUNJANG_API_URL = 'https://api.bunjang.co.kr/api/1/find_v2.json'  # JSON API поиска (тот же, что использует страница поиска)
+BUNJANG_PRODUCT_URL = 'https://globalbunjang.com/product/{pid}'  # Ссылка на товар по его pid
 PARSING_INTERVAL = 30  # Интервал парсинга в секундах (1 час)
 MAX_PRODUCTS_PER_MESSAGE = 100232131  # Максимальное количество товаров в одном сообщении
 USE_SELENIUM = os.getenv('USE_SELENIUM', 'False').lower() == 'true'  # Использовать Selenium для динамического контента
 NEW_PRODUCTS_MAX_AGE_HOURS = 1  # Максимальный возраст товара в часах, чтобы считаться "новым" (только товары за последний час)
+# История цен: уведомление о снижении цены уже отправленного товара
+PRICE_HISTORY_ENABLED = os.getenv('PRICE_HISTORY_ENABLED', 'True').lower() == 'true'
+PRICE_DROP_ALERT_PERCENT = float(os.getenv('PRICE_DROP_ALERT_PERCENT', '10'))  # Минимальное снижение цены, %
+PRICE_ALERTS_PER_CYCLE = int(os.getenv('PRICE_ALERTS_PER_CYCLE', '20'))  # Не больше уведомлений о ценах за цикл
 
 # Бренды для парсинга (только товары этих брендов будут парситься с ОБОИХ сайтов)
 BRANDS_TO_PARSE = [
@@ -23,6 +30,21 @@ BRANDS_TO_PARSE = [
     {'name': 'cp company', 'category': None},
 ]
 
+# Варианты написания брендов (латиница без пробелов, корейский) - для поиска на fruitsfamily.com
+BRAND_ALIASES = {
+    'cp company': ['c.p. company', 'cpcompany', 'c p company', 'cp комп니', 'cp컴퍼니', 'c.p.company'],
+    'maison margiela': ['margiela', 'maisonmargiela', '메종 마르지엘라', '마르지엘라', '메종마르지엘라'],
+    'stone island': ['stoneisland', '스톤아일랜드'],
+    'project gr': ['projectgr', '프로젝트 gr', '프로젝트gr'],
+    'grailz': ['그레일즈'],
+}
+
+# Ключевые слова категорий (для брендов с ограничением category в BRANDS_TO_PARSE)
+CATEGORY_KEYWORDS = {
+    'shoes': ['shoe', 'sneaker', 'boot', 'sandal', 'slipper', 'loafer', 'oxford', 'heel', 'footwear',
+              'обувь', 'кроссовки', 'ботинки', '신발', '운동화', '부츠'],
+}
+
 # Ссылки для парсинга брендов на fruitsfamily.com
 FRUITS_BRAND_URLS = {
     'maison margiela': 'https://fruitsfamily.com/brand/Maison%20Margiela?sort=POPULAR',
@@ -32,6 +54,102 @@ FRUITS_BRAND_URLS = {
     'cp company': 'https://fruitsfamily.com/brand/C.P.%20Company?sort=POPULAR',
 }
 
+# Асинхронная загрузка страниц (общий пул соединений для всех парсеров)
+FETCH_MAX_CONNECTIONS = 20  # Всего одновременных соединений
+FETCH_PER_HOST_LIMIT = 5  # Одновременных запросов к одному сайту по умолчанию
+FETCH_HOST_LIMITS = {  # Лимиты для конкретных сайтов
+    'globalbunjang.com': 5,
+    'fruitsfamily.com': 5,
+}
+FETCH_TIMEOUT = 15  # Таймаут запроса в секундах
+
+# Пул Selenium драйверов (headless Chrome)
+SELENIUM_POOL_SIZE = int(os.getenv('SELENIUM_POOL_SIZE', '5'))  # Максимум одновременно открытых браузеров
+SELENIUM_MAX_MEMORY_MB = int(os.getenv('SELENIUM_MAX_MEMORY_MB', '2048'))  # Лимит памяти всех браузеров вместе
+SELENIUM_DRIVER_MEMORY_ESTIMATE_MB = 350  # Оценка памяти одного браузера (если psutil не установлен)
+SELENIUM_ACQUIRE_TIMEOUT = 120  # Сколько секунд ждать свободный драйвер
+# Потоков для одновременного парсинга брендов: один бренд - один поток, но не больше, чем браузеров
+# в пуле - лишние потоки с Selenium только ждали бы свободный драйвер
+SCRAPE_MAX_WORKERS = max(1, min(len(BRANDS_TO_PARSE), SELENIUM_POOL_SIZE))
+
+# Ожидание готовности страниц в Selenium (вместо фиксированных пауз)
+# card_selector/min_cards - страница готова, когда карточек товаров не меньше min_cards;
+# иначе ждем, пока DOM не перестанет меняться quiet_period секунд (но не дольше timeout)
+SELENIUM_READY = {
+    'bunjang': {
+        'card_selector': 'a[href*="/product/"]',
+        'min_cards': 10,
+        'quiet_period': 1.0,
+        'timeout': 10,
+        'scroll_timeout': 4,
+    },
+    'fruitsfamily': {
+        'card_selector': 'a[href*="/product/"]',
+        'min_cards': 10,
+        'quiet_period': 1.0,
+        'timeout': 12,
+        'scroll_timeout': 4,
+    },
+}
+SELENIUM_READY_POLL = 0.1  # Частота проверки условий в секундах
+
+# Перехват JSON-ответов страницы (XHR) через performance-лог Chrome вместо разбора page_source
+SELENIUM_CAPTURE_XHR = os.getenv('SELENIUM_CAPTURE_XHR', 'True').lower() == 'true'
+SELENIUM_XHR_PATTERNS = {  # Подстроки URL ответов со списком товаров (пустой список - любой JSON)
+    'bunjang': ['find_v2', '/api/'],
+    'fruitsfamily': ['graphql', '/api/'],
+}
+
+# FruitsFamily: товары из JSON, встроенного в HTML (__NEXT_DATA__ и т.п.), Selenium - запасной вариант
+FRUITS_USE_EMBEDDED_STATE = os.getenv('FRUITS_USE_EMBEDDED_STATE', 'True').lower() == 'true'
+FRUITS_PRODUCT_URL = 'https://fruitsfamily.com/product/{id}'  # Ссылка на товар по его ID
+
+# Облегченная загрузка страниц в Selenium: не скачиваем картинки, видео, шрифты, стили и трекеры
+# (ссылки на изображения все равно есть в DOM). Шаблоны - в формате CDP Network.setBlockedURLs
+SELENIUM_LEAN_RENDER = os.getenv('SELENIUM_LEAN_RENDER', 'True').lower() == 'true'
+_BLOCKED_MEDIA = ['*.jpg*', '*.jpeg*', '*.png*', '*.gif*', '*.webp*', '*.avif*', '*.svg*', '*.ico*',
+                  '*.mp4*', '*.webm*', '*.mp3*', '*.woff*', '*.woff2*', '*.ttf*', '*.otf*']
+_BLOCKED_TRACKERS = ['*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*facebook.net*',
+                     '*connect.facebook.com*', '*hotjar.com*', '*amplitude.com*', '*branch.io*', '*sentry.io*',
+                     '*clarity.ms*', '*kakao.com/sdk*']
+SELENIUM_BLOCKED_URLS = {
+    'bunjang': _BLOCKED_MEDIA + _BLOCKED_TRACKERS + ['*.css*'],
+    'fruitsfamily': _BLOCKED_MEDIA + _BLOCKED_TRACKERS + ['*.css*'],
+}
+
+# Разбор HTML страниц в пуле процессов (по процессу на ядро); 0 - разбирать в потоке парсинга
+PARSE_PROCESSES = int(os.getenv('PARSE_PROCESSES', str(os.cpu_count() or 1)))
+
+# Backend для разбора HTML: 'lxml', 'selectolax' (lexbor) или 'bs4' (BeautifulSoup + html.parser)
+# Если выбранный не установлен, используется ближайший доступный
+HTML_PARSER_BACKEND = os.getenv('HTML_PARSER_BACKEND', 'lxml')
+
+# Кэш выученных стратегий поиска карточек, названия и цены (по сайту и шаблону URL)
+SELECTOR_CACHE_ENABLED = os.getenv('SELECTOR_CACHE_ENABLED', 'true').lower() == 'true'
+SELECTOR_CACHE_FILE = os.getenv('SELECTOR_CACHE_FILE', 'selector_cache.json')
+# Если выученная стратегия нашла меньше этой доли от прошлого числа карточек - подбираем заново
+SELECTOR_CACHE_MIN_RATIO = float(os.getenv('SELECTOR_CACHE_MIN_RATIO', '0.5'))
+# Каждая N-я страница шаблона разбирается полным перебором стратегий названия и цены в порядке приоритета
+# (выученный запасной вариант не должен навсегда вытеснить лучшую стратегию); 0 - не перепроверять
+SELECTOR_CACHE_RECHECK_PAGES = int(os.getenv('SELECTOR_CACHE_RECHECK_PAGES', '20'))
+
 # Database (для хранения уже отправленных товаров)
 DB_FILE = 'products.db'
+DB_READERS = int(os.getenv('DB_READERS', '2'))  # Соединений для чтения (запись всегда через одно соединение)
+DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL')  # WAL: чтение не блокируется записью
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')  # NORMAL в WAL: fsync только при checkpoint
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '8192'))  # Кэш страниц SQLite на соединение
+DB_CACHED_STATEMENTS = int(os.getenv('DB_CACHED_STATEMENTS', '128'))  # Кэш подготовленных запросов на соединение
+DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', '10'))  # Секунд ожидания блокировки файла другим процессом
+DB_GROUP_COMMIT_MAX = int(os.getenv('DB_GROUP_COMMIT_MAX', '64'))  # Запросов записи бота в одной транзакции
+# Хранение: товары старше DB_RETENTION_DAYS уходят из products (у отправленных в архиве остается только ключ)
+DB_RETENTION_DAYS = int(os.getenv('DB_RETENTION_DAYS', '30'))
+DB_RETENTION_INTERVAL = int(os.getenv('DB_RETENTION_INTERVAL', '3600'))  # Секунд между запусками задачи хранения
+DB_RETENTION_BATCH = int(os.getenv('DB_RETENTION_BATCH', '500'))  # Строк за одну транзакцию
+DB_VACUUM_PAGES = int(os.getenv('DB_VACUUM_PAGES', '256'))  # Страниц за один шаг incremental_vacuum
+DB_VACUUM_PAUSE = float(os.getenv('DB_VACUUM_PAUSE', '0.2'))  # Пауза между шагами, секунд
 
+# Индекс отправленных товаров в памяти + фильтр Блума в файле DB_FILE.seen (SQLite - только при возможном совпадении)
+SEEN_INDEX_ENABLED = os.getenv('SEEN_INDEX_ENABLED', 'true').lower() == 'true'
+SEEN_INDEX_CAPACITY = int(os.getenv('SEEN_INDEX_CAPACITY', '1000000'))  # Расчетное число ключей (~1.2 МБ при 1%)
+SEEN_INDEX_ERROR_RATE = float(os.getenv('SEEN_INDEX_ERROR_RATE', '0.01'))  # Доля ложных срабатываний фильтра
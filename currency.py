@@ -2,9 +2,9 @@
 Модуль для конвертации валют в рубли
 """
 import requests
-import re
 from typing import Optional, Dict
 import time
+from price import parse_price
 
 class CurrencyConverter:
     """Конвертер валют в рубли"""
@@ -74,58 +74,15 @@ class CurrencyConverter:
         # Используем резервные курсы
         return self.fallback_rates
     
-    def extract_price(self, price_text: str) -> Optional[Dict]:
-        """Извлечь цену и валюту из текста"""
-        if not price_text:
+    def extract_price(self, price_text: str, default_currency: str = 'KRW') -> Optional[Dict]:
+        """Извлечь цену и валюту из текста (число без валюты - в default_currency)"""
+        price = parse_price(price_text, default_currency=default_currency)
+        if not price:
             return None
-        
-        # Убираем пробелы и приводим к нижнему регистру для анализа
-        text = price_text.replace(',', '').replace(' ', '')
-        
-        # Паттерны для поиска цен
-        patterns = [
-            # Корейские воны: 100000원, 100,000원, 100000 KRW
-            (r'(\d+(?:\.\d+)?)\s*(?:원|KRW|won)', 'KRW'),
-            # Доллары: $100, $100.50, 100 USD
-            (r'[$\$]?\s*(\d+(?:\.\d+)?)\s*(?:USD|usd|\$)', 'USD'),
-            # Евро: €100, 100 EUR
-            (r'[€€]?\s*(\d+(?:\.\d+)?)\s*(?:EUR|eur|€)', 'EUR'),
-            # Иены: ¥100, 100 JPY
-            (r'[¥¥]?\s*(\d+(?:\.\d+)?)\s*(?:JPY|jpy|¥)', 'JPY'),
-            # Просто числа (предполагаем KRW для корейских сайтов)
-            (r'(\d+(?:\.\d+)?)', 'KRW'),
-        ]
-        
-        for pattern, currency in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                try:
-                    amount = float(match.group(1))
-                    return {'amount': amount, 'currency': currency}
-                except ValueError:
-                    continue
-        
-        return None
+        return {'amount': price.amount, 'currency': price.currency}
     
-    def convert_to_rubles(self, price_text: str, default_currency: str = 'KRW') -> Optional[str]:
-        """Конвертировать цену в рубли"""
-        price_info = self.extract_price(price_text)
-        
-        if not price_info:
-            # Пробуем извлечь число и использовать валюту по умолчанию
-            numbers = re.findall(r'\d+(?:\.\d+)?', price_text.replace(',', ''))
-            if numbers:
-                try:
-                    amount = float(numbers[0])
-                    price_info = {'amount': amount, 'currency': default_currency}
-                except ValueError:
-                    return None
-            else:
-                return None
-        
-        amount = price_info['amount']
-        currency = price_info['currency']
-        
+    def convert_amount(self, amount: float, currency: str) -> Optional[str]:
+        """Конвертировать уже распознанную сумму в рубли"""
         # Получаем курс
         rates = self.get_exchange_rates()
         rate = rates.get(currency)
@@ -143,6 +100,13 @@ class CurrencyConverter:
         else:
             return f"{rubles:,.2f} RUB"
     
+    def convert_to_rubles(self, price_text: str, default_currency: str = 'KRW') -> Optional[str]:
+        """Конвертировать цену в рубли"""
+        price_info = self.extract_price(price_text, default_currency)
+        if not price_info:
+            return None
+        return self.convert_amount(price_info['amount'], price_info['currency'])
+    
     def format_price_with_conversion(self, original_price: str, default_currency: str = 'KRW') -> str:
         """Форматировать цену с конвертацией в рубли"""
         rubles = self.convert_to_rubles(original_price, default_currency)
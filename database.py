@@ -1,133 +1,378 @@
+import asyncio
 import sqlite3
 import json
-from typing import List, Dict
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, Iterator, List, Dict, Union
+import config
+from product import Product, Site, db_key_for_link
+from seen_index import SeenIndex
+
+# Изменение цены товара с прошлого цикла парсинга: суммы целые, в минимальных единицах валюты currency
+# (вона - целые воны, USD/EUR - центы, см. Product.price_minor)
+PriceChange = namedtuple('PriceChange', ['product', 'old_amount', 'new_amount', 'currency'])
+
+
+def price_drop_percent(change: PriceChange) -> float:
+    """Снижение цены в процентах (отрицательное - цена выросла)"""
+    if not change.old_amount:
+        return 0.0
+    return (change.old_amount - change.new_amount) * 100.0 / change.old_amount
 
 class ProductDatabase:
-    def __init__(self, db_file: str = 'products.db'):
+    """Хранилище товаров и пользователей. Соединения долгоживущие: одно для записи (под блокировкой)
+    и небольшой пул для чтения; журнал WAL, поэтому чтение не ждет записи"""
+    
+    def __init__(self, db_file: str = 'products.db', readers: int = None):
         self.db_file = db_file
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._write_owner = None
+        # Действия после фиксации внешней транзакции (см. _after_commit)
+        self._on_commit = []
+        self._writer = self._connect()
+        # WAL переключается один раз для файла, остальные соединения его подхватывают
+        self._writer.execute(f"PRAGMA journal_mode={config.DB_JOURNAL_MODE}")
+        self._readers = queue.Queue()
+        for _ in range(max(1, config.DB_READERS if readers is None else readers)):
+            self._readers.put(self._connect())
         self.init_database()
-    
-    def init_database(self):
-        """Инициализация базы данных"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        # Создаем таблицу products
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_id TEXT UNIQUE,
-                title TEXT,
-                link TEXT,
-                price TEXT,
-                image TEXT,
-                description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                sent_at TIMESTAMP
-            )
-        ''')
-        conn.commit()
         
-        # Проверяем и добавляем колонку first_seen_at если её нет
-        try:
-            cursor.execute("PRAGMA table_info(products)")
-            columns = [column[1] for column in cursor.fetchall()]
-            
-            if 'first_seen_at' not in columns:
+        # Индекс отправленных товаров в памяти (+ фильтр Блума в файле рядом с базой)
+        self.seen = None
+        if config.SEEN_INDEX_ENABLED and db_file != ':memory:':
+            self.seen = SeenIndex(db_file + '.seen', config.SEEN_INDEX_CAPACITY, config.SEEN_INDEX_ERROR_RATE)
+            with self._read() as cursor:
+                loaded = self.seen.sync(cursor)
+            if loaded:
+                print(f"Индекс отправленных товаров: загружено {loaded} новых ключей")
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Соединение с настроенными PRAGMA. isolation_level=None - транзакции открываются явно в _write"""
+        conn = sqlite3.connect(self.db_file, check_same_thread=False, isolation_level=None,
+                               timeout=config.DB_BUSY_TIMEOUT, cached_statements=config.DB_CACHED_STATEMENTS)
+        conn.execute(f"PRAGMA synchronous={config.DB_SYNCHRONOUS}")
+        # Отрицательное значение - размер кэша страниц в КиБ
+        conn.execute(f"PRAGMA cache_size=-{config.DB_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+    
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Cursor]:
+        """Курсор соединения записи в транзакции. Вложенные вызовы из того же потока
+        выполняются в транзакции внешнего и фиксируются вместе с ней"""
+        with self._write_lock:
+            cursor = self._writer.cursor()
+            if self._write_depth:
+                self._write_depth += 1
                 try:
-                    # SQLite не поддерживает DEFAULT CURRENT_TIMESTAMP в ALTER TABLE
-                    cursor.execute('ALTER TABLE products ADD COLUMN first_seen_at TIMESTAMP')
-                    conn.commit()
-                except sqlite3.OperationalError as e:
-                    print(f"Предупреждение: не удалось добавить колонку first_seen_at: {e}")
-        except Exception as e:
-            print(f"Предупреждение при проверке колонок: {e}")
-        
-        # Создаем таблицу users
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                subscribed INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        conn.commit()
-        conn.close()
-    
-    def product_exists(self, product_id: str) -> bool:
+                    yield cursor
+                finally:
+                    self._write_depth -= 1
+                return
+            
+            cursor.execute('BEGIN IMMEDIATE')
+            self._write_depth = 1
+            self._write_owner = threading.get_ident()
+            try:
+                yield cursor
+            except BaseException:
+                self._writer.rollback()
+                raise
+            else:
+                self._writer.commit()
+            finally:
+                self._write_depth = 0
+                self._write_owner = None
+                on_commit, self._on_commit = self._on_commit, []
+            # Только после успешной фиксации (при откате исключение уже вышло выше)
+            for callback in on_commit:
+                callback()
+    
+    def _after_commit(self, callback: Callable[[], None]):
+        """Выполнить callback, когда изменения точно в базе: сразу или, внутри чужой транзакции
+        (групповая фиксация AsyncProductDatabase), после ее COMMIT"""
+        with self._write_lock:
+            if self._write_depth and self._write_owner == threading.get_ident():
+                self._on_commit.append(callback)
+                return
+        callback()
+    
+    @contextmanager
+    def _read(self) -> Iterator[sqlite3.Cursor]:
+        """Курсор для чтения. Внутри _write того же потока читаем через соединение записи,
+        чтобы видеть еще не зафиксированные изменения"""
+        if self._write_owner == threading.get_ident():
+            yield self._writer.cursor()
+            return
+        conn = self._readers.get()
+        try:
+            yield conn.cursor()
+        finally:
+            self._readers.put(conn)
+    
+    def close(self):
+        """Закрыть все соединения"""
+        if self.seen is not None:
+            self.seen.close()
+        with self._write_lock:
+            self._writer.close()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+    
+    @staticmethod
+    def _now() -> int:
+        """Текущее время - секунды Unix (все временные метки в базе целые)"""
+        return int(time.time())
+    
+    def init_database(self):
+        """Инициализация базы данных: миграции схемы по номеру версии (PRAGMA user_version)"""
+        self._init_auto_vacuum()
+        with self._read() as cursor:
+            cursor.execute('PRAGMA user_version')
+            version = cursor.fetchone()[0]
+        for target, migration in _MIGRATIONS:
+            if target <= version:
+                continue
+            # Каждая миграция и новый номер версии - в одной транзакции
+            with self._write() as cursor:
+                migration(cursor)
+                cursor.execute(f'PRAGMA user_version = {target}')
+            print(f"База данных: применена миграция {target} ({migration.__doc__})")
+    
+    def _init_auto_vacuum(self):
+        """Новой базе - auto_vacuum=INCREMENTAL: освобожденные страницы возвращаются порциями (incremental_vacuum).
+        Существующую базу перестраивает полный VACUUM - при запуске он не выполняется, только явно:
+        python database.py --incremental-vacuum"""
+        with self._write_lock:
+            cursor = self._writer.cursor()
+            cursor.execute('PRAGMA auto_vacuum')
+            if cursor.fetchone()[0] == 2:
+                return
+            cursor.execute("SELECT count(*) FROM sqlite_master WHERE type = 'table'")
+            has_tables = cursor.fetchone()[0] > 0
+        if has_tables:
+            print("База данных: incremental auto_vacuum выключен, место после очистки не возвращается. "
+                  "Включить (однократный VACUUM): python database.py --incremental-vacuum")
+        else:
+            # Файл пуст - VACUUM мгновенный
+            self.enable_incremental_vacuum()
+    
+    def enable_incremental_vacuum(self):
+        """Однократно перестроить файл базы с auto_vacuum=INCREMENTAL (полный VACUUM: на большой базе долго)"""
+        with self._write_lock:
+            cursor = self._writer.cursor()
+            cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            cursor.execute('VACUUM')
+    
+    def archive_old_products(self, max_age_days: int = None, batch_size: int = None) -> int:
+        """Одна порция задачи хранения: товары старше max_age_days уходят из products.
+        Для отправленных в products_archive остается только ключ (он нужен для дедупликации),
+        неотправленные удаляются. Возвращает число обработанных строк (0 - старых больше нет)"""
+        max_age_days = config.DB_RETENTION_DAYS if max_age_days is None else max_age_days
+        batch_size = batch_size or config.DB_RETENTION_BATCH
+        now = self._now()
+        cutoff = now - max_age_days * 86400
+        with self._write() as cursor:
+            # То же, что COALESCE(sent_at, first_seen_at, created_at) < cutoff, но каждая ветка - диапазон индекса
+            cursor.execute('''
+                SELECT id, site, listing_id, sent_at FROM products
+                WHERE sent_at < :cutoff
+                UNION ALL
+                SELECT id, site, listing_id, sent_at FROM products
+                WHERE sent_at IS NULL AND first_seen_at < :cutoff
+                UNION ALL
+                SELECT id, site, listing_id, sent_at FROM products INDEXED BY idx_products_unsent_created_at
+                WHERE sent_at IS NULL AND first_seen_at IS NULL AND created_at < :cutoff
+                LIMIT :limit
+            ''', {'cutoff': cutoff, 'limit': batch_size})
+            rows = cursor.fetchall()
+            if not rows:
+                return 0
+            cursor.executemany('''
+                INSERT INTO products_archive (site, listing_id, sent_at, archived_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(site, listing_id) DO UPDATE SET sent_at = excluded.sent_at, archived_at = excluded.archived_at
+            ''', [(site, listing_id, sent_at, now) for _, site, listing_id, sent_at in rows
+                  if sent_at is not None and listing_id is not None])
+            cursor.executemany('DELETE FROM products WHERE id = ?', [(row[0],) for row in rows])
+            cursor.executemany('DELETE FROM price_history WHERE site = ? AND listing_id = ?',
+                               [(site, listing_id) for _, site, listing_id, _ in rows if listing_id is not None])
+        return len(rows)
+    
+    def incremental_vacuum(self, pages: int = None) -> int:
+        """Вернуть файловой системе до pages свободных страниц; возвращает, сколько свободных осталось"""
+        pages = pages or config.DB_VACUUM_PAGES
+        with self._write_lock:
+            cursor = self._writer.cursor()
+            cursor.execute('PRAGMA auto_vacuum')
+            if cursor.fetchone()[0] != 2:
+                # Без incremental auto_vacuum страницы не освобождаются - повторять бессмысленно
+                return 0
+            # incremental_vacuum освобождает одну страницу за шаг выполнения, а execute() делает только
+            # первый шаг такой PRAGMA; executescript выполняет ее до конца
+            cursor.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+            cursor.execute('PRAGMA freelist_count')
+            return cursor.fetchone()[0]
+    
+    def product_exists(self, product: Union[Product, Dict]) -> bool:
         """Проверка существования товара"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute('SELECT 1 FROM products WHERE product_id = ?', (product_id,))
-        exists = cursor.fetchone() is not None
-        conn.close()
-        return exists
-    
-    def add_product(self, product: Dict, mark_as_sent: bool = False) -> bool:
+        key = Product.coerce(product).db_key
+        if key is None:
+            return False
+        with self._read() as cursor:
+            cursor.execute('SELECT 1 FROM products WHERE site = ? AND listing_id = ?', key)
+            return cursor.fetchone() is not None
+    
+    def add_product(self, product: Union[Product, Dict], mark_as_sent: bool = False) -> bool:
         """Добавление товара в базу данных"""
-        # Генерируем ID товара на основе ссылки или названия
-        product_id = product.get('link', product.get('title', ''))
-        if not product_id:
+        product = Product.coerce(product)
+        # Ключ товара - (сайт, ID объявления) из ссылки
+        key = product.db_key
+        if key is None:
             return False
         
-        # Простой хэш для ID
-        import hashlib
-        product_id_hash = hashlib.md5(product_id.encode()).hexdigest()
-        
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
         try:
-            if self.product_exists(product_id_hash):
-                # Товар уже существует, обновляем first_seen_at только если он старый
-                cursor.execute('''
-                    UPDATE products 
-                    SET first_seen_at = CURRENT_TIMESTAMP 
-                    WHERE product_id = ? AND first_seen_at < datetime('now', '-1 hour')
-                ''', (product_id_hash,))
-            else:
-                # Новый товар
-                sent_at = 'CURRENT_TIMESTAMP' if mark_as_sent else 'NULL'
-                cursor.execute(f'''
-                    INSERT INTO products (product_id, title, link, price, image, description, sent_at)
-                    VALUES (?, ?, ?, ?, ?, ?, {sent_at})
-                ''', (
-                    product_id_hash,
-                    product.get('title', ''),
-                    product.get('link', ''),
-                    product.get('price', ''),
-                    product.get('image', ''),
-                    product.get('description', '')
-                ))
-            conn.commit()
+            with self._write() as cursor:
+                now = self._now()
+                # Проверка существования в той же транзакции (через соединение записи)
+                if self.product_exists(product):
+                    # Товар уже существует, обновляем first_seen_at только если он старый
+                    cursor.execute('''
+                        UPDATE products 
+                        SET first_seen_at = ? 
+                        WHERE site = ? AND listing_id = ? AND first_seen_at < ?
+                    ''', (now, *key, now - 3600))
+                else:
+                    # Новый товар
+                    cursor.execute('''
+                        INSERT INTO products (site, listing_id, title, link, price, image, description,
+                                              first_seen_at, sent_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (
+                        *key,
+                        product.title,
+                        product.link,
+                        product.price,
+                        product.image,
+                        product.description,
+                        now,
+                        now if mark_as_sent else None
+                    ))
             return True
         except sqlite3.IntegrityError:
             return False
-        finally:
-            conn.close()
     
-    def mark_as_sent(self, product_id: str):
+    def mark_as_sent(self, product: Union[Product, Dict]):
         """Отметить товар как отправленный"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE products SET sent_at = CURRENT_TIMESTAMP WHERE product_id = ?
-        ''', (product_id,))
-        conn.commit()
-        conn.close()
-    
-    def get_new_products(self, products: List[Dict], max_age_hours: int = 1) -> List[Dict]:
-        """Получить только новые товары за последний час (которых нет в базе или они были найдены только что)"""
-        new_products = []
-        from datetime import datetime, timedelta
+        key = Product.coerce(product).db_key
+        if key is None:
+            return
+        with self._write() as cursor:
+            sent_at = self._now()
+            cursor.execute('''
+                UPDATE products SET sent_at = ? WHERE site = ? AND listing_id = ?
+            ''', (sent_at, *key))
+            updated = cursor.rowcount > 0
+        if updated and self.seen is not None:
+            self._after_commit(partial(self.seen.add_many, [key], sent_at))
+    
+    def record_sent(self, products: List[Union[Product, Dict]]) -> int:
+        """Сохранить доставленные товары и отметить их отправленными - одна транзакция на всю пачку"""
+        rows = []
+        for product in products:
+            product = Product.coerce(product)
+            key = product.db_key
+            if key is not None:
+                rows.append((*key, product.title, product.link, product.price, product.image, product.description))
+        if not rows:
+            return 0
+        with self._write() as cursor:
+            sent_at = self._now()
+            cursor.executemany('''
+                INSERT INTO products (site, listing_id, title, link, price, image, description, sent_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(site, listing_id) DO UPDATE SET sent_at = excluded.sent_at
+            ''', [row + (sent_at,) for row in rows])
+        if self.seen is not None:
+            self._after_commit(partial(self.seen.add_many, [row[:2] for row in rows], sent_at))
+        return len(rows)
+    
+    def record_prices(self, products: List[Union[Product, Dict]]) -> List[PriceChange]:
+        """Сравнить цены пачки с последними известными и дописать в price_history новые и изменившиеся.
+        Сравнение - одним запросом через временную таблицу. Возвращает изменения цен товаров,
+        которые уже были в истории (первое появление товара изменением не считается)"""
+        scraped = {}
+        for product in products:
+            product = Product.coerce(product)
+            if product.db_key is not None and product.price_minor is not None:
+                scraped[product.db_key] = product
+        if not scraped:
+            return []
         
-        # Время, до которого считаем товары "новыми" (за последний час)
-        cutoff_time = datetime.now() - timedelta(hours=max_age_hours)
+        with self._write() as cursor:
+            now = self._now()
+            cursor.execute('''
+                CREATE TEMP TABLE IF NOT EXISTS scraped_prices (
+                    site INTEGER, listing_id INTEGER, price INTEGER, currency TEXT
+                )
+            ''')
+            cursor.execute('DELETE FROM scraped_prices')
+            cursor.executemany('INSERT INTO scraped_prices (site, listing_id, price, currency) VALUES (?, ?, ?, ?)',
+                               [(*key, product.price_minor, product.currency) for key, product in scraped.items()])
+            # Последняя запись истории каждого товара (поиск по первичному ключу); выбираются только
+            # товары без истории и товары с другой ценой
+            cursor.execute('''
+                SELECT s.site, s.listing_id, h.price, h.currency
+                FROM scraped_prices s
+                LEFT JOIN price_history h ON h.site = s.site AND h.listing_id = s.listing_id
+                    AND h.seen_at = (SELECT MAX(seen_at) FROM price_history
+                                     WHERE site = s.site AND listing_id = s.listing_id)
+                WHERE h.price IS NULL OR h.price != s.price OR h.currency IS NOT s.currency
+            ''')
+            rows = cursor.fetchall()
+            cursor.executemany('''
+                INSERT OR REPLACE INTO price_history (site, listing_id, price, currency, seen_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(site, listing_id, scraped[(site, listing_id)].price_minor, scraped[(site, listing_id)].currency, now)
+                  for site, listing_id, _, _ in rows])
         
-        stats = {
+        changes = []
+        for site, listing_id, old_amount, old_currency in rows:
+            product = scraped[(site, listing_id)]
+            # Суммы в разных валютах не сравниваются - только запоминаем новую цену
+            if old_amount is not None and old_currency == product.currency:
+                changes.append(PriceChange(product, old_amount, product.price_minor, product.currency))
+        return changes
+    
+    def is_sent(self, product: Union[Product, Dict]) -> bool:
+        """Товар уже отправлялся пользователям"""
+        key = Product.coerce(product).db_key
+        if key is None:
+            return False
+        if self.seen is not None:
+            known = self.seen.check(key)
+            if known is not None:
+                return known
+        with self._read() as cursor:
+            cursor.execute('''
+                SELECT 1 FROM products WHERE site = ? AND listing_id = ? AND sent_at IS NOT NULL
+                UNION ALL
+                SELECT 1 FROM products_archive WHERE site = ? AND listing_id = ?
+            ''', key + key)
+            sent = cursor.fetchone() is not None
+        if sent and self.seen is not None:
+            self.seen.confirm(key)
+        return sent
+    
+    @staticmethod
+    def new_filter_stats() -> Dict[str, int]:
+        """Счетчики фильтрации для get_new_products (накапливаются между вызовами)"""
+        return {
             'no_id': 0,
             'new': 0,
             'already_sent': 0,
@@ -135,148 +380,495 @@ class ProductDatabase:
             'fruits_new': 0,
             'fruits_filtered': 0
         }
+    
+    @staticmethod
+    def print_filter_stats(stats: Dict[str, int]):
+        print(f"Статистика фильтрации товаров:")
+        print(f"  - Новых товаров: {stats['new']} (FruitsFamily: {stats['fruits_new']})")
+        print(f"  - Уже отправлено: {stats['already_sent']} (FruitsFamily: {stats['fruits_filtered']})")
+        print(f"  - Слишком старых: {stats['too_old']}")
+        print(f"  - Без ID и ссылки: {stats['no_id']}")
+    
+    def _sent_state(self, cursor: sqlite3.Cursor, keys: List) -> Dict:
+        """{ключ: sent_at} для ключей, которые уже есть в базе - один JOIN через временную таблицу"""
+        # Временная таблица живет в соединении (temp_store=MEMORY), файл базы не трогается
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS candidate_keys (site INTEGER, listing_id INTEGER)')
+        # Внутри _write (соединение записи) транзакция уже открыта
+        own_transaction = not cursor.connection.in_transaction
+        if own_transaction:
+            cursor.execute('BEGIN')
+        try:
+            cursor.execute('DELETE FROM candidate_keys')
+            cursor.executemany('INSERT INTO candidate_keys (site, listing_id) VALUES (?, ?)', keys)
+            # Отправленные товары, ушедшие в архив по сроку хранения, тоже считаются отправленными
+            cursor.execute('''
+                SELECT c.site, c.listing_id, p.sent_at
+                FROM candidate_keys c
+                JOIN products p ON p.site = c.site AND p.listing_id = c.listing_id
+                UNION ALL
+                SELECT c.site, c.listing_id, a.sent_at
+                FROM candidate_keys c
+                JOIN products_archive a ON a.site = c.site AND a.listing_id = c.listing_id
+            ''')
+            state = {}
+            for site, listing_id, sent_at in cursor.fetchall():
+                state[(site, listing_id)] = state.get((site, listing_id)) or sent_at
+            return state
+        finally:
+            if own_transaction:
+                cursor.execute('COMMIT')
+    
+    def get_new_products(self, products: List[Union[Product, Dict]], max_age_hours: int = 1,
+                         stats: Dict[str, int] = None) -> List[Product]:
+        """Получить только новые товары: которых нет в базе или которые еще не отправлены
+        (товары на страницах брендов могут быть старыми, но мы их еще не отправляли).
+        Состояние всех товаров пачки читается одним запросом. max_age_hours оставлен для совместимости:
+        возраст товара на решение не влиял и раньше.
+        stats - общие счетчики нескольких вызовов (тогда статистика не печатается, см. print_filter_stats)"""
+        print_stats = stats is None
+        if stats is None:
+            stats = self.new_filter_stats()
         
+        candidates = []
         for product in products:
-            product_id = product.get('link', product.get('title', ''))
-            if not product_id:
+            product = Product.coerce(product)
+            if product.db_key is None:
                 stats['no_id'] += 1
                 continue
-            
-            is_fruits = 'fruitsfamily.com' in product_id
-                
-            import hashlib
-            product_id_hash = hashlib.md5(product_id.encode()).hexdigest()
-            
-            # Проверяем, существует ли товар в базе
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            try:
-                # Пробуем запрос с first_seen_at
-                cursor.execute('''
-                    SELECT sent_at, first_seen_at, created_at FROM products WHERE product_id = ?
-                ''', (product_id_hash,))
-            except sqlite3.OperationalError:
-                # Если колонки нет, используем упрощенный запрос
-                try:
-                    cursor.execute('''
-                        SELECT sent_at, created_at FROM products WHERE product_id = ?
-                    ''', (product_id_hash,))
-                except sqlite3.OperationalError:
-                    cursor.execute('''
-                        SELECT sent_at FROM products WHERE product_id = ?
-                    ''', (product_id_hash,))
-            result = cursor.fetchone()
-            conn.close()
-            
-            if not result:
-                # Товар полностью новый - добавляем
+            candidates.append(product)
+        
+        # Индекс отвечает сразу за большинство товаров; в базу - только возможные совпадения фильтра Блума
+        sent_state = {}
+        uncertain = set()
+        for product in candidates:
+            key = product.db_key
+            known = self.seen.check(key) if self.seen is not None else None
+            if known is None:
+                uncertain.add(key)
+            elif known:
+                sent_state[key] = True
+        if uncertain:
+            with self._read() as cursor:
+                resolved = self._sent_state(cursor, list(uncertain))
+            sent_state.update(resolved)
+            if self.seen is not None:
+                for key, sent_at in resolved.items():
+                    if sent_at:
+                        self.seen.confirm(key)
+        
+        new_products = []
+        for product in candidates:
+            is_fruits = product.site is Site.FRUITS
+            # Отправляем только если товар еще не был отправлен (или его вообще нет в базе)
+            if not sent_state.get(product.db_key):
                 new_products.append(product)
                 stats['new'] += 1
                 if is_fruits:
                     stats['fruits_new'] += 1
             else:
-                # Товар существует в базе
-                sent_at_str = result[0] if result else None
-                
-                # Проверяем возраст товара
-                is_recent = False
-                if len(result) >= 2:
-                    # Пробуем определить время создания
-                    time_str = result[1] if len(result) > 1 else None
-                    if time_str:
-                        try:
-                            # Парсим время создания
-                            if 'T' in str(time_str):
-                                created_time = datetime.fromisoformat(str(time_str).replace('Z', '+00:00'))
-                            else:
-                                created_time = datetime.strptime(str(time_str), '%Y-%m-%d %H:%M:%S')
-                            
-                            # Проверяем, что товар был создан в течение последнего часа
-                            if created_time >= cutoff_time:
-                                is_recent = True
-                        except:
-                            # Если не удалось распарсить, считаем товар новым если не отправлен
-                            is_recent = True
-                    else:
-                        is_recent = True
-                else:
-                    is_recent = True
-                
-                # Отправляем только если товар еще не был отправлен
-                # Для FruitsFamily: если товар не отправлен, считаем его новым независимо от возраста
-                # (так как товары на страницах брендов могут быть старыми, но мы их еще не отправляли)
-                if not sent_at_str:
-                    # Товар еще не отправлен - добавляем (даже если он старый)
-                    # Это особенно важно для FruitsFamily, где мы парсим страницы брендов
-                    new_products.append(product)
-                    stats['new'] += 1
-                    if is_fruits:
-                        stats['fruits_new'] += 1
-                else:
-                    # Товар уже был отправлен
-                    stats['already_sent'] += 1
-                    if is_fruits:
-                        stats['fruits_filtered'] += 1
+                # Товар уже был отправлен
+                stats['already_sent'] += 1
+                if is_fruits:
+                    stats['fruits_filtered'] += 1
         
         # Выводим статистику
-        print(f"Статистика фильтрации товаров:")
-        print(f"  - Новых товаров: {stats['new']} (FruitsFamily: {stats['fruits_new']})")
-        print(f"  - Уже отправлено: {stats['already_sent']} (FruitsFamily: {stats['fruits_filtered']})")
-        print(f"  - Слишком старых: {stats['too_old']}")
-        print(f"  - Без ID: {stats['no_id']}")
+        if print_stats:
+            self.print_filter_stats(stats)
         
         return new_products
     
     def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
         """Добавление или обновление пользователя"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO users (user_id, username, first_name, last_name, last_active)
-            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-        ''', (user_id, username, first_name, last_name))
-        conn.commit()
-        conn.close()
+        with self._write() as cursor:
+            cursor.execute('''
+                INSERT OR REPLACE INTO users (user_id, username, first_name, last_name, last_active)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (user_id, username, first_name, last_name, self._now()))
     
     def subscribe_user(self, user_id: int) -> bool:
         """Подписать пользователя на рассылку"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE users SET subscribed = 1, last_active = CURRENT_TIMESTAMP WHERE user_id = ?
-        ''', (user_id,))
-        updated = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
-        return updated
+        with self._write() as cursor:
+            cursor.execute('''
+                UPDATE users SET subscribed = 1, last_active = ? WHERE user_id = ?
+            ''', (self._now(), user_id))
+            return cursor.rowcount > 0
     
     def unsubscribe_user(self, user_id: int) -> bool:
         """Отписать пользователя от рассылки"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE users SET subscribed = 0 WHERE user_id = ?
-        ''', (user_id,))
-        updated = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
-        return updated
+        with self._write() as cursor:
+            cursor.execute('''
+                UPDATE users SET subscribed = 0 WHERE user_id = ?
+            ''', (user_id,))
+            return cursor.rowcount > 0
     
     def get_subscribed_users(self) -> List[int]:
         """Получить список ID подписанных пользователей"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute('SELECT user_id FROM users WHERE subscribed = 1')
-        user_ids = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        return user_ids
+        with self._read() as cursor:
+            cursor.execute('SELECT user_id FROM users WHERE subscribed = 1')
+            return [row[0] for row in cursor.fetchall()]
     
     def is_subscribed(self, user_id: int) -> bool:
         """Проверить, подписан ли пользователь"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        cursor.execute('SELECT subscribed FROM users WHERE user_id = ?', (user_id,))
-        result = cursor.fetchone()
-        conn.close()
+        with self._read() as cursor:
+            cursor.execute('SELECT subscribed FROM users WHERE user_id = ?', (user_id,))
+            result = cursor.fetchone()
         return result and result[0] == 1 if result else False
 
+
+class AsyncProductDatabase:
+    """Асинхронный доступ к ProductDatabase для обработчиков бота и планировщика: event loop не ждет SQLite.
+    Запись - через отдельный поток с очередью запросов: накопившиеся запросы выполняются в одной
+    транзакции (групповая фиксация, у каждого свой SAVEPOINT). Чтение - в пуле потоков через
+    соединения чтения (WAL, запись его не блокирует)"""
+    
+    _STOP = object()
+    
+    def __init__(self, db: ProductDatabase):
+        # Синхронная база - для потоков парсинга (например, is_sent при чтении выдачи)
+        self.sync = db
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._writer_loop, name='db-writer', daemon=True)
+        self._thread.start()
+    
+    def _submit(self, func: Callable, *args, group: bool = True, **kwargs) -> asyncio.Future:
+        """Поставить запись в очередь потока базы. group=False - отдельно, вне транзакции"""
+        future = Future()
+        self._requests.put((partial(func, *args, **kwargs), future, group))
+        return asyncio.wrap_future(future)
+    
+    async def _read(self, func: Callable, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(None, partial(func, *args, **kwargs))
+    
+    def _writer_loop(self):
+        while True:
+            request = self._requests.get()
+            if request is self._STOP:
+                return
+            batch = [request]
+            try:
+                stop = self._process(batch)
+            except Exception as e:
+                # Поток записи не должен останавливаться: ошибка достается ожидающим запросам
+                print(f"Ошибка потока записи базы данных: {e}")
+                self._fail(batch, e)
+                stop = False
+            if stop:
+                return
+    
+    def _process(self, batch: List) -> bool:
+        """Выполнить запрос batch[0] и все, что накопилось в очереди за ним; True - пришла остановка"""
+        call, future, group = batch[0]
+        if not group:
+            self._run_single(call, future)
+            return False
+        # Все, что накопилось в очереди, пока выполнялась предыдущая транзакция
+        while len(batch) < config.DB_GROUP_COMMIT_MAX:
+            try:
+                request = self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is self._STOP:
+                self._run_group(batch)
+                return True
+            if not request[2]:
+                # Запрос вне транзакции выполняем после группы, порядок сохраняется
+                self._run_group(batch)
+                batch[:] = [request]
+                self._run_single(*request[:2])
+                batch.clear()
+                continue
+            batch.append(request)
+        if batch:
+            self._run_group(batch)
+        return False
+    
+    @staticmethod
+    def _fail(batch: List, error: Exception):
+        """Ошибка всем запросам, которые еще не получили результат"""
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(error)
+    
+    @staticmethod
+    def _run_single(call: Callable, future: Future):
+        try:
+            future.set_result(call())
+        except Exception as e:
+            future.set_exception(e)
+    
+    def _run_group(self, batch: List):
+        if len(batch) == 1:
+            self._run_single(*batch[0][:2])
+            return
+        results = []
+        try:
+            with self.sync._write() as cursor:
+                for call, future, _ in batch:
+                    # Ошибка одного запроса откатывает только его изменения
+                    cursor.execute('SAVEPOINT request')
+                    try:
+                        result = call()
+                    except Exception as e:
+                        cursor.execute('ROLLBACK TO request')
+                        cursor.execute('RELEASE request')
+                        future.set_exception(e)
+                    else:
+                        cursor.execute('RELEASE request')
+                        results.append((future, result))
+        except Exception as e:
+            # BEGIN, SAVEPOINT или COMMIT не удались - ни один запрос группы не выполнен,
+            # в том числе те, до которых очередь не дошла
+            self._fail(batch, e)
+            return
+        for future, result in results:
+            future.set_result(result)
+    
+    def close(self):
+        """Дождаться записи из очереди и закрыть базу"""
+        self._requests.put(self._STOP)
+        self._thread.join()
+        self.sync.close()
+    
+    # Запись
+    
+    def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
+        return self._submit(self.sync.add_user, user_id, username, first_name, last_name)
+    
+    def subscribe_user(self, user_id: int):
+        return self._submit(self.sync.subscribe_user, user_id)
+    
+    def unsubscribe_user(self, user_id: int):
+        return self._submit(self.sync.unsubscribe_user, user_id)
+    
+    def add_product(self, product: Union[Product, Dict], mark_as_sent: bool = False):
+        return self._submit(self.sync.add_product, product, mark_as_sent)
+    
+    def mark_as_sent(self, product: Union[Product, Dict]):
+        return self._submit(self.sync.mark_as_sent, product)
+    
+    def record_sent(self, products: List[Union[Product, Dict]]):
+        return self._submit(self.sync.record_sent, list(products))
+    
+    def record_prices(self, products: List[Union[Product, Dict]]):
+        return self._submit(self.sync.record_prices, list(products))
+    
+    def archive_old_products(self, max_age_days: int = None, batch_size: int = None):
+        return self._submit(self.sync.archive_old_products, max_age_days, batch_size)
+    
+    def incremental_vacuum(self, pages: int = None):
+        # PRAGMA incremental_vacuum выполняется вне транзакции
+        return self._submit(self.sync.incremental_vacuum, pages, group=False)
+    
+    # Чтение
+    
+    async def get_subscribed_users(self) -> List[int]:
+        return await self._read(self.sync.get_subscribed_users)
+    
+    async def is_subscribed(self, user_id: int) -> bool:
+        return await self._read(self.sync.is_subscribed, user_id)
+    
+    async def product_exists(self, product: Union[Product, Dict]) -> bool:
+        return await self._read(self.sync.product_exists, product)
+    
+    async def is_sent(self, product: Union[Product, Dict]) -> bool:
+        return await self._read(self.sync.is_sent, product)
+    
+    async def get_new_products(self, products: List[Union[Product, Dict]], max_age_hours: int = 1,
+                               stats: Dict[str, int] = None) -> List[Product]:
+        return await self._read(self.sync.get_new_products, products, max_age_hours, stats)
+    
+    new_filter_stats = staticmethod(ProductDatabase.new_filter_stats)
+    print_filter_stats = staticmethod(ProductDatabase.print_filter_stats)
+
+
+def _migration_initial(cursor: sqlite3.Cursor):
+    """исходные таблицы"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id TEXT UNIQUE,
+            title TEXT,
+            link TEXT,
+            price TEXT,
+            image TEXT,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+    ''')
+    # Базы, созданные до first_seen_at
+    cursor.execute("PRAGMA table_info(products)")
+    if 'first_seen_at' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE products ADD COLUMN first_seen_at TIMESTAMP')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            subscribed INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _migration_listing_keys(cursor: sqlite3.Cursor):
+    """ключ (сайт, ID объявления) вместо MD5 ссылки"""
+    cursor.execute("PRAGMA table_info(products)")
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'site' not in columns:
+        cursor.execute('ALTER TABLE products ADD COLUMN site INTEGER')
+    if 'listing_id' not in columns:
+        cursor.execute('ALTER TABLE products ADD COLUMN listing_id INTEGER')
+    # NULL в уникальном индексе не конфликтуют - строки без ID объявления не мешают
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_products_listing ON products(site, listing_id)')
+    
+    cursor.execute('SELECT id, link, sent_at FROM products WHERE listing_id IS NULL AND link IS NOT NULL')
+    rows = cursor.fetchall()
+    migrated = 0
+    merged = 0
+    for row_id, link, sent_at in rows:
+        # Ссылки без ID объявления получают ключ по самой ссылке, как у новых товаров
+        key = db_key_for_link(Site.from_link(link), link)
+        if key is None:
+            continue
+        cursor.execute('SELECT id FROM products WHERE site = ? AND listing_id = ?', key)
+        existing = cursor.fetchone()
+        if existing:
+            # Тот же товар под другой ссылкой (параметры отслеживания и т.п.) - склеиваем строки,
+            # отметка об отправке сохраняется
+            if sent_at:
+                cursor.execute('UPDATE products SET sent_at = COALESCE(sent_at, ?) WHERE id = ?', (sent_at, existing[0]))
+            cursor.execute('DELETE FROM products WHERE id = ?', (row_id,))
+            merged += 1
+        else:
+            cursor.execute('UPDATE products SET site = ?, listing_id = ? WHERE id = ?', (*key, row_id))
+            migrated += 1
+    if migrated or merged:
+        print(f"Миграция ключей товаров: перенесено {migrated}, объединено дубликатов {merged}")
+
+
+# Текстовая метка 'YYYY-MM-DD HH:MM:SS' (CURRENT_TIMESTAMP, UTC) -> секунды Unix
+_EPOCH_SQL = "CAST(strftime('%s', {column}) AS INTEGER)"
+_NOW_SQL = "(CAST(strftime('%s', 'now') AS INTEGER))"
+
+
+def _migration_integer_timestamps(cursor: sqlite3.Cursor):
+    """целые временные метки"""
+    # SQLite не меняет DEFAULT у существующих колонок - таблицы пересоздаются.
+    # Заодно уходит колонка product_id (MD5 ссылки), ключ теперь (site, listing_id)
+    cursor.execute(f'''
+        CREATE TABLE products_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            site INTEGER,
+            listing_id INTEGER,
+            title TEXT,
+            link TEXT,
+            price TEXT,
+            image TEXT,
+            description TEXT,
+            created_at INTEGER DEFAULT {_NOW_SQL},
+            first_seen_at INTEGER,
+            sent_at INTEGER
+        )
+    ''')
+    cursor.execute(f'''
+        INSERT INTO products_new (id, site, listing_id, title, link, price, image, description,
+                                  created_at, first_seen_at, sent_at)
+        SELECT id, site, listing_id, title, link, price, image, description,
+               {_EPOCH_SQL.format(column='created_at')}, {_EPOCH_SQL.format(column='first_seen_at')},
+               {_EPOCH_SQL.format(column='sent_at')}
+        FROM products
+    ''')
+    cursor.execute('DROP TABLE products')
+    cursor.execute('ALTER TABLE products_new RENAME TO products')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_products_listing ON products(site, listing_id)')
+    
+    cursor.execute(f'''
+        CREATE TABLE users_new (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            subscribed INTEGER DEFAULT 1,
+            created_at INTEGER DEFAULT {_NOW_SQL},
+            last_active INTEGER DEFAULT {_NOW_SQL}
+        )
+    ''')
+    cursor.execute(f'''
+        INSERT INTO users_new (user_id, username, first_name, last_name, subscribed, created_at, last_active)
+        SELECT user_id, username, first_name, last_name, subscribed,
+               {_EPOCH_SQL.format(column='created_at')}, {_EPOCH_SQL.format(column='last_active')}
+        FROM users
+    ''')
+    cursor.execute('DROP TABLE users')
+    cursor.execute('ALTER TABLE users_new RENAME TO users')
+
+
+def _migration_secondary_indexes(cursor: sqlite3.Cursor):
+    """индексы sent_at, first_seen_at, users.subscribed"""
+    # Частичные индексы: в запросах участвуют только отправленные товары и подписанные пользователи
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_sent_at ON products(sent_at) WHERE sent_at IS NOT NULL')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_first_seen_at ON products(first_seen_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_subscribed ON users(subscribed)')
+
+
+def _migration_archive(cursor: sqlite3.Cursor):
+    """архив ключей отправленных товаров"""
+    # Только ключ и время отправки: описание и ссылки старых товаров для дедупликации не нужны
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS products_archive (
+            site INTEGER NOT NULL,
+            listing_id INTEGER NOT NULL,
+            sent_at INTEGER,
+            archived_at INTEGER,
+            PRIMARY KEY (site, listing_id)
+        ) WITHOUT ROWID
+    ''')
+    # Поиск строк для задачи хранения: отправленные - по idx_products_sent_at, неотправленные - по частичным
+    # индексам ниже (в них нет отправленных строк, поэтому каждая порция читает только подходящие строки)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_unsent_first_seen_at ON products(first_seen_at) '
+                   'WHERE sent_at IS NULL')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_unsent_created_at ON products(created_at) '
+                   'WHERE sent_at IS NULL AND first_seen_at IS NULL')
+
+
+def _migration_price_history(cursor: sqlite3.Cursor):
+    """история цен"""
+    # Запись добавляется только при изменении цены; последняя цена товара - MAX(seen_at) по первичному ключу.
+    # price - в минимальных единицах валюты (Product.price_minor)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS price_history (
+            site INTEGER NOT NULL,
+            listing_id INTEGER NOT NULL,
+            price INTEGER NOT NULL,
+            currency TEXT,
+            seen_at INTEGER NOT NULL,
+            PRIMARY KEY (site, listing_id, seen_at)
+        ) WITHOUT ROWID
+    ''')
+
+
+# (версия схемы, миграция) по возрастанию; применяются те, что новее PRAGMA user_version.
+# Миграции 1-2 идемпотентны: базы до появления user_version (версия 0) уже содержат часть изменений
+_MIGRATIONS = [
+    (1, _migration_initial),
+    (2, _migration_listing_keys),
+    (3, _migration_integer_timestamps),
+    (4, _migration_secondary_indexes),
+    (5, _migration_archive),
+    (6, _migration_price_history),
+]
+
+
+if __name__ == '__main__':
+    import sys
+    if '--incremental-vacuum' in sys.argv[1:]:
+        db = ProductDatabase(config.DB_FILE)
+        print(f"Перестраиваем {config.DB_FILE} с auto_vacuum=INCREMENTAL...")
+        db.enable_incremental_vacuum()
+        db.close()
+        print("Готово")
+    else:
+        print("Использование: python database.py --incremental-vacuum")
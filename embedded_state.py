@@ -0,0 +1,138 @@
+"""
+Извлечение товаров из JSON-данных, встроенных в HTML (__NEXT_DATA__ и т.п.) или полученных от API сайта
+"""
+import json
+import re
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urljoin
+
+# <script id="__NEXT_DATA__" type="application/json">{...}</script> и аналогичные JSON-скрипты
+_JSON_SCRIPT_RE = re.compile(
+    rb'<script[^>]*id=["\'](?:__NEXT_DATA__|__NUXT_DATA__|__APOLLO_STATE__)["\'][^>]*>(.*?)</script>',
+    re.DOTALL | re.IGNORECASE
+)
+# window.__APOLLO_STATE__ = {...}; и аналогичные присваивания в inline-скриптах
+_WINDOW_STATE_RE = re.compile(
+    rb'window\.(?:__APOLLO_STATE__|__INITIAL_STATE__|__PRELOADED_STATE__|__NUXT__)\s*=\s*',
+)
+
+ID_KEYS = ('id', 'productId', 'product_id', 'pid')
+TITLE_KEYS = ('title', 'name', 'productName', 'product_name')
+PRICE_KEYS = ('price', 'salePrice', 'sale_price', 'sellPrice')
+IMAGE_KEYS = ('image', 'imageUrl', 'image_url', 'thumbnail', 'thumbnailUrl', 'mainImage', 'images', 'resizedSmallImages')
+DESCRIPTION_KEYS = ('description', 'content')
+BRAND_KEYS = ('brand', 'brandName', 'brand_name')
+SOLD_KEYS = ('isSold', 'is_sold', 'soldOut', 'sold_out', 'isSoldOut')
+
+
+def extract_state_json(html) -> List:
+    """Все JSON-объекты состояния, встроенные в HTML страницы"""
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+
+    states = []
+    for match in _JSON_SCRIPT_RE.finditer(html):
+        try:
+            states.append(json.loads(match.group(1)))
+        except ValueError:
+            continue
+
+    decoder = json.JSONDecoder()
+    for match in _WINDOW_STATE_RE.finditer(html):
+        # raw_decode читает ровно один JSON-объект, хвост скрипта (;) игнорируется
+        tail = html[match.end():match.end() + 5_000_000].decode('utf-8', errors='ignore')
+        try:
+            state, _ = decoder.raw_decode(tail)
+            states.append(state)
+        except ValueError:
+            continue
+    return states
+
+
+def _first(item: Dict, keys) -> Optional[object]:
+    for key in keys:
+        value = item.get(key)
+        if value not in (None, '', [], {}):
+            return value
+    return None
+
+
+def is_product_like(item: Dict) -> bool:
+    """Похож ли словарь на товар: есть ID, название и цена"""
+    return (_first(item, ID_KEYS) is not None
+            and isinstance(_first(item, TITLE_KEYS), str)
+            and _first(item, PRICE_KEYS) is not None)
+
+
+def find_product_dicts(data) -> Iterator[Dict]:
+    """Обход JSON в глубину: все словари, похожие на товары, в порядке документа"""
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if is_product_like(node):
+                yield node
+                continue
+            stack.extend(reversed(list(node.values())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+
+
+def _image_url(value) -> Optional[str]:
+    """URL изображения из строки, списка или словаря с url"""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, dict):
+        value = _first(value, ('url', 'src', 'original', 'small'))
+    return value if isinstance(value, str) else None
+
+
+def map_product_item(item: Dict, product_url_template: str, base_url: str) -> Optional[Dict]:
+    """Преобразование товара из JSON в словарь товара (в формате parse_product_card)"""
+    if any(item.get(key) for key in SOLD_KEYS):
+        return None
+
+    product_id = _first(item, ID_KEYS)
+    title = (_first(item, TITLE_KEYS) or '').strip()
+    if product_id is None or not title:
+        return None
+
+    product = {
+        'title': title[:200],
+        'link': product_url_template.format(id=product_id),
+    }
+
+    price = _first(item, PRICE_KEYS)
+    if isinstance(price, dict):
+        price = _first(price, ('amount', 'value', 'price'))
+    price = str(price or '').replace(',', '').strip()
+    if price.replace('.', '', 1).isdigit():
+        product['price'] = f"{int(float(price)):,}원"
+        product['price_amount'] = float(price)
+        product['currency'] = 'KRW'
+
+    image = _image_url(_first(item, IMAGE_KEYS))
+    if image:
+        product['image'] = urljoin(base_url, image)
+
+    description = _first(item, DESCRIPTION_KEYS)
+    brand = _first(item, BRAND_KEYS)
+    if isinstance(brand, dict):
+        brand = _first(brand, TITLE_KEYS)
+    parts = [str(part).strip() for part in (brand, description) if isinstance(part, str) and part.strip()]
+    if parts:
+        product['description'] = ' '.join(parts)[:300]
+
+    return product
+
+
+def products_from_json(data, product_url_template: str, base_url: str) -> List[Dict]:
+    """Все товары из JSON (без дубликатов по ссылке)"""
+    products = []
+    seen_links = set()
+    for item in find_product_dicts(data):
+        product = map_product_item(item, product_url_template, base_url)
+        if product and product['link'] not in seen_links:
+            seen_links.add(product['link'])
+            products.append(product)
+    return products
@@ -0,0 +1,87 @@
+"""
+Асинхронная загрузка страниц с общим пулом соединений для всех парсеров
+"""
+import asyncio
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlparse
+import config
+
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+# Эти заголовки aiohttp выставляет сам (br без brotli он не распакует)
+_SKIP_HEADERS = {'accept-encoding', 'connection'}
+
+
+class AsyncFetcher:
+    """Асинхронный загрузчик с общим пулом соединений и лимитом запросов на хост"""
+
+    def __init__(self, max_connections: int = None, per_host_limit: int = None, timeout: float = None):
+        self.max_connections = max_connections or config.FETCH_MAX_CONNECTIONS
+        self.per_host_limit = per_host_limit or config.FETCH_PER_HOST_LIMIT
+        self.timeout = timeout or config.FETCH_TIMEOUT
+        self._session = None
+        self._loop = None
+        self._host_semaphores = {}
+
+    async def _get_session(self):
+        """Ленивое создание сессии (она привязана к текущему event loop)"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.per_host_limit,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._loop = loop
+            self._host_semaphores = {}
+        return self._session
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        """Семафор для хоста: лимит из FETCH_HOST_LIMITS или общий FETCH_PER_HOST_LIMIT"""
+        host = urlparse(url).netloc.lower()
+        if host.startswith('www.'):
+            host = host[4:]
+        if host not in self._host_semaphores:
+            limit = config.FETCH_HOST_LIMITS.get(host, self.per_host_limit)
+            self._host_semaphores[host] = asyncio.Semaphore(limit)
+        return self._host_semaphores[host]
+
+    async def fetch(self, url: str, headers: Dict = None) -> Optional[bytes]:
+        """Загрузить одну страницу, вернуть сырые байты ответа или None при ошибке"""
+        session = await self._get_session()
+        request_headers = {k: v for k, v in (headers or {}).items() if k.lower() not in _SKIP_HEADERS}
+
+        async with self._host_semaphore(url):
+            try:
+                async with session.get(url, headers=request_headers) as response:
+                    response.raise_for_status()
+                    content = await response.read()
+                    print(f"  Асинхронно загружено {url}: {len(content)} байт")
+                    return content
+            except Exception as e:
+                print(f"  Ошибка при асинхронной загрузке {url}: {e}")
+                return None
+
+    async def fetch_many(self, urls: Iterable[str], headers: Dict = None) -> Dict[str, Optional[bytes]]:
+        """Загрузить несколько страниц одновременно, результат - словарь url -> байты"""
+        unique_urls = list(dict.fromkeys(urls))
+        results = await asyncio.gather(*(self.fetch(url, headers) for url in unique_urls))
+        return dict(zip(unique_urls, results))
+
+    async def close(self):
+        """Закрыть сессию и все соединения пула"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+# Глобальный загрузчик, общий для всех парсеров
+fetcher = AsyncFetcher()
@@ -0,0 +1,249 @@
+"""
+Backend для разбора HTML: BeautifulSoup, lxml или selectolax (lexbor).
+Узлы lxml и selectolax поддерживают ту часть API BeautifulSoup, которой пользуются парсеры:
+find/find_all (name, class_, attrs, href=True, string=...), get_text, get, name, parent
+"""
+from typing import Iterator, List, Union
+import config
+from bs4 import BeautifulSoup
+
+try:
+    import lxml.html
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+    SELECTOLAX_AVAILABLE = True
+except ImportError:
+    SELECTOLAX_AVAILABLE = False
+
+# Содержимое этих тегов не считается текстом страницы (как в BeautifulSoup)
+_SKIP_TEXT_TAGS = {'script', 'style', 'template'}
+
+
+def _matches_condition(value, condition) -> bool:
+    """Проверка значения атрибута по условию в стиле BeautifulSoup"""
+    if condition is True:
+        return value is not None
+    if callable(condition):
+        return bool(condition(value))
+    if hasattr(condition, 'search'):
+        return value is not None and condition.search(value) is not None
+    return value == condition
+
+
+class _Node:
+    """Общая часть узлов lxml/selectolax: поиск в стиле BeautifulSoup по потомкам в порядке документа"""
+    __slots__ = ()
+
+    def _matches(self, names, conditions) -> bool:
+        if names is not None and self.name not in names:
+            return False
+        for attr, condition in conditions:
+            if not _matches_condition(self.get(attr), condition):
+                return False
+        return True
+
+    @staticmethod
+    def _prepare(name, attrs, class_, kwargs):
+        names = {name} if isinstance(name, str) else (set(name) if name else None)
+        conditions = list((attrs or {}).items()) + list(kwargs.items())
+        if class_ is not None:
+            conditions.append(('class', class_))
+        return names, conditions
+
+    def find_all(self, name=None, attrs: dict = None, class_=None, **kwargs) -> List:
+        names, conditions = self._prepare(name, attrs, class_, kwargs)
+        return [node for node in self.iter_tags() if node._matches(names, conditions)]
+
+    def find(self, name=None, attrs: dict = None, class_=None, string=None, **kwargs):
+        if string is not None:
+            # Как в BeautifulSoup: первая текстовая строка, подходящая под шаблон
+            for text in self.strings:
+                if _matches_condition(text, string):
+                    return text
+            return None
+        names, conditions = self._prepare(name, attrs, class_, kwargs)
+        for node in self.iter_tags():
+            if node._matches(names, conditions):
+                return node
+        return None
+
+    def get_text(self, separator: str = '', strip: bool = False) -> str:
+        parts = self.strings
+        if strip:
+            parts = [part.strip() for part in parts]
+            parts = [part for part in parts if part]
+        return separator.join(parts)
+
+
+class LxmlNode(_Node):
+    """Узел lxml.html"""
+    __slots__ = ('_el',)
+
+    def __init__(self, element):
+        self._el = element
+
+    @property
+    def name(self) -> str:
+        return self._el.tag
+
+    @property
+    def parent(self):
+        parent = self._el.getparent()
+        return LxmlNode(parent) if parent is not None else None
+
+    def get(self, attr: str, default=None):
+        return self._el.get(attr, default)
+
+    @property
+    def key(self) -> int:
+        # Прокси lxml живет, пока на него есть ссылка (а узел ее держит)
+        return id(self._el)
+
+    def iter_tags(self) -> Iterator['LxmlNode']:
+        """Все элементы-потомки в порядке документа"""
+        for element in self._el.iterdescendants():
+            if isinstance(element.tag, str):
+                yield LxmlNode(element)
+
+    @property
+    def strings(self) -> Iterator[str]:
+        return _lxml_strings(self._el)
+
+
+def _lxml_strings(element) -> Iterator[str]:
+    """Текстовые узлы элемента без script/style и комментариев"""
+    if element.tag in _SKIP_TEXT_TAGS:
+        return
+    if element.text:
+        yield element.text
+    for child in element:
+        if isinstance(child.tag, str):
+            yield from _lxml_strings(child)
+        if child.tail:
+            yield child.tail
+
+
+class SelectolaxNode(_Node):
+    """Узел selectolax (движок lexbor)"""
+    __slots__ = ('_node',)
+
+    def __init__(self, node):
+        self._node = node
+
+    @property
+    def name(self) -> str:
+        return self._node.tag
+
+    @property
+    def parent(self):
+        parent = self._node.parent
+        return SelectolaxNode(parent) if parent is not None else None
+
+    def get(self, attr: str, default=None):
+        attributes = self._node.attributes
+        if attr not in attributes:
+            return default
+        value = attributes[attr]
+        return '' if value is None else value
+
+    @property
+    def key(self) -> int:
+        return self._node.mem_id
+
+    def iter_tags(self) -> Iterator['SelectolaxNode']:
+        """Все элементы-потомки в порядке документа"""
+        nodes = self._node.traverse(include_text=False)
+        next(nodes, None)  # traverse() начинает с самого узла
+        for node in nodes:
+            if not node.tag.startswith(('-', '_')):
+                yield SelectolaxNode(node)
+
+    @property
+    def strings(self) -> Iterator[str]:
+        for node in self._node.traverse(include_text=True):
+            if node.tag != '-text':
+                continue
+            parent = node.parent
+            if parent is not None and parent.tag in _SKIP_TEXT_TAGS:
+                continue
+            yield node.text_content or ''
+
+
+class _LxmlDocument:
+    """Корень документа над <html>, чтобы поиск находил и сам <html> (как в BeautifulSoup)"""
+    tag = '[document]'
+    text = None
+
+    def __init__(self, root):
+        self._root = root
+
+    def get(self, attr, default=None):
+        return default
+
+    def getparent(self):
+        return None
+
+    def iterdescendants(self):
+        return self._root.iter()
+
+    def __iter__(self):
+        return iter([self._root])
+
+
+# Корневой узел или элемент любого backend'а
+HtmlNode = Union[BeautifulSoup, LxmlNode, SelectolaxNode]
+
+
+def iter_tags(node) -> Iterator:
+    """Все элементы-потомки узла любого backend'а в порядке документа"""
+    if isinstance(node, _Node):
+        return node.iter_tags()
+    return (child for child in node.descendants if child.name is not None)
+
+
+def node_key(node) -> int:
+    """Идентификатор узла для множеств (обертки lxml/selectolax создаются заново при каждом обращении)"""
+    if isinstance(node, _Node):
+        return node.key
+    return id(node)
+
+
+def available_backend(name: str = None) -> str:
+    """Запрошенный backend (или config.HTML_PARSER_BACKEND), а если он не установлен - ближайший доступный"""
+    name = name or config.HTML_PARSER_BACKEND
+    if name == 'selectolax' and SELECTOLAX_AVAILABLE:
+        return 'selectolax'
+    if name in ('selectolax', 'lxml') and LXML_AVAILABLE:
+        return 'lxml'
+    return 'bs4'
+
+
+def parse_html(content, backend: str = None) -> HtmlNode:
+    """Разобрать HTML: bytes (response.content, без декодирования в str) или str (page_source).
+    Возвращает корневой узел с API в стиле BeautifulSoup или None"""
+    if not content:
+        return None
+    backend = available_backend(backend)
+
+    if backend == 'selectolax':
+        tree = LexborHTMLParser(content)
+        return SelectolaxNode(tree.root) if tree.root is not None else None
+
+    if backend == 'lxml':
+        try:
+            if isinstance(content, bytes) and b'charset' not in content[:4096].lower():
+                # Без объявленной кодировки lxml читает байты как latin-1, а сайты отдают utf-8
+                # (парсер lxml не потокобезопасен, поэтому создаем новый на каждый вызов)
+                root = lxml.html.document_fromstring(content, parser=lxml.html.HTMLParser(encoding='utf-8'))
+            else:
+                root = lxml.html.document_fromstring(content)
+        except ValueError:
+            # str с XML-декларацией кодировки lxml не принимает
+            root = lxml.html.document_fromstring(content.encode('utf-8'))
+        return LxmlNode(_LxmlDocument(root))
+
+    return BeautifulSoup(content, 'html.parser')
@@ -1,33 +1,52 @@
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 from parser import BunjangParser, FruitsFamilyParser
 from bot import TelegramBot
-from database import ProductDatabase
+from database import AsyncProductDatabase, PriceChange, ProductDatabase, price_drop_percent
+from fetcher import fetcher
+from selenium_pool import DriverPool
+from readiness import stats as readiness_stats
+from card_discovery import stats as discovery_stats
+import parse_worker
+from product import Product, Site
+from price import format_minor_units
 import config
 
 class BunjangBot:
     def __init__(self):
+        # Общий пул Selenium драйверов: страницы брендов обоих сайтов рендерятся параллельно
+        self.driver_pool = DriverPool()
         # Парсер для Bunjang
         self.bunjang_parser = BunjangParser(
             config.BUNJANG_URL, 
             use_selenium=config.USE_SELENIUM,
-            brands_filter=config.BRANDS_TO_PARSE
+            brands_filter=config.BRANDS_TO_PARSE,
+            driver_pool=self.driver_pool,
+            use_api=config.BUNJANG_USE_API
         )
         # Парсер для FruitsFamily (используем те же бренды, что и для Bunjang)
-        # Для FruitsFamily всегда используем Selenium, так как сайт требует JavaScript
+        # Товары берутся из JSON, встроенного в HTML; Selenium нужен, только если его там нет
         self.fruits_parser = FruitsFamilyParser(
             base_url='https://fruitsfamily.com/',
-            use_selenium=True,  # Всегда используем Selenium для FruitsFamily
-            brands_filter=config.BRANDS_TO_PARSE  # Используем те же бренды
+            use_selenium=True,  # Selenium - запасной вариант, сайт требует JavaScript
+            brands_filter=config.BRANDS_TO_PARSE,  # Используем те же бренды
+            driver_pool=self.driver_pool,
+            use_embedded_state=config.FRUITS_USE_EMBEDDED_STATE
         )
         # Для обратной совместимости
         self.parser = self.bunjang_parser
-        self.bot = TelegramBot(config.TELEGRAM_BOT_TOKEN)
-        self.db = ProductDatabase(config.DB_FILE)
+        # Одна база данных на процесс: долгоживущие соединения общие для бота и парсинга.
+        # Обработчики и планировщик работают с ней асинхронно, потоки парсинга - через self.db.sync
+        self.db = AsyncProductDatabase(ProductDatabase(config.DB_FILE))
+        self.bot = TelegramBot(config.TELEGRAM_BOT_TOKEN, db=self.db)
         self.application = None
         self.is_parsing_active = True  # Флаг для управления парсингом
         self.scheduler_task = None  # Задача планировщика
+        # Пул потоков для блокирующего парсинга (requests/Selenium), размер ограничен в config
+        self.scrape_executor = ThreadPoolExecutor(max_workers=config.SCRAPE_MAX_WORKERS, thread_name_prefix='scrape')
     
     def get_control_keyboard(self):
         """Создает клавиатуру с кнопками управления (inline)"""
@@ -58,13 +77,13 @@ class BunjangBot:
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка команды /start"""
         user = update.effective_user
-        self.db.add_user(
+        await self.db.add_user(
             user_id=user.id,
             username=user.username,
             first_name=user.first_name,
             last_name=user.last_name
         )
-        self.db.subscribe_user(user.id)
+        await self.db.subscribe_user(user.id)
         
         status_text = "активен" if self.is_parsing_active else "остановлен"
         
@@ -82,7 +101,7 @@ class BunjangBot:
     async def stop_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка команды /stop"""
         user = update.effective_user
-        self.db.unsubscribe_user(user.id)
+        await self.db.unsubscribe_user(user.id)
         await update.message.reply_text(
             "Вы отписаны от рассылки. Используйте /start чтобы подписаться снова.",
             reply_markup=self.get_reply_keyboard()
@@ -91,10 +110,10 @@ class BunjangBot:
     async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка команды /status"""
         user = update.effective_user
-        is_subscribed = self.db.is_subscribed(user.id)
+        is_subscribed = await self.db.is_subscribed(user.id)
         status_text = "подписаны" if is_subscribed else "не подписаны"
         parse_status = "активен" if self.is_parsing_active else "остановлен"
-        subscribed_users = len(self.db.get_subscribed_users())
+        subscribed_users = len(await self.db.get_subscribed_users())
         await update.message.reply_text(
             f"📊 Статус:\n\n"
             f"Подписка: вы {status_text} на рассылку\n"
@@ -216,7 +235,7 @@ class BunjangBot:
         
         elif query.data == "parse_status":
             status_text = "активен" if self.is_parsing_active else "остановлен"
-            subscribed_users = len(self.db.get_subscribed_users())
+            subscribed_users = len(await self.db.get_subscribed_users())
             await query.edit_message_text(
                 f"📊 Статус парсинга:\n\n"
                 f"Парсинг: {status_text}\n"
@@ -248,13 +267,179 @@ class BunjangBot:
                 f"❌ Ошибка при парсинге: {e}"
             )
     
+    def _bunjang_search_url(self, brand_info: Dict) -> str:
+        """Формирует URL поиска Bunjang для бренда"""
+        brand_name = brand_info['name']
+        category = brand_info.get('category')
+        if category == 'shoes':
+            # Для обуви используем специальную категорию
+            return f"https://globalbunjang.com/search?categoryId=405&q={brand_name.replace(' ', '%20')}&soldout=exclude"
+        return f"https://globalbunjang.com/search?q={brand_name.replace(' ', '%20')}&soldout=exclude"
+    
+    def _scrape_bunjang_brand(self, brand_info: Dict, pages: Dict[str, Optional[bytes]], emit: Callable[[Product], None]) -> int:
+        """Парсинг одного бренда на Bunjang (блокирующий, выполняется в пуле потоков).
+        Товары передаются в emit по одному, сразу после разбора"""
+        brand_name = brand_info['name']
+        print(f"  Парсинг бренда: {brand_name}...")
+        search_url = self._bunjang_search_url(brand_info)
+        api_url = self.bunjang_parser.api_url_for_search(search_url, limit=10) if self.bunjang_parser.use_api else None
+        count = 0
+        # Выдача API отсортирована по дате: на первом уже отправленном товаре разбор бренда заканчивается.
+        # С историей цен читаем до limit: цены уже отправленных товаров нужны для уведомлений о снижении
+        # (повторно они не отправляются - их отсеивает get_new_products)
+        is_sent = None if config.PRICE_HISTORY_ENABLED else self.db.sync.is_sent
+        for product in self.bunjang_parser.iter_products(search_url, limit=10, is_sent=is_sent,
+                                                         html=pages.get(search_url), api_payload=pages.get(api_url)):
+            emit(product)
+            count += 1
+        if count:
+            print(f"  Найдено {count} товаров бренда {brand_name}")
+        return count
+    
+    def _scrape_fruits_brand(self, brand_info: Dict, pages: Dict[str, Optional[bytes]], emit: Callable[[Product], None]) -> int:
+        """Парсинг одного бренда на FruitsFamily (блокирующий, выполняется в пуле потоков).
+        Товары передаются в emit по одному, сразу после разбора"""
+        brand_name = brand_info['name']
+        print(f"  Парсинг бренда: {brand_name}...")
+        
+        # Используем конкретную ссылку для бренда из config
+        brand_url = config.FRUITS_BRAND_URLS.get(brand_name.lower())
+        if brand_url:
+            print(f"    URL: {brand_url}")
+            brand_products = self.fruits_parser.iter_products(url=brand_url, limit=20, html=pages.get(brand_url))
+        else:
+            # Если ссылки нет, используем поиск (резервный вариант)
+            print(f"    Ссылка для бренда {brand_name} не найдена в config, используем поиск")
+            brand_products = (Product.from_dict(product, Site.FRUITS) for product in
+                              self.fruits_parser.parse_products_from_search(search_query=brand_name, limit=10))
+        
+        count = 0
+        invalid_count = 0
+        for product in brand_products:
+            # Проверяем, что товары имеют необходимые поля
+            if not (product.link and product.title):
+                invalid_count += 1
+            emit(product)
+            count += 1
+        
+        if count:
+            if invalid_count:
+                print(f"  ВНИМАНИЕ: {invalid_count} товаров без ссылки или названия")
+            print(f"  Найдено {count} товаров бренда {brand_name} (валидных: {count - invalid_count})")
+        else:
+            print(f"  Товары не найдены для бренда {brand_name}")
+        return count
+    
+    async def _prefetch_pages(self, parser, urls: List[str]) -> Dict[str, Optional[bytes]]:
+        """Одновременная загрузка страниц всех брендов (только для парсеров без Selenium)"""
+        if parser.use_selenium or not urls:
+            return {}
+        return await parser.fetch_many(urls)
+    
+    async def _scrape_brands(self, site_name: str, scrape_func, pages: Dict[str, Optional[bytes]],
+                             emit: Callable[[Product], None]) -> int:
+        """Параллельный парсинг всех брендов одного сайта в пуле потоков; возвращает число найденных товаров"""
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(self.scrape_executor, scrape_func, brand_info, pages, emit) for brand_info in config.BRANDS_TO_PARSE),
+            return_exceptions=True
+        )
+        
+        total = 0
+        for brand_info, result in zip(config.BRANDS_TO_PARSE, results):
+            if isinstance(result, Exception):
+                print(f"Ошибка при парсинге {site_name} (бренд {brand_info['name']}): {result}")
+                import traceback
+                traceback.print_exception(type(result), result, result.__traceback__)
+            else:
+                total += result
+        return total
+    
+    async def scrape_bunjang(self, emit: Callable[[Product], None]) -> int:
+        """Парсинг товаров с Bunjang для всех брендов из config"""
+        print("Парсинг Bunjang Global...")
+        search_urls = [self._bunjang_search_url(brand_info) for brand_info in config.BRANDS_TO_PARSE]
+        if self.bunjang_parser.use_api:
+            # Через JSON API: загружаем ответы API всех брендов одновременно, HTML нужен только как запасной вариант
+            api_urls = [url for url in (self.bunjang_parser.api_url_for_search(u, limit=10) for u in search_urls) if url]
+            pages = await self.bunjang_parser.fetch_many(api_urls)
+        else:
+            pages = await self._prefetch_pages(self.bunjang_parser, search_urls)
+        bunjang_count = await self._scrape_brands('Bunjang', self._scrape_bunjang_brand, pages, emit)
+        if bunjang_count:
+            print(f"Всего найдено {bunjang_count} товаров на Bunjang")
+        return bunjang_count
+    
+    async def scrape_fruits(self, emit: Callable[[Product], None]) -> int:
+        """Парсинг товаров с FruitsFamily по конкретным ссылкам для каждого бренда"""
+        print("Парсинг FruitsFamily...")
+        brand_urls = [url for url in (config.FRUITS_BRAND_URLS.get(b['name'].lower()) for b in config.BRANDS_TO_PARSE) if url]
+        if self.fruits_parser.use_embedded_state:
+            # HTML нужен для встроенных данных даже при включенном Selenium
+            pages = await self.fruits_parser.fetch_many(brand_urls)
+        else:
+            pages = await self._prefetch_pages(self.fruits_parser, brand_urls)
+        fruits_count = await self._scrape_brands('FruitsFamily', self._scrape_fruits_brand, pages, emit)
+        
+        if not fruits_count:
+            print("  ВНИМАНИЕ: Не найдено ни одного товара на FruitsFamily!")
+        else:
+            print(f"Всего найдено {fruits_count} товаров на FruitsFamily (с дубликатами между страницами брендов)")
+        return fruits_count
+    
+    async def scrape_all_sites(self, emit: Callable[[Product], None]) -> int:
+        """Параллельный парсинг обоих сайтов: цикл длится столько, сколько самый медленный сайт,
+        но каждый товар попадает в emit сразу после разбора"""
+        bunjang_count, fruits_count = await asyncio.gather(self.scrape_bunjang(emit), self.scrape_fruits(emit))
+        
+        # Статистика ожидания страниц Selenium - по ней подбираются пороги в config.SELENIUM_READY
+        readiness_summary = readiness_stats.summary()
+        if readiness_summary:
+            print("Время ожидания страниц Selenium:")
+            for key, item in readiness_summary.items():
+                print(f"  - {key}: {item['count']} стр., среднее {item['avg']:.2f} с, p95 {item['p95']:.2f} с, "
+                      f"максимум {item['max']:.2f} с, таймаутов {item['timeouts']}")
+        
+        # Какие стратегии поиска карточек реально срабатывают на каждом сайте
+        discovery_summary = discovery_stats.summary()
+        if discovery_summary:
+            print("Стратегии поиска карточек товаров:")
+            for site, hits in discovery_summary.items():
+                print(f"  - {site}: " + ", ".join(f"{name} {count}" for name, count in hits.items()))
+        
+        return bunjang_count + fruits_count
+    
+    async def _next_batch(self, queue: asyncio.Queue) -> Optional[List[Product]]:
+        """Дождаться хотя бы одного товара и забрать все, что уже лежит в очереди (None - парсинг закончен)"""
+        product = await queue.get()
+        if product is None:
+            return None
+        batch = [product]
+        while not queue.empty():
+            product = queue.get_nowait()
+            if product is None:
+                # Конец потока - вернем его в очередь для следующего вызова
+                queue.put_nowait(None)
+                break
+            batch.append(product)
+        return batch
+    
+    @staticmethod
+    def _price_drop_header(change: PriceChange) -> str:
+        """Первая строка уведомления о снижении цены"""
+        return (f"📉 Цена снижена на {price_drop_percent(change):.0f}%: "
+                f"{format_minor_units(change.old_amount, change.currency)} → "
+                f"{format_minor_units(change.new_amount, change.currency)} {change.currency or ''}").rstrip()
+    
     async def parse_and_send(self):
-        """Парсинг и отправка новых товаров с обоих сайтов"""
+        """Парсинг и отправка новых товаров с обоих сайтов: конвейер, товар отправляется, как только
+        разобран и проверен по базе, не дожидаясь самого медленного бренда"""
         print("Начало парсинга...")
         
+        scrape_task = None
         try:
             # Получаем список подписанных пользователей
-            user_ids = self.db.get_subscribed_users()
+            user_ids = await self.db.get_subscribed_users()
             
             if not user_ids:
                 print("Нет подписанных пользователей")
@@ -262,217 +447,114 @@ class BunjangBot:
             
             print(f"Найдено {len(user_ids)} подписанных пользователей")
             
-            all_products = []
-            
-            # 1. Парсим товары с Bunjang для всех брендов из config
-            print("Парсинг Bunjang Global...")
-            try:
-                bunjang_products = []
-                # Парсим товары для каждого бренда из списка
-                for brand_info in config.BRANDS_TO_PARSE:
-                    brand_name = brand_info['name']
-                    category = brand_info.get('category')
-                    
-                    # Формируем поисковый запрос
-                    if category == 'shoes':
-                        # Для обуви используем специальную категорию
-                        search_url = f"https://globalbunjang.com/search?categoryId=405&q={brand_name.replace(' ', '%20')}&soldout=exclude"
-                    else:
-                        search_url = f"https://globalbunjang.com/search?q={brand_name.replace(' ', '%20')}&soldout=exclude"
-                    
-                    print(f"  Парсинг бренда: {brand_name}...")
-                    brand_products = self.bunjang_parser.parse_products_from_search(search_url, limit=10)
-                    if brand_products:
-                        bunjang_products.extend(brand_products)
-                        print(f"  Найдено {len(brand_products)} товаров бренда {brand_name}")
-                
-                if bunjang_products:
-                    all_products.extend(bunjang_products)
-                    print(f"Всего найдено {len(bunjang_products)} товаров на Bunjang")
-            except Exception as e:
-                print(f"Ошибка при парсинге Bunjang: {e}")
-                import traceback
-                traceback.print_exc()
-            
-            # 2. Парсим товары с FruitsFamily по конкретным ссылкам для каждого бренда
-            print("Парсинг FruitsFamily...")
-            try:
-                fruits_products = []
-                # Парсим товары для каждого бренда из списка по конкретным ссылкам
-                for brand_info in config.BRANDS_TO_PARSE:
-                    brand_name = brand_info['name']
-                    print(f"  Парсинг бренда: {brand_name}...")
-                    
-                    # Используем конкретную ссылку для бренда из config
-                    brand_url = config.FRUITS_BRAND_URLS.get(brand_name.lower())
-                    if brand_url:
-                        print(f"    URL: {brand_url}")
-                        brand_products = self.fruits_parser.parse_products(url=brand_url, limit=20)
-                    else:
-                        # Если ссылки нет, используем поиск (резервный вариант)
-                        print(f"    Ссылка для бренда {brand_name} не найдена в config, используем поиск")
-                        search_query = brand_name
-                        brand_products = self.fruits_parser.parse_products_from_search(search_query=search_query, limit=10)
-                    
-                    if brand_products:
-                        fruits_products.extend(brand_products)
-                        # Проверяем, что товары имеют необходимые поля
-                        valid_products = [p for p in brand_products if p.get('link') and p.get('title')]
-                        if len(valid_products) < len(brand_products):
-                            print(f"  ВНИМАНИЕ: {len(brand_products) - len(valid_products)} товаров без ссылки или названия")
-                        print(f"  Найдено {len(brand_products)} товаров бренда {brand_name} (валидных: {len(valid_products)})")
-                    else:
-                        print(f"  Товары не найдены для бренда {brand_name}")
-                
-                if fruits_products:
-                    # Дедупликация товаров FruitsFamily по ссылке (один товар может быть на разных страницах брендов)
-                    seen_links = set()
-                    unique_fruits_products = []
-                    duplicates_count = 0
-                    
-                    for product in fruits_products:
-                        link = product.get('link', '')
-                        if link:
-                            # Используем ссылку как уникальный идентификатор
-                            if link not in seen_links:
-                                seen_links.add(link)
-                                unique_fruits_products.append(product)
-                            else:
-                                duplicates_count += 1
-                        else:
-                            # Если нет ссылки, используем название для дедупликации
-                            title = product.get('title', '').lower().strip()
-                            if title and title not in seen_links:
-                                seen_links.add(title)
-                                unique_fruits_products.append(product)
-                            else:
-                                duplicates_count += 1
-                    
-                    if duplicates_count > 0:
-                        print(f"  Удалено {duplicates_count} дубликатов товаров FruitsFamily")
-                    
-                    all_products.extend(unique_fruits_products)
-                    valid_fruits = [p for p in unique_fruits_products if p.get('link') and p.get('title')]
-                    print(f"Всего найдено {len(unique_fruits_products)} уникальных товаров на FruitsFamily (валидных: {len(valid_fruits)})")
-                    if len(valid_fruits) < len(unique_fruits_products):
-                        print(f"  ВНИМАНИЕ: {len(unique_fruits_products) - len(valid_fruits)} товаров FruitsFamily без ссылки или названия!")
-                    
-                    # Временная отладка: сохраняем первые несколько товаров для проверки
-                    if valid_fruits:
-                        print(f"  Примеры товаров FruitsFamily:")
-                        for i, p in enumerate(valid_fruits[:3], 1):
-                            print(f"    {i}. {p.get('title', 'Без названия')[:50]}")
-                            print(f"       Ссылка: {p.get('link', 'Нет ссылки')[:80]}")
-                            print(f"       Цена: {p.get('price', 'Нет цены')}")
-                else:
-                    print("  ВНИМАНИЕ: Не найдено ни одного товара на FruitsFamily!")
-            except Exception as e:
-                print(f"Ошибка при парсинге FruitsFamily: {e}")
-                import traceback
-                traceback.print_exc()
+            # Потоки парсинга кладут товары в очередь event loop, None - парсинг обоих сайтов закончен
+            loop = asyncio.get_running_loop()
+            queue = asyncio.Queue()
             
-            if not all_products:
-                print("Товары не найдены")
-                return
+            def emit(product: Product):
+                loop.call_soon_threadsafe(queue.put_nowait, product)
             
-            # Финальная дедупликация всех товаров по ссылке (на случай, если один товар есть на обоих сайтах)
-            seen_all_links = set()
-            unique_all_products = []
-            for product in all_products:
-                link = product.get('link', '')
-                if link and link not in seen_all_links:
-                    seen_all_links.add(link)
-                    unique_all_products.append(product)
-                elif not link:
-                    # Если нет ссылки, используем название
-                    title = product.get('title', '').lower().strip()
-                    if title and title not in seen_all_links:
-                        seen_all_links.add(title)
-                        unique_all_products.append(product)
+            scrape_task = asyncio.create_task(self.scrape_all_sites(emit))
+            scrape_task.add_done_callback(lambda _: queue.put_nowait(None))
             
-            if len(unique_all_products) < len(all_products):
-                print(f"Удалено {len(all_products) - len(unique_all_products)} дубликатов между сайтами")
+            # Используем первый доступный парсер для форматирования (оба имеют одинаковый метод)
+            parser_for_format = self.bunjang_parser if hasattr(self.bunjang_parser, 'format_product_message') else self.fruits_parser
             
-            all_products = unique_all_products
+            seen_keys = set()
+            found = {Site.BUNJANG: 0, Site.FRUITS: 0}
+            sent = {Site.BUNJANG: 0, Site.FRUITS: 0}
+            new_fruits = 0
+            duplicates_count = 0
+            sent_total = 0
+            price_alerts = 0
+            filter_stats = self.db.new_filter_stats()
             
-            print(f"Всего найдено {len(all_products)} уникальных товаров")
+            while True:
+                batch = await self._next_batch(queue)
+                if batch is None:
+                    break
+                
+                # Дедупликация по (сайт, ID объявления): один товар бывает на нескольких страницах брендов
+                unique_batch = []
+                for product in batch:
+                    key = product.key
+                    if not key or key in seen_keys:
+                        duplicates_count += 1
+                        continue
+                    seen_keys.add(key)
+                    unique_batch.append(product)
+                    if product.site in found:
+                        found[product.site] += 1
+                
+                if not unique_batch:
+                    continue
+                # Цены пачки сравниваются с историей и сохраняются в любом случае, даже сверх лимита отправки
+                price_changes = await self.db.record_prices(unique_batch) if config.PRICE_HISTORY_ENABLED else []
+                
+                # Лимит отправки на цикл исчерпан - дочитываем очередь только ради статистики
+                if sent_total >= config.MAX_PRODUCTS_PER_MESSAGE:
+                    continue
+                
+                # Фильтруем только новые товары (которых нет в базе или они еще не отправлены)
+                new_products = await self.db.get_new_products(unique_batch, max_age_hours=config.NEW_PRODUCTS_MAX_AGE_HOURS,
+                                                              stats=filter_stats)
+                new_fruits += sum(1 for p in new_products if p.site is Site.FRUITS)
+                
+                delivered = []
+                try:
+                    for product in new_products:
+                        if sent_total >= config.MAX_PRODUCTS_PER_MESSAGE:
+                            break
+                        # Отправляем новый товар всем подписчикам сразу
+                        sent_count = await self.bot.send_product_to_all_users(user_ids, product, parser_for_format)
+                        if sent_count:
+                            sent_total += 1
+                            if product.site in sent:
+                                sent[product.site] += 1
+                            delivered.append(product)
+                        # Задержка между товарами
+                        await asyncio.sleep(1)
+                finally:
+                    # Доставленные товары пачки сохраняем и отмечаем отправленными одной транзакцией
+                    await self.db.record_sent(delivered)
+                
+                # Новые товары только что отправлены с актуальной ценой - уведомляем об остальных
+                new_keys = {product.key for product in new_products}
+                for change in price_changes:
+                    if price_alerts >= config.PRICE_ALERTS_PER_CYCLE:
+                        break
+                    if change.product.key in new_keys or price_drop_percent(change) < config.PRICE_DROP_ALERT_PERCENT:
+                        continue
+                    if await self.bot.send_product_to_all_users(user_ids, change.product, parser_for_format,
+                                                                header=self._price_drop_header(change)):
+                        price_alerts += 1
+                    await asyncio.sleep(1)
             
-            # Подсчитываем товары по источникам для отладки
-            bunjang_count = sum(1 for p in all_products if 'globalbunjang.com' in p.get('link', ''))
-            fruits_count = sum(1 for p in all_products if 'fruitsfamily.com' in p.get('link', ''))
-            print(f"  - С Bunjang: {bunjang_count} товаров")
-            print(f"  - С FruitsFamily: {fruits_count} товаров")
+            await scrape_task
             
-            # Фильтруем только новые товары (которых нет в базе или они еще не отправлены)
-            new_products = self.db.get_new_products(all_products, max_age_hours=config.NEW_PRODUCTS_MAX_AGE_HOURS)
+            if duplicates_count > 0:
+                print(f"Удалено {duplicates_count} дубликатов")
+            print(f"Всего найдено {len(seen_keys)} уникальных товаров")
+            print(f"  - С Bunjang: {found[Site.BUNJANG]} товаров")
+            print(f"  - С FruitsFamily: {found[Site.FRUITS]} товаров")
+            self.db.print_filter_stats(filter_stats)
+            if price_alerts:
+                print(f"Отправлено уведомлений о снижении цены: {price_alerts}")
             
-            if not new_products:
+            if not seen_keys:
+                print("Товары не найдены")
+                return
+            if not filter_stats['new']:
                 print("Новых товаров не найдено")
                 # Отладочная информация
-                print(f"  Все {len(all_products)} товаров были отфильтрованы как старые или уже отправленные")
+                print(f"  Все {len(seen_keys)} товаров были отфильтрованы как старые или уже отправленные")
                 return
             
-            # Подсчитываем новые товары по источникам
-            new_bunjang = sum(1 for p in new_products if 'globalbunjang.com' in p.get('link', ''))
-            new_fruits = sum(1 for p in new_products if 'fruitsfamily.com' in p.get('link', ''))
-            print(f"Найдено {len(new_products)} новых товаров (только что обнаружено)")
-            print(f"  - С Bunjang: {new_bunjang} новых")
-            print(f"  - С FruitsFamily: {new_fruits} новых")
-            
-            # Если есть новые товары FruitsFamily, показываем примеры
-            if new_fruits > 0:
-                fruits_new = [p for p in new_products if 'fruitsfamily.com' in p.get('link', '')]
-                print(f"  Примеры новых товаров FruitsFamily для отправки:")
-                for i, p in enumerate(fruits_new[:3], 1):
-                    print(f"    {i}. {p.get('title', 'Без названия')[:50]}")
+            print(f"Отправлено {sent_total} новых товаров пользователям:")
+            print(f"  - С Bunjang: {sent[Site.BUNJANG]}")
+            print(f"  - С FruitsFamily: {sent[Site.FRUITS]}")
             
-            # Ограничиваем количество для отправки
-            products_to_send = new_products[:config.MAX_PRODUCTS_PER_MESSAGE]
-            
-            # Проверяем, сколько товаров FruitsFamily будет отправлено
-            fruits_to_send = sum(1 for p in products_to_send if 'fruitsfamily.com' in p.get('link', ''))
-            if fruits_to_send > 0:
-                print(f"Будет отправлено {fruits_to_send} товаров с FruitsFamily из {len(products_to_send)} товаров")
-            
-            # Отправляем новые товары всем подписчикам
-            # Используем первый доступный парсер для форматирования (оба имеют одинаковый метод)
-            parser_for_format = self.bunjang_parser if hasattr(self.bunjang_parser, 'format_product_message') else self.fruits_parser
-            sent_count = await self.bot.send_products_to_all_users(
-                user_ids,
-                products_to_send,
-                parser_for_format,
-                max_per_batch=config.MAX_PRODUCTS_PER_MESSAGE
-            )
-            
-            # Сохраняем отправленные товары в БД и отмечаем как отправленные
-            fruits_sent = 0
-            bunjang_sent = 0
-            
-            for i, product in enumerate(products_to_send):
-                if i >= sent_count:
-                    break
-                
-                # Подсчитываем по источникам
-                if 'fruitsfamily.com' in product.get('link', ''):
-                    fruits_sent += 1
-                elif 'globalbunjang.com' in product.get('link', ''):
-                    bunjang_sent += 1
-                    
-                # Сначала добавляем/обновляем товар в базе
-                self.db.add_product(product, mark_as_sent=False)
-                
-                # Затем отмечаем как отправленный
-                import hashlib
-                product_id = product.get('link', product.get('title', ''))
-                if product_id:
-                    product_id_hash = hashlib.md5(product_id.encode()).hexdigest()
-                    self.db.mark_as_sent(product_id_hash)
-            
-            print(f"Отправлено {sent_count} новых товаров пользователям:")
-            print(f"  - С Bunjang: {bunjang_sent}")
-            print(f"  - С FruitsFamily: {fruits_sent}")
-            
-            if fruits_sent == 0 and new_fruits > 0:
+            if sent[Site.FRUITS] == 0 and new_fruits > 0:
                 print(f"  ВНИМАНИЕ: Найдено {new_fruits} новых товаров FruitsFamily, но ни один не был отправлен!")
                 print(f"  Возможно, они были отфильтрованы при отправке или превышен лимит MAX_PRODUCTS_PER_MESSAGE")
             
@@ -481,6 +563,9 @@ class BunjangBot:
             import traceback
             traceback.print_exc()
             # НЕ отправляем ошибки пользователям - только логируем
+        finally:
+            if scrape_task is not None and not scrape_task.done():
+                scrape_task.cancel()
     
     
     async def setup_handlers(self):
@@ -517,6 +602,8 @@ class BunjangBot:
         
         # Запускаем планировщик парсинга
         asyncio.create_task(self.run_scheduler_async())
+        # Задача хранения: перенос старых товаров в архив и возврат места в файле базы
+        asyncio.create_task(self.run_maintenance_async())
         
         print(f"Парсинг будет выполняться каждые {config.PARSING_INTERVAL} секунд")
         
@@ -527,8 +614,13 @@ class BunjangBot:
             print("\nОстановка бота...")
             await self.application.stop()
             await self.application.shutdown()
+            await fetcher.close()
             self.bunjang_parser.close()
             self.fruits_parser.close()
+            self.driver_pool.close()
+            parse_worker.shutdown()
+            self.scrape_executor.shutdown(wait=False)
+            self.db.close()
     
     async def run_scheduler_async(self):
         """Асинхронный планировщик"""
@@ -547,6 +639,28 @@ class BunjangBot:
             else:
                 print("Парсинг остановлен пользователем, пропускаю...")
 
+    async def run_maintenance_async(self):
+        """Фоновое обслуживание базы: короткие транзакции в потоке, между ними цикл событий свободен"""
+        while True:
+            await asyncio.sleep(config.DB_RETENTION_INTERVAL)
+            try:
+                archived = 0
+                while True:
+                    count = await self.db.archive_old_products()
+                    if not count:
+                        break
+                    archived += count
+                    await asyncio.sleep(0)
+                # Освобожденные страницы отдаем порциями, чтобы не держать блокировку записи надолго
+                free_pages = await self.db.incremental_vacuum()
+                while free_pages:
+                    await asyncio.sleep(config.DB_VACUUM_PAUSE)
+                    free_pages = await self.db.incremental_vacuum()
+                if archived:
+                    print(f"Обслуживание базы: {archived} старых товаров убрано из products")
+            except Exception as e:
+                print(f"Ошибка обслуживания базы: {e}")
+
 def main():
     # Проверка конфигурации
     if not config.TELEGRAM_BOT_TOKEN:
@@ -564,6 +678,10 @@ def main():
         print("\nОстановка бота...")
         bot.bunjang_parser.close()
         bot.fruits_parser.close()
+        bot.driver_pool.close()
+        bot.scrape_executor.shutdown(wait=False)
+        parse_worker.shutdown()
+        bot.db.close()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,67 @@
+"""
+Перехват JSON-ответов (XHR/fetch) страницы через performance-лог Chrome и CDP
+"""
+import base64
+import json
+from typing import List
+import config
+
+
+def enable_capture(chrome_options):
+    """Включить performance-лог в опциях Chrome (нужно при создании драйвера)"""
+    chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    chrome_options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
+
+
+def reset_capture(driver):
+    """Сбросить накопленный лог (драйверы из пула уже загружали другие страницы)"""
+    try:
+        driver.get_log('performance')
+    except Exception:
+        pass
+
+
+def captured_json_responses(driver, site: str) -> List:
+    """JSON-ответы, загруженные страницей с момента reset_capture, по шаблонам URL сайта"""
+    patterns = config.SELENIUM_XHR_PATTERNS.get(site, [])
+    try:
+        entries = driver.get_log('performance')
+    except Exception as e:
+        print(f"  Не удалось прочитать performance-лог: {e}")
+        return []
+
+    candidates = {}  # requestId -> url
+    finished = set()
+    for entry in entries:
+        try:
+            message = json.loads(entry['message'])['message']
+        except (KeyError, ValueError):
+            continue
+        method = message.get('method')
+        params = message.get('params', {})
+        if method == 'Network.responseReceived':
+            response = params.get('response', {})
+            url = response.get('url', '')
+            if 'json' not in (response.get('mimeType') or ''):
+                continue
+            if patterns and not any(pattern in url for pattern in patterns):
+                continue
+            candidates[params.get('requestId')] = url
+        elif method == 'Network.loadingFinished':
+            finished.add(params.get('requestId'))
+
+    payloads = []
+    for request_id, url in candidates.items():
+        if request_id not in finished:
+            continue
+        try:
+            body = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+            text = body.get('body', '')
+            if body.get('base64Encoded'):
+                text = base64.b64decode(text)
+            payloads.append(json.loads(text))
+        except Exception as e:
+            print(f"  Не удалось получить тело ответа {url[:80]}: {e}")
+    if payloads:
+        print(f"  Перехвачено {len(payloads)} JSON-ответов страницы")
+    return payloads
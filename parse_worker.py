@@ -0,0 +1,98 @@
+"""
+Разбор HTML страниц в пуле процессов: в процесс передаются только байты страницы и идентификатор сайта,
+обратно возвращаются компактные записи товаров (деревья HTML не сериализуются)
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import config
+from card_discovery import stats as discovery_stats
+from selector_cache import selector_cache
+
+# Поля записи товара, которую процесс возвращает вместо словаря
+RECORD_FIELDS = ('title', 'link', 'price', 'price_amount', 'currency', 'image', 'description', 'brand', 'category')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Парсеры внутри процесса-обработчика: (сайт, бренды) -> парсер
+_worker_parsers = {}
+
+
+def to_record(product: Dict) -> Tuple:
+    return tuple(product.get(field) for field in RECORD_FIELDS)
+
+
+def from_record(record: Tuple) -> Dict:
+    return {field: value for field, value in zip(RECORD_FIELDS, record) if value is not None}
+
+
+def _worker_parser(site: str, base_url: str, brands_filter: Tuple):
+    """Парсер без сети и Selenium, создается один раз на процесс"""
+    key = (site, base_url, brands_filter)
+    parser = _worker_parsers.get(key)
+    if parser is None:
+        # Кэш стратегий в процессе - только копия: актуальные стратегии страницы приходят с каждой задачей,
+        # выученное возвращается основному процессу вместе с товарами
+        selector_cache.persist = False
+        from parser import BunjangParser, FruitsFamilyParser
+        brands = [{'name': name, 'category': category} for name, category in brands_filter]
+        if site == BunjangParser.SITE:
+            parser = BunjangParser(base_url, use_selenium=False, brands_filter=brands, use_api=False)
+        elif site == FruitsFamilyParser.SITE:
+            parser = FruitsFamilyParser(base_url, use_selenium=False, brands_filter=brands, use_embedded_state=False)
+        else:
+            raise ValueError(f"Неизвестный сайт: {site}")
+        _worker_parsers[key] = parser
+    return parser
+
+
+def _parse_page_worker(site: str, base_url: str, brands_filter: Tuple, html, url: str, limit: int,
+                       options: Dict, cache_state: Tuple) -> Tuple[List[Tuple], Dict, List[Tuple]]:
+    """Выполняется в процессе-обработчике: товары страницы, статистика стратегий поиска карточек
+    и изменения кэша стратегий. cache_state - стратегии страницы из основного процесса (SelectorCache.page_state)"""
+    parser = _worker_parser(site, base_url, brands_filter)
+    selector_cache.apply_page_state(site, url, cache_state)
+    products = parser.parse_html_page(html, url, limit, **options)
+    return [to_record(product) for product in products], discovery_stats.drain(), selector_cache.drain()
+
+
+def get_pool() -> Optional[ProcessPoolExecutor]:
+    """Общий пул процессов (None, если разбор в процессах отключен)"""
+    global _pool
+    if config.PARSE_PROCESSES <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn, а не fork: в основном процессе уже работают потоки и event loop
+            _pool = ProcessPoolExecutor(max_workers=config.PARSE_PROCESSES,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def parse_page_in_pool(parser, html, url: str, limit: int, **options) -> List[Dict]:
+    """Разобрать страницу в пуле процессов (блокирует вызывающий поток до результата).
+    options передаются в parser.parse_html_page. Без пула или при сбое процесса страница разбирается в текущем потоке"""
+    pool = get_pool()
+    if pool is not None:
+        brands_filter = tuple((brand['name'], brand.get('category')) for brand in parser.brands_filter)
+        try:
+            cache_state = selector_cache.page_state(parser.SITE, url)
+            records, hits, learned = pool.submit(_parse_page_worker, parser.SITE, parser.base_url, brands_filter,
+                                                 html, url, limit, options, cache_state).result()
+            discovery_stats.merge(hits)
+            selector_cache.merge(learned)
+            return [from_record(record) for record in records]
+        except Exception as e:
+            print(f"  Ошибка разбора страницы в пуле процессов, разбираем в текущем потоке: {e}")
+    return parser.parse_html_page(html, url, limit, **options)
+
+
+def shutdown():
+    """Остановить пул процессов"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
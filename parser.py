@@ -1,26 +1,153 @@
 import requests
-from bs4 import BeautifulSoup
-import time
+import asyncio
 import json
-from typing import List, Dict, Optional
-from urllib.parse import urljoin
-import re
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urljoin, urlparse, parse_qs, urlencode
+import config
+from fetcher import fetcher, AIOHTTP_AVAILABLE
+from selenium_pool import SELENIUM_AVAILABLE, DriverPool, apply_lean_render
+from readiness import wait_until_ready
+from embedded_state import extract_state_json, products_from_json
+from network_capture import reset_capture, captured_json_responses
+from html_backend import HtmlNode, parse_html
+from card_discovery import CardStrategy, ContainerLinkStrategy
+from selector_cache import FieldStrategy, PageStrategies, first_match, selector_cache
+from price import PRICE_RE, PriceMatch, extract_prices, find_price, parse_price
+from brand_matcher import BrandMatch, BrandMatcher, apply_brand_match
+from parse_worker import parse_page_in_pool
+from product import Product, Site
+
+
+def _bunjang_card_href(href: str) -> bool:
+    """Ссылка на товар Bunjang (не категория и не поиск)"""
+    return '/category/' not in href and '/search' not in href
+
+
+def _fruits_card_href(href: str) -> bool:
+    return '/product/' in href
+
+
+def _fruits_container_href(href: str) -> bool:
+    return '/product/' in href or '/item/' in href or '/goods/' in href or '/brand/' in href
+
+
+def _title_from_element(elem) -> Optional[str]:
+    """Название из найденного элемента: alt у картинки, иначе текст (короче 4 символов - не название)"""
+    if not elem:
+        return None
+    if elem.name == 'img':
+        title = elem.get('alt', '').strip()
+    else:
+        title = elem.get_text(strip=True)
+    return title if title and len(title) > 3 else None
+
+
+# Цена карточки еще не посчитана пачкой (parse_product_card вызван не из parse_html_page)
+_NOT_COMPUTED = object()
+
+
+def _card_texts(cards: List) -> Tuple[List[str], List[Optional[PriceMatch]]]:
+    """Тексты карточек страницы и первая цена с валютой в каждом - один проход регулярного выражения на страницу"""
+    texts = [card.get_text(separator=' ', strip=True) for card in cards]
+    return texts, extract_prices(texts)
+
+
+def _with_card_price(strategies: List[FieldStrategy], name: str, card_price) -> List[FieldStrategy]:
+    """Стратегии цены, где стратегия name (поиск цены в тексте карточки) отдает цену, посчитанную пачкой"""
+    if card_price is _NOT_COMPUTED:
+        return strategies
+    return [FieldStrategy(name, lambda card, text: card_price) if strategy.name == name else strategy
+            for strategy in strategies]
+
+
+def _price_from_result(result) -> Optional[PriceMatch]:
+    """Цена из результата стратегии: PriceMatch, элемент или текстовая строка.
+    Текст элемента сохраняется как есть, даже если суммы в нем нет"""
+    if not result:
+        return None
+    if isinstance(result, PriceMatch):
+        return result
+    text = result.get_text(strip=True) if hasattr(result, 'get_text') else str(result).strip()
+    if not text:
+        return None
+    # Оба сайта корейские: число без валюты - воны
+    price = parse_price(text, default_currency='KRW')
+    return PriceMatch(price.amount, price.currency, text) if price else PriceMatch(None, None, text)
+
+
+def _set_price(product: Dict, price: Optional[PriceMatch]):
+    """Цена в словаре товара: исходный текст, а также сумма и валюта, если распознаны"""
+    if not price:
+        return
+    product['price'] = price.raw[:50]  # Ограничиваем длину
+    if price.amount is not None:
+        product['price_amount'] = price.amount
+        product['currency'] = price.currency
 
-try:
-    from selenium import webdriver
-    from selenium.webdriver.chrome.options import Options
-    from selenium.webdriver.common.by import By
-    from selenium.webdriver.support.ui import WebDriverWait
-    from selenium.webdriver.support import expected_conditions as EC
-    SELENIUM_AVAILABLE = True
-except ImportError:
-    SELENIUM_AVAILABLE = False
 
 class BunjangParser:
-    def __init__(self, base_url: str = 'https://globalbunjang.com/', use_selenium: bool = False, brands_filter: List[Dict] = None):
+    SITE = 'bunjang'
+    
+    # Стратегии поиска карточек товаров в порядке приоритета (см. card_discovery)
+    CARD_STRATEGIES = [
+        # По классам с product/item
+        CardStrategy('div_class', ('div',), ('product', 'item', 'card')),
+        CardStrategy('article_class', ('article',), ('product', 'item')),
+        CardStrategy('link_class', ('a',), ('product', 'item')),
+        # По структуре - ссылки с изображениями и текстом (исключаем категории)
+        CardStrategy('link_with_image', ('a',), href_filter=_bunjang_card_href),
+        # По data-атрибутам
+        CardStrategy('data_product_id', ('div', 'article'), attr='data-product-id'),
+        CardStrategy('data_item_id', ('div', 'article'), attr='data-item-id'),
+        # Ссылки внутри контейнеров-списков (исключаем категории)
+        ContainerLinkStrategy('container_links', ('div', 'section', 'article'),
+                              ('list', 'grid', 'container', 'products', 'items'),
+                              _bunjang_card_href, ('div', 'article')),
+    ]
+    SEARCH_CARD_STRATEGIES = CARD_STRATEGIES[:4]
+    
+    # Слова в названии, по которым карточка считается категорией или навигацией, а не товаром
+    EXCLUDE_WORDS = ['arrow', 'more', 'category', 'search', 'home', 'menu', 'cart',
+                     'boy group', 'girl group', "men's style", "women's", 'pokémon',
+                     'rare figures', 'authentic', 'certified', 'luxury', 'icon_exit',
+                     'korean site', 'let\'s talk', 'trending', 'popular', 'top']
+    
+    # Стратегии поиска названия в карточке в порядке приоритета (выученная пробуется первой, см. selector_cache)
+    TITLE_STRATEGIES = [
+        # По классам
+        FieldStrategy('heading_class', lambda card, text: card.find(['h1', 'h2', 'h3', 'h4', 'h5'], class_=lambda c: c and ('title' in c.lower() or 'name' in c.lower()))),
+        FieldStrategy('text_class', lambda card, text: card.find(['div', 'span', 'p'], class_=lambda c: c and ('title' in c.lower() or 'name' in c.lower()))),
+        # По атрибутам
+        FieldStrategy('data_title', lambda card, text: card.find(['div', 'span', 'p'], attrs={'data-title': True})),
+        # Просто любой заголовок
+        FieldStrategy('heading', lambda card, text: card.find(['h1', 'h2', 'h3', 'h4', 'h5'])),
+        # Текст из ссылки
+        FieldStrategy('link_text', lambda card, text: card.find('a', href=True)),
+        # Alt текст изображения
+        FieldStrategy('image_alt', lambda card, text: card.find('img', alt=True)),
+    ]
+    
+    # Стратегии поиска цены в карточке
+    PRICE_STRATEGIES = [
+        # По классам
+        FieldStrategy('price_class', lambda card, text: card.find(['span', 'div', 'p', 'strong', 'b'], class_=lambda c: c and 'price' in c.lower())),
+        # Текстовый узел с суммой и валютой (символ или слово, до или после числа)
+        FieldStrategy('currency_text', lambda card, text: find_price(card.find(string=PRICE_RE))),
+        # Цена в любом месте текста карточки
+        FieldStrategy('card_text', lambda card, text: find_price(text)),
+    ]
+    
+    def __init__(self, base_url: str = 'https://globalbunjang.com/', use_selenium: bool = False, brands_filter: List[Dict] = None,
+                 driver_pool: DriverPool = None, use_api: bool = True):
         self.base_url = base_url
         self.use_selenium = use_selenium and SELENIUM_AVAILABLE
+        # Поиск через JSON API (тот же, что использует страница поиска); HTML - запасной вариант
+        self.use_api = use_api
         self.brands_filter = brands_filter or []
+        # Бренды, категории и стоп-слова проверяются одним автоматом
+        self.brand_matcher = BrandMatcher(self.brands_filter, category_keywords=config.CATEGORY_KEYWORDS,
+                                          exclude_words=self.EXCLUDE_WORDS)
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -30,84 +157,73 @@ class BunjangParser:
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
         })
-        self.driver = None
+        # Пул Selenium драйверов: общий (передан снаружи) или собственный
+        self._owns_driver_pool = driver_pool is None
+        self.driver_pool = driver_pool or DriverPool(user_agent=self.session.headers['User-Agent'])
     
-    def get_page_selenium(self, url: str) -> Optional[BeautifulSoup]:
+    def get_page_selenium(self, url: str) -> Optional[HtmlNode]:
         """Получить HTML страницы с помощью Selenium"""
+        html, _ = self.render_page_source(url)
+        return parse_html(html)
+    
+    def render_page_source(self, url: str, limit: int = None) -> Tuple[Optional[str], List[Dict]]:
+        """Загрузить страницу через Selenium и вернуть ее HTML (page_source). Если задан limit и включен
+        перехват XHR, товары берутся из JSON-ответов страницы, и HTML тогда не нужен"""
         if not SELENIUM_AVAILABLE:
-            return None
+            return None, []
         
+        with self.driver_pool.driver() as driver:
+            if driver is None:
+                return None, []
+            return self._load_page_selenium(driver, url, limit)
+    
+    def _products_from_payloads(self, payloads: List, limit: int) -> List[Dict]:
+        """Товары из перехваченных ответов API поиска"""
+        products = []
+        for payload in payloads:
+            products.extend(self.parse_api_response(payload, limit - len(products)) or [])
+            if len(products) >= limit:
+                break
+        return products
+    
+    def _load_page_selenium(self, driver, url: str, limit: int = None) -> Tuple[Optional[str], List[Dict]]:
+        """Загрузка страницы драйвером, взятым из пула"""
+        capture_xhr = limit is not None and config.SELENIUM_CAPTURE_XHR
         try:
-            if not self.driver:
-                print("  Инициализация Selenium драйвера...")
-                try:
-                    chrome_options = Options()
-                    chrome_options.add_argument('--headless')
-                    chrome_options.add_argument('--no-sandbox')
-                    chrome_options.add_argument('--disable-dev-shm-usage')
-                    chrome_options.add_argument('--disable-gpu')
-                    chrome_options.add_argument('--window-size=1920,1080')
-                    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-                    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-                    chrome_options.add_experimental_option('useAutomationExtension', False)
-                    chrome_options.add_argument(f'user-agent={self.session.headers["User-Agent"]}')
-                    self.driver = webdriver.Chrome(options=chrome_options)
-                    print("  Selenium драйвер успешно инициализирован")
-                except Exception as e:
-                    print(f"  ОШИБКА при инициализации Selenium драйвера: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    return None
-            else:
-                # Проверяем, что драйвер еще работает
-                try:
-                    self.driver.current_url
-                except:
-                    print("  Драйвер не работает, пересоздаем...")
-                    try:
-                        self.driver.quit()
-                    except:
-                        pass
-                    self.driver = None
-                    # Пробуем создать заново
-                    chrome_options = Options()
-                    chrome_options.add_argument('--headless')
-                    chrome_options.add_argument('--no-sandbox')
-                    chrome_options.add_argument('--disable-dev-shm-usage')
-                    chrome_options.add_argument('--disable-gpu')
-                    chrome_options.add_argument('--window-size=1920,1080')
-                    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-                    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-                    chrome_options.add_experimental_option('useAutomationExtension', False)
-                    chrome_options.add_argument(f'user-agent={self.session.headers["User-Agent"]}')
-                    self.driver = webdriver.Chrome(options=chrome_options)
-                    print("  Selenium драйвер пересоздан")
-            
-            self.driver.get(url)
-            # Ждем загрузки контента
-            time.sleep(3)
+            apply_lean_render(driver, self.SITE)
+            if capture_xhr:
+                reset_capture(driver)
+            driver.get(url)
+            # Ждем появления карточек товаров (или пока DOM перестанет меняться)
+            wait_until_ready(driver, self.SITE, url)
             
             # Прокручиваем страницу для загрузки динамического контента
-            self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(2)
+            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+            wait_until_ready(driver, self.SITE, url, stage='scroll')
+            
+            if capture_xhr:
+                xhr_products = self._products_from_payloads(captured_json_responses(driver, self.SITE), limit)
+                if xhr_products:
+                    print(f"  Получено {len(xhr_products)} товаров из перехваченных XHR (HTML не разбирается)")
+                    return None, xhr_products
             
             try:
-                html = self.driver.page_source
+                html = driver.page_source
                 if not html or len(html) < 100:
                     print(f"  ВНИМАНИЕ: Получен пустой или очень короткий HTML ({len(html) if html else 0} символов)")
-                    return None
+                    return None, []
                 print(f"  HTML получен, размер: {len(html)} символов")
-                return BeautifulSoup(html, 'html.parser')
+                return html, []
             except Exception as e:
                 print(f"  ОШИБКА при получении HTML: {e}")
                 import traceback
                 traceback.print_exc()
-                return None
+                return None, []
         except Exception as e:
             print(f"Ошибка при получении страницы через Selenium {url}: {e}")
-            return None
+            return None, []
     
-    def get_page(self, url: str) -> Optional[BeautifulSoup]:
+    def get_page(self, url: str) -> Optional[HtmlNode]:
         """Получить HTML страницы"""
         if self.use_selenium:
             return self.get_page_selenium(url)
@@ -115,7 +231,7 @@ class BunjangParser:
         try:
             response = self.session.get(url, timeout=10)
             response.raise_for_status()
-            return BeautifulSoup(response.content, 'html.parser')
+            return parse_html(response.content)
         except Exception as e:
             print(f"Ошибка при получении страницы {url}: {e}")
             # Пробуем через Selenium если обычный запрос не сработал
@@ -124,45 +240,43 @@ class BunjangParser:
                 return self.get_page_selenium(url)
             return None
     
+    def _fetch_raw(self, url: str) -> Optional[bytes]:
+        """Загрузить сырые байты страницы через requests"""
+        try:
+            response = self.session.get(url, timeout=10)
+            response.raise_for_status()
+            return response.content
+        except Exception as e:
+            print(f"Ошибка при получении страницы {url}: {e}")
+            return None
+    
+    async def fetch_many(self, urls: List[str]) -> Dict[str, Optional[bytes]]:
+        """Асинхронно загрузить несколько страниц одновременно через общий пул соединений"""
+        if AIOHTTP_AVAILABLE:
+            return await fetcher.fetch_many(urls, headers=dict(self.session.headers))
+        # Без aiohttp загружаем через requests, каждую страницу в своем потоке
+        unique_urls = list(dict.fromkeys(urls))
+        results = await asyncio.gather(*(asyncio.to_thread(self._fetch_raw, url) for url in unique_urls))
+        return dict(zip(unique_urls, results))
+    
     def close(self):
-        """Закрыть Selenium драйвер"""
-        if self.driver:
-            self.driver.quit()
-            self.driver = None
+        """Закрыть Selenium драйверы (общий пул закрывает его владелец)"""
+        if self._owns_driver_pool:
+            self.driver_pool.close()
     
-    def parse_product_card(self, card_element) -> Optional[Dict]:
-        """Парсинг карточки товара"""
+    def parse_product_card(self, card_element, page: PageStrategies = None, card_text: str = None,
+                           card_price=_NOT_COMPUTED) -> Optional[Dict]:
+        """Парсинг карточки товара (page - стратегии страницы из selector_cache;
+        card_text и card_price - текст карточки и цена в нем, посчитанные для всей страницы, см. _card_texts)"""
         product = {}
+        title = None
         
         try:
             # Получаем весь текст из элемента для анализа
-            all_text = card_element.get_text(separator=' ', strip=True)
+            all_text = card_text if card_text is not None else card_element.get_text(separator=' ', strip=True)
             
             # Название товара - ищем в разных местах
-            title = None
-            title_selectors = [
-                # По классам
-                lambda x: x.find(['h1', 'h2', 'h3', 'h4', 'h5'], class_=lambda c: c and ('title' in c.lower() or 'name' in c.lower())),
-                lambda x: x.find(['div', 'span', 'p'], class_=lambda c: c and ('title' in c.lower() or 'name' in c.lower())),
-                # По атрибутам
-                lambda x: x.find(['div', 'span', 'p'], attrs={'data-title': True}),
-                # Просто любой заголовок
-                lambda x: x.find(['h1', 'h2', 'h3', 'h4', 'h5']),
-                # Текст из ссылки
-                lambda x: x.find('a', href=True),
-                # Alt текст изображения
-                lambda x: x.find('img', alt=True),
-            ]
-            
-            for selector in title_selectors:
-                elem = selector(card_element)
-                if elem:
-                    if elem.name == 'img':
-                        title = elem.get('alt', '').strip()
-                    else:
-                        title = elem.get_text(strip=True)
-                    if title and len(title) > 3:
-                        break
+            title = first_match('title', card_element, all_text, self.TITLE_STRATEGIES, _title_from_element, page)
             
             # Если не нашли через селекторы, берем первый значимый текст
             if not title or len(title) < 3:
@@ -183,18 +297,8 @@ class BunjangParser:
                 if len(words) > 2:
                     title = ' '.join(words[:10])  # Берем первые 10 слов
             
-            # Проверяем, что это не категория (исключаем общие слова)
+            # Проверяем, что это не категория (стоп-слова ищутся вместе с брендом, см. ниже)
             if title:
-                title_lower = title.lower()
-                # Исключаем категории и навигационные элементы
-                exclude_words = ['arrow', 'more', 'category', 'search', 'home', 'menu', 'cart', 
-                               'boy group', 'girl group', "men's style", "women's", 'pokémon',
-                               'rare figures', 'authentic', 'certified', 'luxury', 'icon_exit',
-                               'korean site', 'let\'s talk', 'trending', 'popular', 'top']
-                if any(word in title_lower for word in exclude_words):
-                    # Это скорее всего категория, пропускаем
-                    return None
-                
                 # Проверяем ссылку - если это категория или бренд, но не товар
                 link = product.get('link', '') or (card_element.find('a', href=True) and card_element.find('a', href=True).get('href', ''))
                 if link:
@@ -215,32 +319,10 @@ class BunjangParser:
                 product['link'] = urljoin(self.base_url, card_element.get('href'))
             
             # Цена - ищем в разных форматах
-            price = None
-            price_patterns = [
-                # По классам
-                lambda x: x.find(['span', 'div', 'p', 'strong', 'b'], class_=lambda c: c and 'price' in c.lower()),
-                # По тексту с символами валют
-                lambda x: x.find(string=re.compile(r'[₩$€£¥]\s*\d+[\d,.]*')),
-                lambda x: x.find(string=re.compile(r'\d+[\d,.]*\s*[₩$€£¥]')),
-                lambda x: x.find(string=re.compile(r'\d+[\d,.]*\s*(won|원|KRW|USD|EUR|USD)')),
-                # Любой текст с числами и валютными символами
-                lambda x: re.search(r'[₩$€£¥]\s*\d+[\d,.]*|\d+[\d,.]*\s*[₩$€£¥원]', all_text),
-            ]
+            price = first_match('price', card_element, all_text,
+                                _with_card_price(self.PRICE_STRATEGIES, 'card_text', card_price), _price_from_result, page)
             
-            for pattern in price_patterns:
-                result = pattern(card_element)
-                if result:
-                    if hasattr(result, 'group'):
-                        price = result.group(0).strip()
-                    elif hasattr(result, 'get_text'):
-                        price = result.get_text(strip=True)
-                    else:
-                        price = str(result).strip()
-                    if price:
-                        break
-            
-            if price:
-                product['price'] = price[:50]  # Ограничиваем длину
+            _set_price(product, price)
             
             # Изображение
             img_elem = card_element.find('img')
@@ -267,9 +349,13 @@ class BunjangParser:
             import traceback
             traceback.print_exc()
         
-        # Проверяем фильтр по брендам
-        if self.brands_filter and product.get('title'):
-            if not self._matches_brand_filter(product):
+        # Стоп-слова в названии и фильтр по брендам - за один проход по тексту
+        if title:
+            match = self._classify(product, title)
+            if match.excluded:
+                # Это скорее всего категория, пропускаем
+                return None
+            if self.brands_filter and product.get('title') and not match.brand:
                 return None
         
         # Возвращаем товар если есть хотя бы название или ссылка
@@ -286,38 +372,17 @@ class BunjangParser:
         
         return None
     
+    def _classify(self, product: Dict, title: str = None) -> BrandMatch:
+        """Бренд, категория и стоп-слова товара; найденные бренд и категория записываются в товар"""
+        match = self.brand_matcher.classify(title or product.get('title', ''), product.get('description', ''))
+        apply_brand_match(product, match)
+        return match
+    
     def _matches_brand_filter(self, product: Dict) -> bool:
         """Проверяет, соответствует ли товар фильтру брендов"""
         if not self.brands_filter:
             return True
-        
-        title = product.get('title', '').lower()
-        description = product.get('description', '').lower()
-        text_to_check = f"{title} {description}"
-        
-        for brand_info in self.brands_filter:
-            brand_name = brand_info['name'].lower()
-            category = brand_info.get('category')
-            
-            # Проверяем, содержит ли товар название бренда
-            if brand_name in text_to_check:
-                # Если указана категория (например, только обувь для maison margiela)
-                if category:
-                    category_keywords = {
-                        'shoes': ['shoe', 'sneaker', 'boot', 'sandal', 'slipper', 'loafer', 'oxford', 'heel', 'footwear', 'обувь', 'кроссовки', 'ботинки', 'sneakers', 'boots']
-                    }
-                    if category in category_keywords:
-                        # Проверяем, что это обувь
-                        keywords = category_keywords[category]
-                        if any(keyword in text_to_check for keyword in keywords):
-                            return True
-                        else:
-                            continue  # Бренд совпадает, но категория не подходит
-                else:
-                    # Категория не указана, бренд подходит
-                    return True
-        
-        return False
+        return self._classify(product).brand is not None
     
     def parse_products(self, category: str = None, limit: int = 20) -> List[Dict]:
         """Парсинг товаров с главной страницы или категории"""
@@ -340,56 +405,18 @@ class BunjangParser:
             if not soup:
                 return products
         
-        # Ищем карточки товаров - пробуем разные селекторы
-        product_cards = []
-        
-        # Селекторы для поиска товаров
-        selectors_to_try = [
-            # По классам с product/item
-            lambda s: s.find_all('div', class_=lambda x: x and ('product' in x.lower() or 'item' in x.lower() or 'card' in x.lower())),
-            lambda s: s.find_all('article', class_=lambda x: x and ('product' in x.lower() or 'item' in x.lower())),
-            lambda s: s.find_all('a', class_=lambda x: x and ('product' in x.lower() or 'item' in x.lower())),
-            # По структуре - ссылки с изображениями и текстом (исключаем категории)
-            lambda s: [elem for elem in s.find_all('a', href=True) 
-                      if elem.find('img') and elem.get_text(strip=True) and len(elem.get_text(strip=True)) > 10
-                      and '/category/' not in (elem.get('href', '') or '')
-                      and '/search' not in (elem.get('href', '') or '')],
-            # По data-атрибутам
-            lambda s: s.find_all(['div', 'article'], attrs={'data-product-id': True}),
-            lambda s: s.find_all(['div', 'article'], attrs={'data-item-id': True}),
-        ]
-        
-        for selector_func in selectors_to_try:
-            try:
-                product_cards = selector_func(soup)
-                if product_cards and len(product_cards) > 0:
-                    print(f"Найдено {len(product_cards)} потенциальных товаров")
-                    break
-            except:
-                continue
-        
-        # Если не нашли, ищем в контейнерах (исключаем категории)
-        if not product_cards:
-            containers = soup.find_all(['div', 'section', 'article'], class_=lambda x: x and (
-                'list' in x.lower() or 'grid' in x.lower() or 'container' in x.lower() or 
-                'products' in x.lower() or 'items' in x.lower()
-            ))
-            for container in containers:
-                links = container.find_all('a', href=True)
-                for link in links:
-                    href = link.get('href', '')
-                    # Пропускаем категории и поиск
-                    if '/category/' in href or '/search' in href:
-                        continue
-                    if link.find('img') and link.get_text(strip=True) and len(link.get_text(strip=True)) > 10:
-                        product_cards.append(link.parent if link.parent.name in ['div', 'article'] else link)
+        # Ищем карточки товаров - все стратегии за один обход страницы
+        page = selector_cache.page(self.SITE, url)
+        strategy, product_cards = page.discover_cards(soup, self.CARD_STRATEGIES)
+        if product_cards:
+            print(f"Найдено {len(product_cards)} потенциальных товаров (стратегия: {strategy})")
         
         # Парсим найденные карточки
         seen_titles = set()
         parsed_count = 0
         for card in product_cards[:limit * 3]:  # Берем больше, так как многие могут не распарситься
             parsed_count += 1
-            product = self.parse_product_card(card)
+            product = self.parse_product_card(card, page=page)
             if product and product.get('title'):
                 # Убираем дубликаты по названию
                 title_key = product['title'].lower().strip()
@@ -408,18 +435,12 @@ class BunjangParser:
             if selenium_soup:
                 # Повторяем парсинг с Selenium
                 selenium_products = []
-                selenium_cards = []
-                for selector_func in selectors_to_try:
-                    try:
-                        selenium_cards = selector_func(selenium_soup)
-                        if selenium_cards and len(selenium_cards) > 0:
-                            print(f"Найдено {len(selenium_cards)} элементов через Selenium")
-                            break
-                    except:
-                        continue
+                strategy, selenium_cards = page.discover_cards(selenium_soup, self.CARD_STRATEGIES)
+                if selenium_cards:
+                    print(f"Найдено {len(selenium_cards)} элементов через Selenium (стратегия: {strategy})")
                 
                 for card in selenium_cards[:limit * 2]:
-                    product = self.parse_product_card(card)
+                    product = self.parse_product_card(card, page=page)
                     if product and product.get('title'):
                         title_key = product['title'].lower().strip()
                         if title_key not in seen_titles and len(title_key) > 3:
@@ -431,6 +452,7 @@ class BunjangParser:
                 products.extend(selenium_products)
                 print(f"Через Selenium найдено еще {len(selenium_products)} товаров")
         
+        page.finish()
         return products[:limit]
     
     def parse_trending_products(self, limit: int = 10) -> List[Dict]:
@@ -492,46 +514,174 @@ class BunjangParser:
         
         return products[:limit]
     
-    def parse_products_from_search(self, search_url: str, limit: int = 20) -> List[Dict]:
-        """Парсинг товаров из результатов поиска"""
-        products = []
+    def api_url_for_search(self, search_url: str, limit: int = 20) -> Optional[str]:
+        """URL JSON API поиска для страницы поиска globalbunjang (None если в URL нет запроса)"""
+        query = parse_qs(urlparse(search_url).query)
+        search_query = query.get('q', [''])[0]
+        if not search_query:
+            return None
+        
+        params = {
+            'q': search_query,
+            'order': 'date',
+            'page': 0,
+            'n': max(limit * 3, 30),  # Берем с запасом, часть отсеет фильтр брендов
+            'req_ref': 'search',
+            'stat_device': 'w',
+            'version': 4,
+        }
+        category_id = query.get('categoryId', [None])[0]
+        if category_id:
+            params['f_category_id'] = category_id
+        return f"{config.BUNJANG_API_URL}?{urlencode(params)}"
+    
+    def _map_api_item(self, item: Dict) -> Optional[Dict]:
+        """Преобразование элемента ответа API в словарь товара"""
+        pid = item.get('pid')
+        title = (item.get('name') or '').strip()
+        if not pid or not title:
+            return None
+        # Рекламу и проданные/забронированные товары пропускаем (как soldout=exclude на сайте)
+        if item.get('ad') or str(item.get('status', '0')) != '0':
+            return None
+        
+        product = {
+            'title': title[:200],
+            'link': config.BUNJANG_PRODUCT_URL.format(pid=pid),
+        }
+        
+        price = str(item.get('price') or '').replace(',', '').strip()
+        if price.isdigit():
+            product['price'] = f"{int(price):,}원"
+            product['price_amount'] = float(price)
+            product['currency'] = 'KRW'
+        
+        image = item.get('product_image')
+        if image:
+            product['image'] = image.replace('{res}', '360').replace('{cnt}', '1')
+        
+        return product
+    
+    def _api_items(self, payload) -> Optional[List]:
+        """Элементы ответа JSON API поиска. None - ответ не распознан (нужен HTML-вариант)"""
+        if payload is None:
+            return None
+        try:
+            data = json.loads(payload) if isinstance(payload, (bytes, str)) else payload
+        except ValueError as e:
+            print(f"  Некорректный JSON в ответе API: {e}")
+            return None
         
+        items = data.get('list') if isinstance(data, dict) else None
+        # Пустой список - корректный ответ "ничего не найдено", HTML-вариант для него не нужен
+        return items if isinstance(items, list) else None
+    
+    def _iter_api_products(self, items: List) -> Iterator[Dict]:
+        """Товары из элементов ответа API по одному (в порядке выдачи, без дубликатов и чужих брендов)"""
+        seen_links = set()
+        for item in items:
+            product = self._map_api_item(item) if isinstance(item, dict) else None
+            if not product or product['link'] in seen_links:
+                continue
+            if self.brands_filter and not self._matches_brand_filter(product):
+                continue
+            seen_links.add(product['link'])
+            yield product
+    
+    def parse_api_response(self, payload, limit: int = 20) -> Optional[List[Dict]]:
+        """Товары из ответа JSON API поиска. None - ответ не распознан (нужен HTML-вариант)"""
+        items = self._api_items(payload)
+        if items is None:
+            return None
+        return list(islice(self._iter_api_products(items), limit))
+    
+    def _api_payload(self, search_url: str, limit: int, payload: Optional[bytes] = None) -> Optional[bytes]:
+        """Ответ JSON API для страницы поиска (payload - заранее загруженный ответ)"""
+        if payload is None:
+            api_url = self.api_url_for_search(search_url, limit)
+            if api_url:
+                payload = self._fetch_raw(api_url)
+        return payload
+    
+    def search_api(self, search_url: str, limit: int = 20, payload: Optional[bytes] = None) -> Optional[List[Dict]]:
+        """Поиск через JSON API (payload - заранее загруженный ответ). None - нужен HTML-вариант"""
+        return self.parse_api_response(self._api_payload(search_url, limit, payload), limit)
+    
+    def iter_products(self, search_url: str, limit: int = 20, is_sent: Callable[[Product], bool] = None,
+                      html: Optional[bytes] = None, api_payload: Optional[bytes] = None) -> Iterator[Product]:
+        """Товары поиска по одному, по мере разбора. Остановка на limit или на первом уже отправленном
+        товаре (is_sent) - только для выдачи API, отсортированной по дате: дальше идут более старые"""
+        count = 0
+        if self.use_api:
+            items = self._api_items(self._api_payload(search_url, limit, api_payload))
+            if items is not None:
+                for item in self._iter_api_products(items):
+                    product = Product.from_dict(item, Site.BUNJANG)
+                    if is_sent is not None and is_sent(product):
+                        print(f"  Найден уже отправленный товар, дальше выдача старее: {search_url}")
+                        return
+                    yield product
+                    count += 1
+                    if count >= limit:
+                        return
+                return
+            print("  Ответ JSON API не распознан, используем HTML страницу поиска...")
+        
+        # Порядок HTML-выдачи не гарантирован - останавливаемся только по limit
+        for item in self._search_page_products(search_url, limit, html):
+            yield Product.from_dict(item, Site.BUNJANG)
+    
+    def parse_products_from_search(self, search_url: str, limit: int = 20, html: Optional[bytes] = None,
+                                   api_payload: Optional[bytes] = None) -> List[Dict]:
+        """Парсинг товаров из результатов поиска (html/api_payload - заранее загруженные данные, см. fetch_many)"""
+        if self.use_api:
+            api_products = self.search_api(search_url, limit, payload=api_payload)
+            if api_products is not None:
+                print(f"Получено {len(api_products)} товаров через JSON API: {search_url}")
+                return api_products
+            print("  Ответ JSON API не распознан, используем HTML страницу поиска...")
+        
+        return self._search_page_products(search_url, limit, html)
+    
+    def _search_page_products(self, search_url: str, limit: int, html: Optional[bytes] = None) -> List[Dict]:
+        """Товары HTML страницы поиска (загрузка обычным запросом или Selenium)"""
         print(f"Парсинг результатов поиска: {search_url}")
-        soup = self.get_page(search_url)
+        if not html:
+            if self.use_selenium:
+                html, xhr_products = self.render_page_source(search_url, limit=limit)
+                if xhr_products:
+                    return xhr_products
+            else:
+                html = self._fetch_raw(search_url)
+                if not html and SELENIUM_AVAILABLE:
+                    print("Пробуем использовать Selenium для поиска...")
+                    html, _ = self.render_page_source(search_url)
+            
+            if not html:
+                return []
         
+        # Разбор HTML - чистая работа CPU, выполняется в пуле процессов
+        return parse_page_in_pool(self, html, search_url, limit)
+    
+    def parse_html_page(self, html, search_url: str, limit: int = 20) -> List[Dict]:
+        """Товары из HTML страницы поиска (без сети; выполняется и в процессе-обработчике, см. parse_worker)"""
+        products = []
+        soup = parse_html(html)
         if not soup:
-            if not self.use_selenium and SELENIUM_AVAILABLE:
-                print("Пробуем использовать Selenium для поиска...")
-                soup = self.get_page_selenium(search_url)
-            
-            if not soup:
-                return products
+            return products
         
         # Ищем карточки товаров в результатах поиска
-        product_cards = []
-        selectors_to_try = [
-            lambda s: s.find_all('div', class_=lambda x: x and ('product' in x.lower() or 'item' in x.lower() or 'card' in x.lower())),
-            lambda s: s.find_all('article', class_=lambda x: x and ('product' in x.lower() or 'item' in x.lower())),
-            lambda s: s.find_all('a', class_=lambda x: x and ('product' in x.lower() or 'item' in x.lower())),
-            lambda s: [elem for elem in s.find_all('a', href=True) 
-                      if elem.find('img') and elem.get_text(strip=True) and len(elem.get_text(strip=True)) > 10
-                      and '/category/' not in (elem.get('href', '') or '')
-                      and '/search' not in (elem.get('href', '') or '')],
-        ]
-        
-        for selector_func in selectors_to_try:
-            try:
-                product_cards = selector_func(soup)
-                if product_cards and len(product_cards) > 0:
-                    print(f"Найдено {len(product_cards)} потенциальных товаров в результатах поиска")
-                    break
-            except:
-                continue
+        page = selector_cache.page(self.SITE, search_url)
+        strategy, product_cards = page.discover_cards(soup, self.SEARCH_CARD_STRATEGIES)
+        if product_cards:
+            print(f"Найдено {len(product_cards)} потенциальных товаров в результатах поиска (стратегия: {strategy})")
         
         # Парсим найденные карточки
         seen_titles = set()
-        for card in product_cards[:limit * 2]:
-            product = self.parse_product_card(card)
+        cards = product_cards[:limit * 2]
+        texts, prices = _card_texts(cards)
+        for card, text, price in zip(cards, texts, prices):
+            product = self.parse_product_card(card, page=page, card_text=text, card_price=price)
             if product and product.get('title'):
                 title_key = product['title'].lower().strip()
                 if title_key not in seen_titles and len(title_key) > 3:
@@ -540,29 +690,34 @@ class BunjangParser:
                     if len(products) >= limit:
                         break
         
+        page.finish()
         print(f"Успешно распарсено {len(products)} товаров из результатов поиска")
         return products
     
-    def format_product_message(self, product: Dict) -> str:
+    def format_product_message(self, product: Union[Product, Dict]) -> str:
         """Форматирование товара для отправки в Telegram"""
         from currency import converter
         
-        message = f"<b>{product.get('title', 'Без названия')}</b>\n\n"
+        product = Product.coerce(product)
+        message = f"<b>{product.title or 'Без названия'}</b>\n\n"
         
-        if product.get('price'):
-            original_price = product['price']
-            # Конвертируем цену в рубли (для Bunjang обычно KRW)
-            rubles = converter.convert_to_rubles(original_price, default_currency='KRW')
+        if product.price:
+            original_price = product.price
+            # Конвертируем цену в рубли (для Bunjang обычно KRW); сумма уже распознана при парсинге
+            if product.price_amount is not None:
+                rubles = converter.convert_amount(product.price_amount, product.currency or 'KRW')
+            else:
+                rubles = converter.convert_to_rubles(original_price, default_currency='KRW')
             if rubles:
                 message += f"Цена: {original_price} (~{rubles})\n"
             else:
                 message += f"Цена: {original_price}\n"
         
-        if product.get('description'):
-            message += f"{product['description'][:200]}...\n"
+        if product.description:
+            message += f"{product.description[:200]}...\n"
         
-        if product.get('link'):
-            message += f"\n<a href='{product['link']}'>Ссылка на товар</a>"
+        if product.link:
+            message += f"\n<a href='{product.link}'>Ссылка на товар</a>"
         
         return message
 
@@ -570,10 +725,56 @@ class BunjangParser:
 class FruitsFamilyParser:
     """Парсер для сайта fruitsfamily.com"""
     
-    def __init__(self, base_url: str = 'https://fruitsfamily.com/', use_selenium: bool = False, brands_filter: List[Dict] = None):
+    SITE = 'fruitsfamily'
+    
+    # Стратегии поиска карточек товаров в порядке приоритета (см. card_discovery)
+    CARD_STRATEGIES = [
+        # По классам с product/item/card
+        CardStrategy('div_class', ('div',), ('product', 'item', 'card')),
+        CardStrategy('article_class', ('article',), ('product', 'item')),
+        CardStrategy('link_class', ('a',), ('product', 'item')),
+        # Ссылки с изображениями и текстом
+        CardStrategy('link_with_image', ('a',), href_filter=_fruits_card_href),
+        # По data-атрибутам
+        CardStrategy('data_product_id', ('div', 'article'), attr='data-product-id'),
+        CardStrategy('data_item_id', ('div', 'article'), attr='data-item-id'),
+        # Ссылки на товары внутри контейнеров-списков
+        ContainerLinkStrategy('container_links', ('div', 'section', 'article', 'ul', 'li'),
+                              ('list', 'grid', 'container', 'products', 'items', 'card'),
+                              _fruits_container_href, ('div', 'article', 'li')),
+    ]
+    
+    # Служебные элементы: короткие названия с этими словами - не товары
+    EXCLUDE_WORDS = ['arrow', 'more', 'category', 'search', 'home', 'menu', 'cart',
+                     '인기', '브랜드', '랭킹', '상품', '검색', '홈', '마켓', '판매',
+                     'popular', 'brand', 'ranking', 'product', 'search']
+    
+    # Стратегии поиска названия в карточке (выученная пробуется первой, см. selector_cache)
+    TITLE_STRATEGIES = [
+        # По классам, специфичным для fruitsfamily
+        FieldStrategy('text_class', lambda card, text: card.find(['h1', 'h2', 'h3', 'h4', 'h5', 'div', 'span', 'p'],
+                                                                class_=lambda c: c and ('title' in c.lower() or 'name' in c.lower() or 'product' in c.lower()))),
+        FieldStrategy('link_text', lambda card, text: card.find('a', href=True)),
+        FieldStrategy('image_alt', lambda card, text: card.find('img', alt=True)),
+    ]
+    
+    # Стратегии поиска цены - корейские валюты (원, KRW)
+    PRICE_STRATEGIES = [
+        FieldStrategy('price_class', lambda card, text: card.find(['span', 'div', 'p', 'strong', 'b'], class_=lambda c: c and 'price' in c.lower())),
+        FieldStrategy('krw_text', lambda card, text: find_price(text, currency='KRW')),
+        FieldStrategy('currency_text', lambda card, text: find_price(text)),
+    ]
+    
+    def __init__(self, base_url: str = 'https://fruitsfamily.com/', use_selenium: bool = False, brands_filter: List[Dict] = None,
+                 driver_pool: DriverPool = None, use_embedded_state: bool = True):
         self.base_url = base_url
         self.use_selenium = use_selenium and SELENIUM_AVAILABLE
+        # Сначала берем товары из JSON, встроенного в HTML; Selenium - только если его нет
+        self.use_embedded_state = use_embedded_state
         self.brands_filter = brands_filter or []
+        # Бренды (с вариантами написания), категории и стоп-слова проверяются одним автоматом
+        self.brand_matcher = BrandMatcher(self.brands_filter, aliases=config.BRAND_ALIASES,
+                                          category_keywords=config.CATEGORY_KEYWORDS, exclude_words=self.EXCLUDE_WORDS)
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -583,77 +784,100 @@ class FruitsFamilyParser:
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
         })
-        self.driver = None
+        # Пул Selenium драйверов: общий (передан снаружи) или собственный
+        self._owns_driver_pool = driver_pool is None
+        self.driver_pool = driver_pool or DriverPool(user_agent=self.session.headers['User-Agent'])
     
-    def get_page_selenium(self, url: str) -> Optional[BeautifulSoup]:
+    def get_page_selenium(self, url: str) -> Optional[HtmlNode]:
         """Получить HTML страницы с помощью Selenium"""
+        html, _ = self.render_page_source(url)
+        return parse_html(html)
+    
+    def render_page_source(self, url: str, limit: int = None,
+                           apply_brand_filter: bool = True) -> Tuple[Optional[str], List[Dict]]:
+        """Загрузить страницу через Selenium и вернуть ее HTML (page_source). Если задан limit и включен
+        перехват XHR, товары берутся из JSON-ответов страницы, и HTML тогда не нужен"""
         if not SELENIUM_AVAILABLE:
             print("  Selenium не доступен")
-            return None
+            return None, []
         
+        with self.driver_pool.driver() as driver:
+            if driver is None:
+                print("  Не удалось получить Selenium драйвер из пула")
+                return None, []
+            return self._load_page_selenium(driver, url, limit, apply_brand_filter)
+    
+    def _products_from_payloads(self, payloads: List, limit: int, apply_brand_filter: bool = True) -> List[Dict]:
+        """Товары из перехваченных JSON-ответов страницы"""
+        products = []
+        seen_links = set()
+        for payload in payloads:
+            for product in products_from_json(payload, config.FRUITS_PRODUCT_URL, self.base_url):
+                if apply_brand_filter and self.brands_filter and not self._matches_brand_filter(product):
+                    continue
+                if product['link'] in seen_links:
+                    continue
+                seen_links.add(product['link'])
+                products.append(product)
+                if len(products) >= limit:
+                    return products
+        return products
+    
+    def _load_page_selenium(self, driver, url: str, limit: int = None,
+                            apply_brand_filter: bool = True) -> Tuple[Optional[str], List[Dict]]:
+        """Загрузка страницы драйвером, взятым из пула"""
+        capture_xhr = limit is not None and config.SELENIUM_CAPTURE_XHR
         try:
-            if not self.driver:
-                print("  Инициализация Selenium драйвера...")
-                try:
-                    chrome_options = Options()
-                    chrome_options.add_argument('--headless')
-                    chrome_options.add_argument('--no-sandbox')
-                    chrome_options.add_argument('--disable-dev-shm-usage')
-                    chrome_options.add_argument('--disable-gpu')
-                    chrome_options.add_argument('--window-size=1920,1080')
-                    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-                    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-                    chrome_options.add_experimental_option('useAutomationExtension', False)
-                    chrome_options.add_argument(f'user-agent={self.session.headers["User-Agent"]}')
-                    self.driver = webdriver.Chrome(options=chrome_options)
-                    print("  Selenium драйвер успешно инициализирован")
-                except Exception as e:
-                    print(f"  ОШИБКА при инициализации Selenium драйвера: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    return None
-            
+            apply_lean_render(driver, self.SITE)
+            if capture_xhr:
+                reset_capture(driver)
             print(f"  Загрузка страницы через Selenium: {url}")
             try:
-                self.driver.get(url)
+                driver.get(url)
                 print(f"  Страница загружена, ожидание загрузки контента...")
             except Exception as e:
                 print(f"  ОШИБКА при загрузке URL через Selenium: {e}")
                 import traceback
                 traceback.print_exc()
-                return None
+                return None, []
             
-            # Ждем загрузки контента
-            time.sleep(4)
+            # Ждем появления карточек товаров (или пока DOM перестанет меняться)
+            wait_until_ready(driver, self.SITE, url)
             
             # Прокручиваем страницу для загрузки динамического контента
             try:
-                self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(2)
-                self.driver.execute_script("window.scrollTo(0, 0);")
-                time.sleep(1)
+                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+                wait_until_ready(driver, self.SITE, url, stage='scroll')
+                driver.execute_script("window.scrollTo(0, 0);")
             except Exception as e:
                 print(f"  Предупреждение при прокрутке страницы: {e}")
             
+            if capture_xhr:
+                payloads = captured_json_responses(driver, self.SITE)
+                xhr_products = self._products_from_payloads(payloads, limit, apply_brand_filter)
+                if xhr_products:
+                    print(f"  Получено {len(xhr_products)} товаров из перехваченных XHR (HTML не разбирается)")
+                    return None, xhr_products
+            
             try:
-                html = self.driver.page_source
+                html = driver.page_source
                 if not html or len(html) < 100:
                     print(f"  ВНИМАНИЕ: Получен пустой или очень короткий HTML ({len(html) if html else 0} символов)")
-                    return None
+                    return None, []
                 print(f"  HTML получен, размер: {len(html)} символов")
-                return BeautifulSoup(html, 'html.parser')
+                return html, []
             except Exception as e:
                 print(f"  ОШИБКА при получении HTML: {e}")
                 import traceback
                 traceback.print_exc()
-                return None
+                return None, []
         except Exception as e:
             print(f"  КРИТИЧЕСКАЯ ОШИБКА при получении страницы через Selenium {url}: {e}")
             import traceback
             traceback.print_exc()
-            return None
+            return None, []
     
-    def get_page(self, url: str) -> Optional[BeautifulSoup]:
+    def get_page(self, url: str) -> Optional[HtmlNode]:
         """Получить HTML страницы"""
         if self.use_selenium:
             print(f"  Используем Selenium для загрузки страницы")
@@ -665,7 +889,7 @@ class FruitsFamilyParser:
                     response = self.session.get(url, timeout=15)
                     response.raise_for_status()
                     print(f"  HTTP запрос успешен, размер ответа: {len(response.content)} байт")
-                    return BeautifulSoup(response.content, 'html.parser')
+                    return parse_html(response.content)
                 except Exception as e:
                     print(f"  HTTP запрос также не удался: {e}")
             return result
@@ -675,7 +899,7 @@ class FruitsFamilyParser:
             response = self.session.get(url, timeout=15)
             response.raise_for_status()
             print(f"  HTTP запрос успешен, размер ответа: {len(response.content)} байт")
-            return BeautifulSoup(response.content, 'html.parser')
+            return parse_html(response.content)
         except Exception as e:
             print(f"  Ошибка при обычном HTTP запросе {url}: {e}")
             # Пробуем через Selenium если обычный запрос не сработал
@@ -684,38 +908,42 @@ class FruitsFamilyParser:
                 return self.get_page_selenium(url)
             return None
     
+    def _fetch_raw(self, url: str) -> Optional[bytes]:
+        """Загрузить сырые байты страницы через requests"""
+        try:
+            response = self.session.get(url, timeout=15)
+            response.raise_for_status()
+            return response.content
+        except Exception as e:
+            print(f"Ошибка при получении страницы {url}: {e}")
+            return None
+    
+    async def fetch_many(self, urls: List[str]) -> Dict[str, Optional[bytes]]:
+        """Асинхронно загрузить несколько страниц одновременно через общий пул соединений"""
+        if AIOHTTP_AVAILABLE:
+            return await fetcher.fetch_many(urls, headers=dict(self.session.headers))
+        # Без aiohttp загружаем через requests, каждую страницу в своем потоке
+        unique_urls = list(dict.fromkeys(urls))
+        results = await asyncio.gather(*(asyncio.to_thread(self._fetch_raw, url) for url in unique_urls))
+        return dict(zip(unique_urls, results))
+    
     def close(self):
-        """Закрыть Selenium драйвер"""
-        if self.driver:
-            self.driver.quit()
-            self.driver = None
+        """Закрыть Selenium драйверы (общий пул закрывает его владелец)"""
+        if self._owns_driver_pool:
+            self.driver_pool.close()
     
-    def parse_product_card(self, card_element) -> Optional[Dict]:
-        """Парсинг карточки товара с fruitsfamily.com"""
+    def parse_product_card(self, card_element, apply_brand_filter: bool = True, page: PageStrategies = None,
+                           card_text: str = None, card_price=_NOT_COMPUTED) -> Optional[Dict]:
+        """Парсинг карточки товара с fruitsfamily.com (page - стратегии страницы из selector_cache;
+        card_text и card_price - посчитанные для всей страницы, см. _card_texts)"""
         product = {}
+        title = None
         
         try:
-            all_text = card_element.get_text(separator=' ', strip=True)
+            all_text = card_text if card_text is not None else card_element.get_text(separator=' ', strip=True)
             
             # Название товара
-            title = None
-            title_selectors = [
-                # По классам, специфичным для fruitsfamily
-                lambda x: x.find(['h1', 'h2', 'h3', 'h4', 'h5', 'div', 'span', 'p'], 
-                               class_=lambda c: c and ('title' in c.lower() or 'name' in c.lower() or 'product' in c.lower())),
-                lambda x: x.find('a', href=True),
-                lambda x: x.find('img', alt=True),
-            ]
-            
-            for selector in title_selectors:
-                elem = selector(card_element)
-                if elem:
-                    if elem.name == 'img':
-                        title = elem.get('alt', '').strip()
-                    else:
-                        title = elem.get_text(strip=True)
-                    if title and len(title) > 3:
-                        break
+            title = first_match('title', card_element, all_text, self.TITLE_STRATEGIES, _title_from_element, page)
             
             # Если не нашли, берем первый значимый текст
             if not title or len(title) < 3:
@@ -732,15 +960,6 @@ class FruitsFamilyParser:
                 if len(words) > 2:
                     title = ' '.join(words[:15])
             
-            # Исключаем служебные элементы
-            if title:
-                title_lower = title.lower()
-                exclude_words = ['arrow', 'more', 'category', 'search', 'home', 'menu', 'cart',
-                               '인기', '브랜드', '랭킹', '상품', '검색', '홈', '마켓', '판매',
-                               'popular', 'brand', 'ranking', 'product', 'search']
-                if any(word in title_lower for word in exclude_words) and len(title) < 20:
-                    return None
-            
             if title and len(title) > 3:
                 product['title'] = title[:200]
             
@@ -753,31 +972,11 @@ class FruitsFamilyParser:
                 product['link'] = urljoin(self.base_url, card_element.get('href'))
             
             # Цена - ищем корейские валюты (원, KRW)
-            price = None
-            price_patterns = [
-                lambda x: x.find(['span', 'div', 'p', 'strong', 'b'], 
-                               class_=lambda c: c and 'price' in c.lower()),
-                lambda x: re.search(r'\d+[\d,.]*\s*원|\d+[\d,.]*\s*KRW|원\s*\d+[\d,.]*|KRW\s*\d+[\d,.]*', all_text),
-                lambda x: re.search(r'\d+[\d,.]*\s*[₩$€£¥]|[₩$€£¥]\s*\d+[\d,.]*', all_text),
-            ]
+            price = first_match('price', card_element, all_text,
+                                _with_card_price(self.PRICE_STRATEGIES, 'currency_text', card_price),
+                                _price_from_result, page)
             
-            for pattern in price_patterns:
-                try:
-                    result = pattern(card_element)
-                    if result:
-                        if hasattr(result, 'group') and callable(getattr(result, 'group', None)):
-                            price = result.group(0).strip()
-                        elif hasattr(result, 'get_text'):
-                            price = result.get_text(strip=True)
-                        else:
-                            price = str(result).strip()
-                        if price:
-                            break
-                except:
-                    continue
-            
-            if price:
-                product['price'] = price[:50]
+            _set_price(product, price)
             
             # Изображение
             img_elem = card_element.find('img')
@@ -808,9 +1007,12 @@ class FruitsFamilyParser:
             import traceback
             traceback.print_exc()
         
-        # Проверяем фильтр по брендам
-        if self.brands_filter and product.get('title'):
-            if not self._matches_brand_filter(product):
+        # Служебные элементы и фильтр по брендам - за один проход по тексту
+        if title:
+            match = self._classify(product, title)
+            if match.excluded and len(title) < 20:
+                return None
+            if apply_brand_filter and self.brands_filter and product.get('title') and not match.brand:
                 return None
         
         # Возвращаем товар если есть хотя бы название или ссылка
@@ -818,157 +1020,155 @@ class FruitsFamilyParser:
             return product
         elif product.get('link'):
             product['title'] = product['link'].split('/')[-1] or 'Товар'
-            if self.brands_filter:
+            if apply_brand_filter and self.brands_filter:
                 if not self._matches_brand_filter(product):
                     return None
             return product
         
         return None
     
+    def _classify(self, product: Dict, title: str = None) -> BrandMatch:
+        """Бренд, категория и стоп-слова товара; найденные бренд и категория записываются в товар"""
+        match = self.brand_matcher.classify(title or product.get('title', ''), product.get('description', ''))
+        apply_brand_match(product, match)
+        return match
+    
     def _matches_brand_filter(self, product: Dict) -> bool:
         """Проверяет, соответствует ли товар фильтру брендов"""
         if not self.brands_filter:
             return True
-        
-        title = product.get('title', '').lower()
-        description = product.get('description', '').lower()
-        text_to_check = f"{title} {description}"
-        
-        for brand_info in self.brands_filter:
-            brand_name = brand_info['name'].lower()
-            category = brand_info.get('category')
-            
-            # Создаем варианты написания бренда для более гибкого поиска
-            brand_variants = [brand_name]
-            
-            # Специальные случаи для брендов
-            if brand_name == 'cp company':
-                brand_variants.extend(['c.p. company', 'cpcompany', 'c p company', 'cp комп니', 'cp컴퍼니', 'cp company', 'c.p.company'])
-            elif brand_name == 'maison margiela':
-                brand_variants.extend(['margiela', 'maisonmargiela', '메종 마르지엘라', '마르지엘라', '메종마르지엘라', '메종 마르지엘라'])
-            elif brand_name == 'stone island':
-                brand_variants.extend(['stoneisland', '스톤아일랜드', 'stone island'])
-            elif brand_name == 'project gr':
-                brand_variants.extend(['projectgr', 'project gr', '프로젝트 gr', 'projectgr', '프로젝트gr'])
-            elif brand_name == 'grailz':
-                brand_variants.extend(['grailz', '그레일즈'])
-            
-            # Проверяем все варианты
-            brand_found = any(variant in text_to_check for variant in brand_variants)
-            
-            if brand_found:
-                if category:
-                    category_keywords = {
-                        'shoes': ['shoe', 'sneaker', 'boot', 'sandal', 'slipper', 'loafer', 'oxford', 'heel', 'footwear', 
-                                 'обувь', 'кроссовки', 'ботинки', 'sneakers', 'boots', '신발', '운동화', '부츠']
-                    }
-                    if category in category_keywords:
-                        keywords = category_keywords[category]
-                        if any(keyword in text_to_check for keyword in keywords):
-                            return True
-                        else:
-                            continue
-                else:
-                    return True
-        
-        return False
+        return self._classify(product).brand is not None
     
-    def parse_products(self, url: str = None, limit: int = 50) -> List[Dict]:
-        """Парсинг товаров с указанной страницы"""
-        products = []
+    def _iter_embedded_state(self, html, apply_brand_filter: bool = True) -> Iterator[Dict]:
+        """Товары из JSON-состояния страницы по одному (без дубликатов и, с фильтром, чужих брендов)"""
+        seen_links = set()
+        for state in extract_state_json(html):
+            for product in products_from_json(state, config.FRUITS_PRODUCT_URL, self.base_url):
+                if apply_brand_filter and self.brands_filter and not self._matches_brand_filter(product):
+                    continue
+                if product['link'] in seen_links:
+                    continue
+                seen_links.add(product['link'])
+                yield product
+    
+    def parse_embedded_state(self, html, limit: int = 50, apply_brand_filter: bool = True) -> List[Dict]:
+        """Товары из JSON-состояния, встроенного в HTML страницы (гидратация Next.js/Apollo)"""
+        return list(islice(self._iter_embedded_state(html, apply_brand_filter), limit))
+    
+    @staticmethod
+    def _is_brand_page(url: str) -> bool:
+        """Страница конкретного бренда: фильтр брендов не нужен (все товары уже отфильтрованы)"""
+        return '/brand/' in url or ('/search/' in url and '?sort=' in url)
+    
+    def iter_products(self, url: str = None, limit: int = 50, html: Optional[bytes] = None) -> Iterator[Product]:
+        """Товары страницы по одному, по мере разбора (остановка на limit). Страницы брендов отсортированы
+        по популярности (sort=POPULAR), поэтому уже отправленный товар не значит, что дальше только старые"""
+        url = url or self.base_url
+        is_brand_page = self._is_brand_page(url)
+        print(f"Парсинг страницы: {url}")
         
+        if self.use_embedded_state:
+            if html is None:
+                html = self._fetch_raw(url)
+            if html:
+                found = False
+                for item in islice(self._iter_embedded_state(html, apply_brand_filter=not is_brand_page), limit):
+                    found = True
+                    yield Product.from_dict(item, Site.FRUITS)
+                if found:
+                    return
+                print("  Встроенные данные не найдены, используем запасной вариант")
+        
+        for item in self._page_products(url, limit, html, is_brand_page):
+            yield Product.from_dict(item, Site.FRUITS)
+    
+    def parse_products(self, url: str = None, limit: int = 50, html: Optional[bytes] = None) -> List[Dict]:
+        """Парсинг товаров с указанной страницы (html - заранее загруженная страница, см. fetch_many)"""
         if not url:
             url = self.base_url
         
         # Проверяем, является ли URL страницей конкретного бренда
         # Если да, то фильтр брендов не нужен (все товары уже отфильтрованы)
-        is_brand_page = '/brand/' in url or ('/search/' in url and '?sort=' in url)
+        is_brand_page = self._is_brand_page(url)
         
         print(f"Парсинг страницы: {url}")
         if is_brand_page:
             print("  (Страница бренда - фильтр брендов будет отключен)")
         
-        # Сначала пробуем обычный запрос
-        soup = self.get_page(url)
+        # Сначала пробуем данные, встроенные в HTML (__NEXT_DATA__ и т.п.) - без браузера
+        if self.use_embedded_state:
+            if html is None:
+                html = self._fetch_raw(url)
+            if html:
+                state_products = self.parse_embedded_state(html, limit, apply_brand_filter=not is_brand_page)
+                if state_products:
+                    print(f"  Получено {len(state_products)} товаров из встроенных данных страницы (без Selenium)")
+                    return state_products
+                print("  Встроенные данные не найдены, используем запасной вариант")
+        
+        return self._page_products(url, limit, html, is_brand_page)
+    
+    def _page_products(self, url: str, limit: int, html: Optional[bytes], is_brand_page: bool) -> List[Dict]:
+        """Товары HTML страницы: обычный запрос или Selenium, разбор в пуле процессов"""
+        products = []
         
-        if not soup:
+        # Обычный разбор HTML (или Selenium, если сайт требует JavaScript)
+        if self.use_selenium:
+            print(f"  Используем Selenium для загрузки страницы")
+            page_html, xhr_products = self.render_page_source(url, limit=limit, apply_brand_filter=not is_brand_page)
+            if xhr_products:
+                return xhr_products
+            if not page_html and html:
+                print(f"  Selenium не смог загрузить страницу, используем HTML обычного запроса")
+                page_html = html
+        else:
+            page_html = html or self._fetch_raw(url)
+        
+        if not page_html:
             print("  Обычный запрос не удался, пробуем Selenium...")
-            if self.use_selenium and SELENIUM_AVAILABLE:
+            if SELENIUM_AVAILABLE:
                 print("  Используем Selenium для динамического контента...")
-                soup = self.get_page_selenium(url)
-            elif not self.use_selenium and SELENIUM_AVAILABLE:
-                print("  Selenium доступен, но не включен. Пробуем использовать его...")
-                soup = self.get_page_selenium(url)
+                page_html, _ = self.render_page_source(url)
             
-            if not soup:
+            if not page_html:
                 print(f"  ОШИБКА: Не удалось загрузить страницу {url}")
                 print(f"  use_selenium={self.use_selenium}, SELENIUM_AVAILABLE={SELENIUM_AVAILABLE}")
                 return products
         else:
-            print(f"  Страница успешно загружена (обычный запрос)")
+            print(f"  Страница успешно загружена")
         
-        # Ищем карточки товаров
-        product_cards = []
-        
-        selectors_to_try = [
-            # По классам с product/item/card
-            lambda s: s.find_all('div', class_=lambda x: x and ('product' in x.lower() or 'item' in x.lower() or 'card' in x.lower())),
-            lambda s: s.find_all('article', class_=lambda x: x and ('product' in x.lower() or 'item' in x.lower())),
-            lambda s: s.find_all('a', class_=lambda x: x and ('product' in x.lower() or 'item' in x.lower())),
-            # Ссылки с изображениями и текстом
-            lambda s: [elem for elem in s.find_all('a', href=True) 
-                      if elem.find('img') and elem.get_text(strip=True) and len(elem.get_text(strip=True)) > 10
-                      and '/product/' in (elem.get('href', '') or '')],
-            # По data-атрибутам
-            lambda s: s.find_all(['div', 'article'], attrs={'data-product-id': True}),
-            lambda s: s.find_all(['div', 'article'], attrs={'data-item-id': True}),
-        ]
-        
-        for selector_func in selectors_to_try:
-            try:
-                product_cards = selector_func(soup)
-                if product_cards and len(product_cards) > 0:
-                    print(f"Найдено {len(product_cards)} потенциальных товаров")
-                    break
-            except:
-                continue
+        # Разбор HTML - чистая работа CPU, выполняется в пуле процессов
+        return parse_page_in_pool(self, page_html, url, limit, apply_brand_filter=not is_brand_page)
+    
+    def parse_html_page(self, html, url: str, limit: int = 50, apply_brand_filter: bool = True) -> List[Dict]:
+        """Товары из HTML страницы (без сети; выполняется и в процессе-обработчике, см. parse_worker)"""
+        products = []
+        soup = parse_html(html)
+        if not soup:
+            return products
         
-        # Если не нашли, ищем в контейнерах
-        if not product_cards:
-            print("  Стандартные селекторы не нашли товары, ищем в контейнерах...")
-            containers = soup.find_all(['div', 'section', 'article', 'ul', 'li'], 
-                                     class_=lambda x: x and (
-                                         'list' in x.lower() or 'grid' in x.lower() or 'container' in x.lower() or 
-                                         'products' in x.lower() or 'items' in x.lower() or 'card' in x.lower()
-                                     ))
-            print(f"  Найдено {len(containers)} контейнеров")
-            for container in containers:
-                links = container.find_all('a', href=True)
-                for link in links:
-                    href = link.get('href', '')
-                    if '/product/' in href or '/item/' in href or '/goods/' in href or '/brand/' in href:
-                        if link.find('img') and link.get_text(strip=True) and len(link.get_text(strip=True)) > 10:
-                            product_cards.append(link.parent if link.parent.name in ['div', 'article', 'li'] else link)
-            
-            if not product_cards:
-                print("  ВНИМАНИЕ: Не найдено ни одной карточки товара!")
-                # Пробуем найти любые ссылки с изображениями
-                all_links = soup.find_all('a', href=True)
-                links_with_img = [link for link in all_links if link.find('img')]
-                print(f"  Найдено {len(all_links)} ссылок, из них {len(links_with_img)} с изображениями")
-                if links_with_img:
-                    print(f"  Примеры ссылок с изображениями:")
-                    for i, link in enumerate(links_with_img[:5], 1):
-                        href = link.get('href', '')[:80]
-                        text = link.get_text(strip=True)[:50]
-                        print(f"    {i}. {href} - {text}")
+        # Ищем карточки товаров - все стратегии (включая ссылки в контейнерах) за один обход страницы
+        page = selector_cache.page(self.SITE, url)
+        strategy, product_cards = page.discover_cards(soup, self.CARD_STRATEGIES)
+        if product_cards:
+            print(f"Найдено {len(product_cards)} потенциальных товаров (стратегия: {strategy})")
+        else:
+            print("  ВНИМАНИЕ: Не найдено ни одной карточки товара!")
+            # Пробуем найти любые ссылки с изображениями
+            all_links = soup.find_all('a', href=True)
+            links_with_img = [link for link in all_links if link.find('img')]
+            print(f"  Найдено {len(all_links)} ссылок, из них {len(links_with_img)} с изображениями")
+            if links_with_img:
+                print(f"  Примеры ссылок с изображениями:")
+                for i, link in enumerate(links_with_img[:5], 1):
+                    href = link.get('href', '')[:80]
+                    text = link.get_text(strip=True)[:50]
+                    print(f"    {i}. {href} - {text}")
         
         # Парсим найденные карточки
-        # Если это страница конкретного бренда, временно отключаем фильтр
-        original_brands_filter = self.brands_filter
-        skip_brand_filter = is_brand_page
-        if skip_brand_filter:
-            self.brands_filter = None  # Временно отключаем фильтр для страниц брендов
+        # Если это страница конкретного бренда, фильтр не применяем
+        # (не трогаем self.brands_filter - парсер используется из нескольких потоков)
+        if not apply_brand_filter:
             print("  Фильтр брендов ОТКЛЮЧЕН для страницы бренда")
         
         seen_titles = set()
@@ -978,9 +1178,12 @@ class FruitsFamilyParser:
         no_link_count = 0
         
         print(f"  Начинаем парсинг {len(product_cards)} карточек товаров...")
-        for card in product_cards[:limit * 3]:
+        cards = product_cards[:limit * 3]
+        texts, prices = _card_texts(cards)
+        for card, text, price in zip(cards, texts, prices):
             parsed_count += 1
-            product = self.parse_product_card(card)
+            product = self.parse_product_card(card, apply_brand_filter=apply_brand_filter, page=page,
+                                              card_text=text, card_price=price)
             
             if product:
                 if product.get('title') and len(product.get('title', '')) > 3:
@@ -1010,16 +1213,14 @@ class FruitsFamilyParser:
                     except:
                         print(f"    Товар отфильтрован (не удалось получить текст)")
         
-        # Восстанавливаем фильтр
-        self.brands_filter = original_brands_filter
-        
+        page.finish()
         print(f"Обработано {parsed_count} элементов:")
         print(f"  - Успешно распарсено: {len(products)}")
         print(f"  - Отфильтровано: {filtered_count}")
         print(f"  - Без названия: {no_title_count}")
         print(f"  - Без ссылки: {no_link_count}")
         
-        if filtered_count > 0 and len(products) == 0 and not is_brand_page:
+        if filtered_count > 0 and len(products) == 0 and apply_brand_filter:
             print(f"ВНИМАНИЕ: Все товары отфильтрованы! Возможно, фильтр брендов слишком строгий.")
         
         if len(products) > 0:
@@ -1041,25 +1242,29 @@ class FruitsFamilyParser:
         else:
             return self.parse_products(limit=limit)
     
-    def format_product_message(self, product: Dict) -> str:
+    def format_product_message(self, product: Union[Product, Dict]) -> str:
         """Форматирование товара для отправки в Telegram"""
         from currency import converter
         
-        message = f"<b>{product.get('title', 'Без названия')}</b>\n\n"
+        product = Product.coerce(product)
+        message = f"<b>{product.title or 'Без названия'}</b>\n\n"
         
-        if product.get('price'):
-            original_price = product['price']
-            # Конвертируем цену в рубли (для FruitsFamily обычно KRW)
-            rubles = converter.convert_to_rubles(original_price, default_currency='KRW')
+        if product.price:
+            original_price = product.price
+            # Конвертируем цену в рубли (для FruitsFamily обычно KRW); сумма уже распознана при парсинге
+            if product.price_amount is not None:
+                rubles = converter.convert_amount(product.price_amount, product.currency or 'KRW')
+            else:
+                rubles = converter.convert_to_rubles(original_price, default_currency='KRW')
             if rubles:
                 message += f"Цена: {original_price} (~{rubles})\n"
             else:
                 message += f"Цена: {original_price}\n"
         
-        if product.get('description'):
-            message += f"{product['description'][:200]}...\n"
+        if product.description:
+            message += f"{product.description[:200]}...\n"
         
-        if product.get('link'):
-            message += f"\n<a href='{product['link']}'>Ссылка на товар</a>"
+        if product.link:
+            message += f"\n<a href='{product.link}'>Ссылка на товар</a>"
         
         return message
\ No newline at end of file
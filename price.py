@@ -0,0 +1,133 @@
+"""
+Распознавание цен в тексте: одно заранее скомпилированное выражение для всех форматов,
+сумма и валюта за один проход. Общий модуль для парсеров и CurrencyConverter
+"""
+import re
+from bisect import bisect_right
+from collections import namedtuple
+from typing import Iterable, List, Optional
+
+# amount - число (float) или None, если в тексте нет суммы; currency - ISO-код; raw - исходный текст цены
+PriceMatch = namedtuple('PriceMatch', ['amount', 'currency', 'raw'])
+
+_CURRENCY_CODES = {
+    '₩': 'KRW', '원': 'KRW', 'won': 'KRW', 'krw': 'KRW',
+    '$': 'USD', 'usd': 'USD',
+    '€': 'EUR', 'eur': 'EUR',
+    '¥': 'JPY', 'jpy': 'JPY',
+    '£': 'GBP', 'gbp': 'GBP',
+}
+
+_NUMBER = r'\d[\d,.]*'
+_PREFIX = r'[₩$€£¥]|KRW|USD|EUR|JPY|GBP'
+_SUFFIX = r'원|won\b|KRW|USD|EUR|JPY|GBP|[₩$€£¥]'
+
+# Цена с валютой: "₩120,000", "$ 99.5", "120,000원", "100000 KRW".
+# Символ, за которым идет число, - префикс следующей цены, а не суффикс предыдущего числа:
+# в "Air Max 270 ₩150,000" цена 150000, а не 270
+PRICE_RE = re.compile(
+    rf'(?:(?P<prefix>{_PREFIX})\s*(?P<prefix_amount>{_NUMBER}))'
+    rf'|(?:(?P<suffix_amount>{_NUMBER})\s*(?P<suffix>{_SUFFIX})(?!\s*\d))',
+    re.IGNORECASE
+)
+# Число без валюты
+_BARE_NUMBER_RE = re.compile(_NUMBER)
+
+
+def parse_amount(number: str) -> Optional[float]:
+    """'120,000' -> 120000.0, '99.50' -> 99.5, '1.200.000' -> 1200000.0"""
+    number = number.replace(',', '').rstrip('.')
+    if number.count('.') > 1:
+        # Точки как разделители тысяч
+        number = number.replace('.', '')
+    try:
+        return float(number)
+    except ValueError:
+        return None
+
+
+def _from_match(match) -> Optional[PriceMatch]:
+    if match.group('prefix'):
+        symbol, number = match.group('prefix'), match.group('prefix_amount')
+    else:
+        symbol, number = match.group('suffix'), match.group('suffix_amount')
+    amount = parse_amount(number)
+    if amount is None:
+        return None
+    return PriceMatch(amount, _CURRENCY_CODES[symbol.lower()], match.group(0).strip())
+
+
+def find_price(text: str, currency: str = None) -> Optional[PriceMatch]:
+    """Первая цена с валютой в тексте (с currency - только в этой валюте)"""
+    if not text:
+        return None
+    for match in PRICE_RE.finditer(text):
+        price = _from_match(match)
+        if price and (currency is None or price.currency == currency):
+            return price
+    return None
+
+
+def parse_price(text: str, default_currency: str = None) -> Optional[PriceMatch]:
+    """Цена из текста; если валюты нет, первое число считается суммой в default_currency"""
+    price = find_price(text)
+    if price or not default_currency or not text:
+        return price
+    match = _BARE_NUMBER_RE.search(text)
+    if match:
+        amount = parse_amount(match.group(0))
+        if amount is not None:
+            return PriceMatch(amount, default_currency, match.group(0))
+    return None
+
+
+def extract_prices(texts: Iterable[str], default_currency: str = None) -> List[Optional[PriceMatch]]:
+    """Цены для всех текстов страницы (например, карточек) за один проход регулярного выражения"""
+    texts = [text or '' for text in texts]
+    # Тексты склеиваются через \x00: цена не может захватить соседний текст, а по позиции совпадения
+    # определяется, к какому тексту оно относится
+    starts = []
+    position = 0
+    for text in texts:
+        starts.append(position)
+        position += len(text) + 1
+    joined = '\x00'.join(texts)
+
+    results = [None] * len(texts)
+    for match in PRICE_RE.finditer(joined):
+        index = bisect_right(starts, match.start()) - 1
+        if results[index] is None:
+            results[index] = _from_match(match)
+
+    if default_currency:
+        for index, text in enumerate(texts):
+            if results[index] is None:
+                results[index] = parse_price(text, default_currency)
+    return results
+
+
+# Валюты без дробной части: сумма хранится целыми единицами; остальные - в сотых (центах).
+# Валюта не указана - KRW (цены обоих сайтов по умолчанию в вонах)
+_ZERO_DECIMAL_CURRENCIES = frozenset({'KRW', 'JPY'})
+
+
+def _minor_scale(currency: Optional[str]) -> int:
+    return 1 if (currency or 'KRW') in _ZERO_DECIMAL_CURRENCIES else 100
+
+
+def to_minor_units(amount: float, currency: Optional[str]) -> int:
+    """Сумма целым числом: 120000.0 KRW -> 120000, 99.5 USD -> 9950"""
+    return int(round(amount * _minor_scale(currency)))
+
+
+def from_minor_units(value: int, currency: Optional[str]):
+    """Обратно к сумме в валюте: целое для KRW и JPY, float для остальных"""
+    scale = _minor_scale(currency)
+    return value if scale == 1 else value / scale
+
+
+def format_minor_units(value: int, currency: Optional[str]) -> str:
+    """Сумма для сообщения: '120,000', '99.50'"""
+    if _minor_scale(currency) == 1:
+        return f"{value:,}"
+    return f"{from_minor_units(value, currency):,.2f}"
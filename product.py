@@ -0,0 +1,192 @@
+"""
+Компактная запись товара: сайт, числовой ID объявления, цена целым числом с кодом валюты.
+Поля распознаются один раз при создании, дальше по конвейеру строки заново не разбираются
+"""
+import hashlib
+import re
+import sys
+from enum import Enum
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+from price import from_minor_units, parse_price, to_minor_units
+
+# ID объявления в ссылке на товар: /product/<id>[/...]
+_LISTING_ID_RE = re.compile(r'/product/([0-9A-Za-z]+)')
+
+
+class Site(Enum):
+    BUNJANG = 'bunjang'
+    FRUITS = 'fruitsfamily'
+
+    @classmethod
+    def from_link(cls, link: str) -> Optional['Site']:
+        """Сайт по ссылке на товар"""
+        if not link:
+            return None
+        if 'globalbunjang.com' in link or 'bunjang.co.kr' in link:
+            return cls.BUNJANG
+        if 'fruitsfamily.com' in link:
+            return cls.FRUITS
+        return None
+
+    @property
+    def code(self) -> int:
+        """Целочисленный код сайта для ключа в базе данных"""
+        return _SITE_CODES[self]
+
+    @classmethod
+    def from_code(cls, code: int) -> Optional['Site']:
+        return _SITES_BY_CODE.get(code)
+
+
+# Коды хранятся в базе - не менять у существующих сайтов
+_SITE_CODES = {Site.BUNJANG: 1, Site.FRUITS: 2}
+_SITES_BY_CODE = {code: site for site, code in _SITE_CODES.items()}
+
+# Код "сайта" для товаров без ID объявления в ссылке (/item/, /goods/ у FruitsFamily, ссылки
+# из HTML-fallback Bunjang): вместо ID - хеш ссылки без параметров, см. link_key
+LINK_KEY_SITE_CODE = 0
+
+
+def extract_listing_id(site: Optional[Site], link: str) -> Optional[int]:
+    """Числовой ID объявления из ссылки: у Bunjang - десятичный pid, у FruitsFamily - ID в base36"""
+    if site is None or not link:
+        return None
+    match = _LISTING_ID_RE.search(link)
+    if not match:
+        return None
+    try:
+        if site is Site.FRUITS:
+            return int(match.group(1), 36)
+        return int(match.group(1))
+    except ValueError:
+        return None
+
+
+def canonical_link(link: str) -> str:
+    """Ссылка без схемы, www., параметров запроса и якоря - одна строка на товар"""
+    parts = urlsplit(link.strip())
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    return host + parts.path.rstrip('/')
+
+
+def link_key(link: str) -> Optional[int]:
+    """Стабильный числовой ключ по ссылке (56 бит хеша канонической ссылки)"""
+    canonical = canonical_link(link) if link else ''
+    if not canonical:
+        return None
+    return int.from_bytes(hashlib.blake2b(canonical.encode(), digest_size=7).digest(), 'big')
+
+
+def db_key_for_link(site: Optional[Site], link: str) -> Optional[Tuple[int, int]]:
+    """Ключ в базе данных по ссылке: (код сайта, ID объявления), без ID - (LINK_KEY_SITE_CODE, хеш ссылки)"""
+    listing_id = extract_listing_id(site, link)
+    if listing_id is not None:
+        return site.code, listing_id
+    key = link_key(link)
+    if key is None:
+        return None
+    return LINK_KEY_SITE_CODE, key
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    # Брендов и категорий несколько штук на тысячи товаров - одна строка на значение
+    return sys.intern(value) if value else None
+
+
+class Product:
+    """Товар с фиксированным набором полей (__slots__ вместо словаря).
+    price_amount - сумма в валюте currency: целое для KRW и JPY, float с центами для остальных валют
+    (USD, EUR ...). Для базы и сравнения цен - целое price_minor в минимальных единицах валюты"""
+
+    __slots__ = ('site', 'listing_id', 'title', 'link', 'price', 'price_amount', 'currency',
+                 'image', 'description', 'brand', 'category')
+
+    # Поля словаря товара в прежнем формате
+    DICT_FIELDS = ('title', 'link', 'price', 'price_amount', 'currency', 'image', 'description', 'brand', 'category')
+
+    def __init__(self, site: Optional[Site], listing_id: Optional[int], title: str = '', link: str = '',
+                 price: str = '', price_amount: Optional[float] = None, currency: Optional[str] = None,
+                 image: str = '', description: str = '', brand: str = None, category: str = None):
+        self.site = site
+        self.listing_id = listing_id
+        self.title = title or ''
+        self.link = link or ''
+        self.price = price or ''
+        self.price_amount = price_amount
+        self.currency = _intern(currency)
+        self.image = image or ''
+        self.description = description or ''
+        self.brand = _intern(brand)
+        self.category = _intern(category)
+
+    @classmethod
+    def from_dict(cls, data: Dict, site: Site = None) -> 'Product':
+        """Товар из словаря парсера; сайт и ID объявления определяются по ссылке"""
+        link = data.get('link') or ''
+        if site is None:
+            site = data.get('site') or Site.from_link(link)
+            if isinstance(site, str):
+                site = Site(site)
+        listing_id = data.get('listing_id')
+        if listing_id is None:
+            listing_id = extract_listing_id(site, link)
+
+        price = data.get('price') or ''
+        amount = data.get('price_amount')
+        currency = data.get('currency')
+        if amount is None and price:
+            # Цена пришла только строкой - разбираем один раз здесь (оба сайта по умолчанию в KRW)
+            match = parse_price(price, default_currency='KRW')
+            if match:
+                amount, currency = match.amount, match.currency
+        if amount is not None:
+            # Точная сумма в валюте: вона - целая, центы других валют не теряются
+            amount = from_minor_units(to_minor_units(amount, currency), currency)
+
+        return cls(site, listing_id, data.get('title'), link, price, amount, currency,
+                   data.get('image'), data.get('description'), data.get('brand'), data.get('category'))
+
+    @classmethod
+    def coerce(cls, value) -> 'Product':
+        """Product как есть, словарь старого формата - через from_dict"""
+        return value if isinstance(value, cls) else cls.from_dict(value)
+
+    def to_dict(self) -> Dict:
+        """Словарь в прежнем формате (пустые поля не включаются)"""
+        data = {}
+        for field in self.DICT_FIELDS:
+            value = getattr(self, field)
+            if value is not None and value != '':
+                data[field] = value
+        return data
+
+    @property
+    def price_minor(self) -> Optional[int]:
+        """Цена целым числом: вона - целые воны, остальные валюты - центы (см. price.to_minor_units)"""
+        if self.price_amount is None:
+            return None
+        return to_minor_units(self.price_amount, self.currency)
+
+    @property
+    def db_key(self) -> Optional[Tuple[int, int]]:
+        """Ключ в базе данных: (код сайта, ID объявления), без ID - ключ по ссылке; None - нет и ссылки"""
+        if self.site is not None and self.listing_id is not None:
+            return self.site.code, self.listing_id
+        key = link_key(self.link)
+        if key is None:
+            return None
+        return LINK_KEY_SITE_CODE, key
+
+    @property
+    def key(self):
+        """Ключ для дедупликации: (сайт, ID объявления), без ID - ссылка без параметров или название"""
+        if self.listing_id is not None:
+            return self.site, self.listing_id
+        return canonical_link(self.link) if self.link else self.title.lower().strip()
+
+    def __repr__(self):
+        site = self.site.value if self.site else None
+        return f"Product({site}, {self.listing_id}, {self.title[:40]!r})"
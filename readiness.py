@@ -0,0 +1,133 @@
+"""
+Ожидание готовности страницы в Selenium по условиям вместо фиксированных пауз
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict
+import config
+
+try:
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.common.exceptions import TimeoutException
+    SELENIUM_AVAILABLE = True
+except ImportError:
+    SELENIUM_AVAILABLE = False
+
+
+class CardsPresent:
+    """Условие: на странице есть хотя бы min_count карточек товаров"""
+    name = 'cards'
+
+    def __init__(self, css_selector: str, min_count: int):
+        self.css_selector = css_selector
+        self.min_count = min_count
+
+    def __call__(self, driver) -> bool:
+        count = driver.execute_script("return document.querySelectorAll(arguments[0]).length;", self.css_selector)
+        return (count or 0) >= self.min_count
+
+
+class DomStable:
+    """Условие: документ загружен и DOM не меняется в течение quiet_period секунд"""
+    name = 'dom_stable'
+
+    def __init__(self, quiet_period: float):
+        self.quiet_period = quiet_period
+        self._last_snapshot = None
+        self._stable_since = None
+
+    def __call__(self, driver) -> bool:
+        snapshot = driver.execute_script(
+            "return [document.readyState, document.getElementsByTagName('*').length, "
+            "document.body ? document.body.innerHTML.length : 0];"
+        )
+        now = time.monotonic()
+        if not snapshot or snapshot[0] != 'complete':
+            self._last_snapshot = None
+            return False
+        if snapshot != self._last_snapshot:
+            self._last_snapshot = snapshot
+            self._stable_since = now
+            return False
+        return now - self._stable_since >= self.quiet_period
+
+
+class _AnyOf:
+    """Выполнено хотя бы одно из условий; запоминает, какое именно"""
+
+    def __init__(self, *conditions):
+        self.conditions = conditions
+        self.matched = None
+
+    def __call__(self, driver) -> bool:
+        for condition in self.conditions:
+            if condition(driver):
+                self.matched = condition.name
+                return True
+        return False
+
+
+class ReadinessStats:
+    """Замеры времени ожидания страниц по сайтам - для подбора порогов в config.SELENIUM_READY"""
+
+    def __init__(self, max_samples: int = 200):
+        self._samples = defaultdict(lambda: deque(maxlen=max_samples))
+        self._lock = threading.Lock()
+
+    def record(self, site: str, stage: str, url: str, seconds: float, condition: str):
+        with self._lock:
+            self._samples[(site, stage)].append((url, seconds, condition))
+
+    def summary(self) -> Dict[str, Dict]:
+        """Статистика по каждой паре сайт/этап: количество, среднее, p95, максимум, таймауты"""
+        result = {}
+        with self._lock:
+            items = {key: list(samples) for key, samples in self._samples.items()}
+        for (site, stage), samples in items.items():
+            durations = sorted(sample[1] for sample in samples)
+            if not durations:
+                continue
+            result[f"{site}/{stage}"] = {
+                'count': len(durations),
+                'avg': sum(durations) / len(durations),
+                'p95': durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+                'max': durations[-1],
+                'timeouts': sum(1 for sample in samples if sample[2] == 'timeout'),
+            }
+        return result
+
+
+# Глобальная статистика ожидания страниц
+stats = ReadinessStats()
+
+
+def wait_until_ready(driver, site: str, url: str, stage: str = 'load') -> bool:
+    """Ждать готовности страницы. stage='load' - после driver.get, stage='scroll' - после прокрутки.
+    Возвращает True, если условие выполнилось до таймаута"""
+    settings = config.SELENIUM_READY[site]
+    if stage == 'scroll':
+        # После прокрутки карточки уже есть, ждем только окончания подгрузки
+        condition = _AnyOf(DomStable(settings['quiet_period']))
+        timeout = settings['scroll_timeout']
+    else:
+        condition = _AnyOf(
+            CardsPresent(settings['card_selector'], settings['min_cards']),
+            DomStable(settings['quiet_period'])
+        )
+        timeout = settings['timeout']
+
+    start = time.monotonic()
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=config.SELENIUM_READY_POLL).until(condition)
+        matched = condition.matched
+    except TimeoutException:
+        matched = 'timeout'
+    elapsed = time.monotonic() - start
+    stats.record(site, stage, url, elapsed, matched)
+
+    if matched == 'timeout':
+        print(f"  Страница не дождалась готовности за {timeout} с ({stage})")
+        return False
+    print(f"  Страница готова за {elapsed:.2f} с ({stage}, условие: {matched})")
+    return True
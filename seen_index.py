@@ -0,0 +1,198 @@
+"""
+Индекс уже отправленных товаров перед SQLite: точное множество ключей в памяти и фильтр Блума
+в файле (mmap) для всей истории. Множество отправленных только растет, поэтому "нет в фильтре"
+значит "не отправлен" без запроса к базе; SQLite нужна только при возможном совпадении.
+В заголовке файла хранится водяной знак - sent_at (секунды Unix) последней учтенной строки, после перезапуска
+дочитываются только более новые строки
+"""
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+from typing import Iterable, Optional, Tuple
+
+_MAGIC = b'SEENBLM2'
+# magic, число бит, число хэшей, емкость, добавлено ключей, водяной знак (sent_at, 0 - нет)
+_HEADER = struct.Struct('<8sQIQQq')
+
+
+def pack_key(key: Tuple[int, int]) -> int:
+    """(код сайта, ID объявления) -> одно целое (код сайта в младших битах)"""
+    site, listing_id = key
+    return listing_id << 3 | site
+
+
+class BloomFile:
+    """Фильтр Блума в файле, отображенном в память"""
+
+    def __init__(self, path: str, capacity: int, error_rate: float):
+        self.path = path
+        self._file = None
+        self._mm = None
+        if not self._open_existing():
+            self._create(capacity, error_rate)
+
+    def _open_existing(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        try:
+            f = open(self.path, 'r+b')
+            mm = mmap.mmap(f.fileno(), 0)
+        except (OSError, ValueError) as e:
+            print(f"Не удалось открыть индекс отправленных {self.path}: {e}")
+            return False
+        magic, bits, hashes, capacity, count, _ = _HEADER.unpack_from(mm, 0)
+        if magic != _MAGIC or len(mm) < _HEADER.size + (bits + 7) // 8:
+            print(f"Индекс отправленных {self.path} поврежден, создаем заново")
+            mm.close()
+            f.close()
+            return False
+        self._file, self._mm = f, mm
+        self.bits, self.hashes, self.capacity, self.count = bits, hashes, capacity, count
+        self.fresh = False
+        return True
+
+    def _create(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1000)
+        # Оптимальные размеры: m = -n*ln(p)/ln(2)^2 бит, k = m/n*ln(2) хэшей
+        self.bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.bits / capacity * math.log(2))))
+        self.capacity = capacity
+        self.count = 0
+        self.fresh = True
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, self.bits, self.hashes, capacity, 0, 0))
+            f.truncate(_HEADER.size + (self.bits + 7) // 8)
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, 'r+b')
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+
+    def _positions(self, packed: int):
+        # Двойное хэширование: k позиций из двух 64-битных половин одного хэша
+        digest = hashlib.blake2b(packed.to_bytes(16, 'little', signed=False), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        h2 |= 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.bits
+
+    def add(self, packed: int):
+        mm = self._mm
+        added = False
+        for position in self._positions(packed):
+            index = _HEADER.size + (position >> 3)
+            byte = mm[index]
+            bit = 1 << (position & 7)
+            if not byte & bit:
+                mm[index] = byte | bit
+                added = True
+        # Ключ, уже бывший в фильтре, емкость не расходует
+        if added:
+            self.count += 1
+
+    def __contains__(self, packed: int) -> bool:
+        mm = self._mm
+        for position in self._positions(packed):
+            if not mm[_HEADER.size + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def watermark(self) -> Optional[int]:
+        return _HEADER.unpack_from(self._mm, 0)[5] or None
+
+    def flush(self, watermark: Optional[int]):
+        """Сначала биты на диск, затем водяной знак: после сбоя строки дочитаются повторно, но не потеряются"""
+        self._mm.flush()
+        _HEADER.pack_into(self._mm, 0, _MAGIC, self.bits, self.hashes, self.capacity, self.count, watermark or 0)
+        self._mm.flush()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+            self._mm = None
+
+
+class SeenIndex:
+    """Отправленные товары: точное множество (ключи этого запуска) + фильтр Блума (вся история)"""
+
+    def __init__(self, path: str, capacity: int = 1000000, error_rate: float = 0.01):
+        self.path = path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._lock = threading.Lock()
+        self._recent = set()
+        self._watermark = None
+        self._bloom = BloomFile(path, capacity, error_rate)
+
+    def sync(self, cursor):
+        """Дочитать из базы строки, отправленные после водяного знака (при создании файла - все)"""
+        watermark = None if self._bloom.fresh else self._bloom.watermark
+        if watermark is None:
+            # Полное построение: и ключи, ушедшие в архив по сроку хранения
+            cursor.execute('SELECT site, listing_id, sent_at FROM products '
+                           'WHERE sent_at IS NOT NULL AND listing_id IS NOT NULL '
+                           'UNION ALL SELECT site, listing_id, sent_at FROM products_archive')
+        else:
+            # >= : строки с тем же временем могли не попасть в прошлый раз (повторное добавление безвредно)
+            cursor.execute('SELECT site, listing_id, sent_at FROM products '
+                           'WHERE sent_at >= ? AND listing_id IS NOT NULL', (watermark,))
+        rows = cursor.fetchall()
+        with self._lock:
+            # История - только в фильтр Блума; в точное множество попадают ключи этого запуска
+            for site, listing_id, sent_at in rows:
+                self._bloom.add(pack_key((site, listing_id)))
+                if watermark is None or sent_at > watermark:
+                    watermark = sent_at
+            self._watermark = watermark
+            self._bloom.flush(watermark)
+            overflow = self._bloom.count > self._bloom.capacity
+        if overflow:
+            self._rebuild(cursor)
+        return len(rows)
+
+    def _rebuild(self, cursor):
+        """Фильтр переполнен (ложных срабатываний больше расчетных) - пересоздаем с двойной емкостью"""
+        print(f"Индекс отправленных переполнен ({self._bloom.count} ключей), пересоздаем")
+        with self._lock:
+            self.capacity = max(self.capacity, self._bloom.count) * 2
+            self._bloom.close()
+            os.remove(self.path)
+            self._bloom = BloomFile(self.path, self.capacity, self.error_rate)
+        self.sync(cursor)
+
+    def _add_locked(self, packed: int):
+        if packed not in self._recent:
+            self._recent.add(packed)
+            self._bloom.add(packed)
+
+    def add_many(self, keys: Iterable[Tuple[int, int]], sent_at: int = None):
+        """Отметить ключи отправленными (после фиксации транзакции в базе); sent_at - их время отправки,
+        сдвигает водяной знак при следующем сохранении файла"""
+        with self._lock:
+            for key in keys:
+                self._add_locked(pack_key(key))
+            if sent_at is not None and (self._watermark is None or sent_at > self._watermark):
+                self._watermark = sent_at
+
+    def check(self, key: Tuple[int, int]) -> Optional[bool]:
+        """True - точно отправлен, False - точно нет, None - возможно (нужна проверка в базе)"""
+        packed = pack_key(key)
+        if packed in self._recent:
+            return True
+        if packed not in self._bloom:
+            return False
+        return None
+
+    def confirm(self, key: Tuple[int, int]):
+        """База подтвердила отправку - дальше без запросов"""
+        with self._lock:
+            self._recent.add(pack_key(key))
+
+    def close(self):
+        with self._lock:
+            self._bloom.flush(self._watermark)
+            self._bloom.close()
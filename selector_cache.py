@@ -0,0 +1,247 @@
+"""
+Кэш выученных стратегий разбора (карточки, название, цена) по сайту и шаблону URL.
+Сайт обычно всегда совпадает с одной и той же стратегией, поэтому она пробуется первой,
+а полный перебор нужен только когда результат ухудшился
+"""
+import json
+import os
+import re
+import threading
+from collections import Counter, namedtuple
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+import config
+from card_discovery import discover_cards, stats as discovery_stats
+
+# Именованная стратегия поиска поля карточки: func(card, all_text) -> элемент, совпадение regex или строка
+FieldStrategy = namedtuple('FieldStrategy', ['name', 'func'])
+
+_DIGITS_RE = re.compile(r'\d+')
+
+
+def url_pattern(url: str) -> str:
+    """Шаблон URL: хост, первый сегмент пути и имена параметров (страницы всех брендов одного вида совпадают)"""
+    parsed = urlparse(url)
+    segments = [segment for segment in parsed.path.split('/') if segment]
+    path = '/' + '/'.join(segments[:1] + ['*'] * len(segments[1:]))
+    path = _DIGITS_RE.sub('{n}', path)
+    keys = sorted(parse_qs(parsed.query, keep_blank_values=True))
+    return parsed.netloc + path + ('?' + '&'.join(keys) if keys else '')
+
+
+class SelectorCache:
+    """Выученные стратегии: {сайт: {шаблон URL: {'card'|'title'|'price': {'strategy': имя, 'count': N}}}}"""
+
+    def __init__(self, path: str = None, enabled: bool = None):
+        self.path = path or config.SELECTOR_CACHE_FILE
+        self.enabled = config.SELECTOR_CACHE_ENABLED if enabled is None else enabled
+        self._lock = threading.Lock()
+        self._data = None
+        # persist=False - процесс-обработчик: файл не пишется, изменения копятся для основного процесса (drain)
+        self.persist = True
+        self._changes = []
+        # Разобранные страницы по (сайт, шаблон URL) - для периодической перепроверки стратегий полей
+        self._pages = Counter()
+        # Признак перепроверки от основного процесса для следующей страницы шаблона (см. apply_page_state)
+        self._recheck = {}
+
+    def _load(self) -> Dict:
+        """Ленивая загрузка файла кэша (вызывается под блокировкой)"""
+        if self._data is None:
+            self._data = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        self._data = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"Не удалось прочитать кэш селекторов {self.path}: {e}")
+        return self._data
+
+    def get(self, site: str, pattern: str, kind: str) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._load().get(site, {}).get(pattern, {}).get(kind)
+            return dict(entry) if entry else None
+
+    def learn(self, site: str, pattern: str, kind: str, strategy: str, count: int = None):
+        """Запомнить стратегию; файл перезаписывается только если что-то изменилось"""
+        if not self.enabled:
+            return
+        entry = {'strategy': strategy}
+        if count is not None:
+            entry['count'] = count
+        with self._lock:
+            kinds = self._load().setdefault(site, {}).setdefault(pattern, {})
+            if kinds.get(kind) == entry:
+                return
+            kinds[kind] = entry
+            self._changed_locked(site, pattern, kind, entry)
+
+    def forget(self, site: str, pattern: str, kind: str):
+        """Забыть стратегию: следующая страница переберет все в порядке приоритета"""
+        if not self.enabled:
+            return
+        with self._lock:
+            kinds = self._load().get(site, {}).get(pattern, {})
+            if kinds.pop(kind, None) is not None:
+                self._changed_locked(site, pattern, kind, None)
+
+    def _changed_locked(self, site: str, pattern: str, kind: str, entry: Optional[Dict]):
+        if self.persist:
+            self._save_locked()
+        else:
+            self._changes.append((site, pattern, kind, entry))
+
+    def drain(self) -> List[Tuple]:
+        """Изменения процесса-обработчика с прошлого вызова: [(сайт, шаблон, вид, запись или None)]"""
+        with self._lock:
+            changes, self._changes = self._changes, []
+        return changes
+
+    def merge(self, changes: List[Tuple]):
+        """Применить изменения из процесса-обработчика (файл пишет только основной процесс)"""
+        if not self.enabled or not changes:
+            return
+        with self._lock:
+            data = self._load()
+            for site, pattern, kind, entry in changes:
+                kinds = data.setdefault(site, {}).setdefault(pattern, {})
+                if entry is None:
+                    kinds.pop(kind, None)
+                else:
+                    kinds[kind] = entry
+            self._save_locked()
+
+    def _save_locked(self):
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Не удалось сохранить кэш селекторов {self.path}: {e}")
+
+    def _count_page_locked(self, site: str, pattern: str) -> bool:
+        """Посчитать страницу шаблона; True - пора перепроверить стратегии полей"""
+        self._pages[(site, pattern)] += 1
+        count = self._pages[(site, pattern)]
+        return config.SELECTOR_CACHE_RECHECK_PAGES > 0 and count % config.SELECTOR_CACHE_RECHECK_PAGES == 0
+
+    def page_state(self, site: str, url: str) -> Tuple[Dict, bool]:
+        """Для задачи процессу-обработчику: текущие стратегии шаблона URL и признак перепроверки.
+        Страница считается здесь, в основном процессе, - перепроверка раз в N страниц шаблона, а не процесса"""
+        pattern = url_pattern(url)
+        with self._lock:
+            kinds = self._load().get(site, {}).get(pattern, {}) if self.enabled else {}
+            return {kind: dict(entry) for kind, entry in kinds.items()}, self._count_page_locked(site, pattern)
+
+    def apply_page_state(self, site: str, url: str, state: Tuple[Dict, bool]):
+        """В процессе-обработчике: заменить копию стратегий шаблона на присланную основным процессом
+        (там же слиты изменения других процессов); следующий page() шаблона берет признак перепроверки отсюда"""
+        kinds, recheck = state
+        pattern = url_pattern(url)
+        with self._lock:
+            self._load().setdefault(site, {})[pattern] = kinds
+            self._recheck[(site, pattern)] = recheck
+
+    def page(self, site: str, url: str) -> 'PageStrategies':
+        """Стратегии для разбора одной страницы"""
+        pattern = url_pattern(url)
+        with self._lock:
+            recheck = self._recheck.pop((site, pattern), None)
+            if recheck is None:
+                recheck = self._count_page_locked(site, pattern)
+        return PageStrategies(self, site, pattern, recheck)
+
+
+class PageStrategies:
+    """Стратегии одной страницы: выученная пробуется первой, по итогам страницы кэш обновляется.
+    recheck - страница перепроверки: поля ищутся в полном порядке приоритета без выученных стратегий.
+    Страница разбирается в одном потоке, поэтому счетчики без блокировки"""
+
+    def __init__(self, cache: SelectorCache, site: str, pattern: str, recheck: bool = False):
+        self.cache = cache
+        self.site = site
+        self.pattern = pattern
+        self.recheck = recheck
+        self._preferred = {}
+        self._hits = {'title': Counter(), 'price': Counter()}
+        # Карточки, где выученная стратегия поля ничего не нашла
+        self._misses = Counter()
+
+    def _preferred_name(self, kind: str) -> Optional[str]:
+        if self.recheck:
+            return None
+        if kind not in self._preferred:
+            entry = self.cache.get(self.site, self.pattern, kind)
+            self._preferred[kind] = entry['strategy'] if entry else None
+        return self._preferred[kind]
+
+    def discover_cards(self, root, strategies: List) -> Tuple[Optional[str], List]:
+        """Карточки товаров: сначала только выученной стратегией, полный поиск - если карточек стало заметно меньше"""
+        entry = self.cache.get(self.site, self.pattern, 'card')
+        strategy = None
+        if entry:
+            strategy = next((item for item in strategies if item.name == entry['strategy']), None)
+        if strategy is not None:
+            _, cards = discover_cards(root, [strategy])
+            if cards and len(cards) >= entry.get('count', 0) * config.SELECTOR_CACHE_MIN_RATIO:
+                discovery_stats.record(self.site, strategy.name)
+                return strategy.name, cards
+            print(f"  Выученная стратегия {strategy.name} нашла {len(cards)} карточек "
+                  f"(было {entry.get('count', 0)}), подбираем заново")
+
+        name, cards = discover_cards(root, strategies, site=self.site)
+        if name:
+            self.cache.learn(self.site, self.pattern, 'card', name, len(cards))
+        return name, cards
+
+    def order(self, kind: str, strategies: List[FieldStrategy]) -> List[FieldStrategy]:
+        """Стратегии поля в порядке проверки: выученная - первой"""
+        preferred = self._preferred_name(kind)
+        if not preferred:
+            return strategies
+        return sorted(strategies, key=lambda item: item.name != preferred)
+
+    def hit(self, kind: str, name: str):
+        self._hits[kind][name] += 1
+
+    def miss(self, kind: str, name: str):
+        if name == self._preferred_name(kind):
+            self._misses[kind] += 1
+
+    def finish(self):
+        """Запомнить стратегии, которые чаще всего срабатывали на этой странице.
+        Выученная стратегия, которая чаще промахивалась, чем срабатывала, забывается"""
+        for kind, hits in self._hits.items():
+            preferred = self._preferred_name(kind)
+            winner = hits.most_common(1)[0][0] if hits else None
+            if winner and not (winner == preferred and self._misses[kind] > hits[winner]):
+                self.cache.learn(self.site, self.pattern, kind, winner)
+            elif preferred:
+                self.cache.forget(self.site, self.pattern, kind)
+
+
+def first_match(kind: str, card, all_text: str, strategies: List[FieldStrategy], accept: Callable,
+                page: PageStrategies = None) -> Optional[str]:
+    """Значение поля карточки по первой подходящей стратегии (с page - выученная пробуется первой).
+    accept(результат стратегии) возвращает значение поля или None"""
+    if page is not None:
+        strategies = page.order(kind, strategies)
+    for strategy in strategies:
+        try:
+            value = accept(strategy.func(card, all_text))
+        except Exception:
+            value = None
+        if value:
+            if page is not None:
+                page.hit(kind, strategy.name)
+            return value
+        if page is not None:
+            page.miss(kind, strategy.name)
+    return None
+
+
+# Глобальный кэш стратегий
+selector_cache = SelectorCache()
@@ -0,0 +1,227 @@
+"""
+Пул headless Chrome драйверов для параллельной загрузки страниц
+"""
+import threading
+import time
+from contextlib import contextmanager
+import config
+from network_capture import enable_capture
+
+try:
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    SELENIUM_AVAILABLE = True
+except ImportError:
+    SELENIUM_AVAILABLE = False
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+
+def build_chrome_options(user_agent: str = DEFAULT_USER_AGENT) -> 'Options':
+    """Опции headless Chrome, общие для всех парсеров"""
+    chrome_options = Options()
+    chrome_options.add_argument('--headless')
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--disable-gpu')
+    chrome_options.add_argument('--window-size=1920,1080')
+    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    chrome_options.add_argument(f'user-agent={user_agent}')
+    if config.SELENIUM_CAPTURE_XHR:
+        # Performance-лог нужен для перехвата JSON-ответов страницы (network_capture)
+        enable_capture(chrome_options)
+    if config.SELENIUM_LEAN_RENDER:
+        chrome_options.add_argument('--disable-extensions')
+        chrome_options.add_argument('--mute-audio')
+    return chrome_options
+
+
+def apply_lean_render(driver, site: str):
+    """Блокировка ресурсов для сайта через CDP Network.setBlockedURLs (картинки, шрифты, трекеры).
+    Вызывается перед каждой загрузкой: драйверы из пула общие для всех сайтов"""
+    blocked_urls = config.SELENIUM_BLOCKED_URLS.get(site, []) if config.SELENIUM_LEAN_RENDER else []
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked_urls})
+    except Exception as e:
+        print(f"  Не удалось настроить блокировку ресурсов: {e}")
+
+
+class DriverPool:
+    """Пул Selenium драйверов с выдачей/возвратом и ограничением общей памяти браузеров"""
+
+    def __init__(self, size: int = None, max_memory_mb: int = None, user_agent: str = DEFAULT_USER_AGENT):
+        self.size = size or config.SELENIUM_POOL_SIZE
+        self.max_memory_mb = max_memory_mb or config.SELENIUM_MAX_MEMORY_MB
+        self.user_agent = user_agent
+        self._idle = []  # Свободные драйверы
+        self._drivers = set()  # Все созданные драйверы (свободные и выданные)
+        self._starting = 0  # Драйверы, которые сейчас создаются
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def _driver_memory_mb(self, driver) -> float:
+        """Память (RSS) chromedriver и всех его процессов Chrome"""
+        if not PSUTIL_AVAILABLE:
+            return config.SELENIUM_DRIVER_MEMORY_ESTIMATE_MB
+        try:
+            process = psutil.Process(driver.service.process.pid)
+            processes = [process] + process.children(recursive=True)
+            total = 0
+            for proc in processes:
+                try:
+                    total += proc.memory_info().rss
+                except psutil.Error:
+                    continue
+            return total / (1024 * 1024)
+        except Exception:
+            return config.SELENIUM_DRIVER_MEMORY_ESTIMATE_MB
+
+    def memory_usage_mb(self) -> float:
+        """Суммарная память всех браузеров пула"""
+        with self._cond:
+            drivers = list(self._drivers)
+            starting = self._starting
+        used = sum(self._driver_memory_mb(driver) for driver in drivers)
+        return used + starting * config.SELENIUM_DRIVER_MEMORY_ESTIMATE_MB
+
+    def _can_spawn(self) -> bool:
+        """Можно ли запустить еще один браузер (вызывается под блокировкой)"""
+        total = len(self._drivers) + self._starting
+        if total >= self.size:
+            return False
+        if total == 0:
+            # Хотя бы один драйвер нужен всегда, даже если лимит памяти слишком мал
+            return True
+        used = sum(self._driver_memory_mb(driver) for driver in self._drivers)
+        used += self._starting * config.SELENIUM_DRIVER_MEMORY_ESTIMATE_MB
+        return used + config.SELENIUM_DRIVER_MEMORY_ESTIMATE_MB <= self.max_memory_mb
+
+    def _create_driver(self):
+        """Запуск нового headless Chrome"""
+        print("  Инициализация Selenium драйвера...")
+        driver = webdriver.Chrome(options=build_chrome_options(self.user_agent))
+        print("  Selenium драйвер успешно инициализирован")
+        return driver
+
+    @staticmethod
+    def _is_alive(driver) -> bool:
+        """Проверяем, что драйвер еще работает"""
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def acquire(self, timeout: float = None):
+        """Взять драйвер из пула (ждет освобождения не дольше timeout секунд). None если не удалось"""
+        if not SELENIUM_AVAILABLE:
+            return None
+        if timeout is None:
+            timeout = config.SELENIUM_ACQUIRE_TIMEOUT
+        deadline = time.monotonic() + timeout
+
+        while True:
+            driver = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return None
+                    if self._idle:
+                        driver = self._idle.pop()
+                        break
+                    if self._can_spawn():
+                        self._starting += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        print("  Не дождались свободного Selenium драйвера")
+                        return None
+                    self._cond.wait(remaining)
+
+            if driver is not None:
+                if self._is_alive(driver):
+                    return driver
+                print("  Драйвер не работает, пересоздаем...")
+                self._discard(driver)
+                continue
+
+            try:
+                driver = self._create_driver()
+            except Exception as e:
+                print(f"  ОШИБКА при инициализации Selenium драйвера: {e}")
+                import traceback
+                traceback.print_exc()
+                with self._cond:
+                    self._starting -= 1
+                    self._cond.notify()
+                return None
+
+            with self._cond:
+                self._starting -= 1
+                if self._closed:
+                    self._quit(driver)
+                    return None
+                self._drivers.add(driver)
+            return driver
+
+    def release(self, driver, broken: bool = False):
+        """Вернуть драйвер в пул. Сломанные драйверы и драйверы сверх лимита памяти закрываются"""
+        if driver is None:
+            return
+        with self._cond:
+            closed = self._closed
+        if broken or closed or self.memory_usage_mb() > self.max_memory_mb:
+            if not broken and not closed:
+                print("  Превышен лимит памяти браузеров, закрываем драйвер")
+            self._discard(driver)
+            return
+        with self._cond:
+            self._idle.append(driver)
+            self._cond.notify()
+
+    def _discard(self, driver):
+        """Закрыть драйвер и освободить его место в пуле"""
+        with self._cond:
+            self._drivers.discard(driver)
+            self._cond.notify()
+        self._quit(driver)
+
+    @contextmanager
+    def driver(self, timeout: float = None):
+        """Контекстный менеджер: with pool.driver() as driver: ... (driver может быть None)"""
+        driver = self.acquire(timeout)
+        broken = False
+        try:
+            yield driver
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.release(driver, broken=broken)
+
+    def close(self):
+        """Закрыть все драйверы пула"""
+        with self._cond:
+            self._closed = True
+            drivers = list(self._drivers)
+            self._drivers.clear()
+            self._idle.clear()
+            self._cond.notify_all()
+        for driver in drivers:
+            self._quit(driver)
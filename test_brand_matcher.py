@@ -0,0 +1,50 @@
+"""
+Тесты поиска брендов, категорий и стоп-слов (brand_matcher.py)
+"""
+from brand_matcher import AhoCorasick, BrandMatcher, apply_brand_match
+
+BRANDS = [
+    {'name': 'Stone Island'},
+    {'name': 'Nike', 'category': 'shoes'},
+    {'name': 'Maison Margiela'},
+]
+ALIASES = {'maison margiela': ['margiela', 'mm6']}
+CATEGORY_KEYWORDS = {'shoes': ['sneakers', 'shoes'], 'outerwear': ['jacket', 'coat']}
+
+
+def _matcher():
+    return BrandMatcher(BRANDS, aliases=ALIASES, category_keywords=CATEGORY_KEYWORDS,
+                        exclude_words=['category', 'more'])
+
+
+def test_aho_corasick_finds_overlapping_matches():
+    automaton = AhoCorasick([('he', 1), ('she', 2), ('hers', 3)])
+    assert sorted(automaton.iter_matches('ushers')) == [(1, 4, 2), (2, 4, 1), (2, 6, 3)]
+
+
+def test_brand_and_category():
+    assert _matcher().classify('Stone Island jacket') == ('stone island', 'outerwear', False)
+    assert _matcher().classify('MM6 coat') == ('maison margiela', 'outerwear', False)
+
+
+def test_brand_with_required_category():
+    matcher = _matcher()
+    assert matcher.classify('Nike Air Max sneakers') == ('nike', 'shoes', False)
+    # Бренд найден, но не в своей категории
+    assert matcher.classify('Nike windbreaker jacket') == (None, 'outerwear', False)
+
+
+def test_category_from_description():
+    assert _matcher().classify('Nike Air Max 270', 'brand new shoes') == ('nike', 'shoes', False)
+
+
+def test_exclude_words_only_in_title():
+    matcher = _matcher()
+    assert matcher.classify('Stone Island category').excluded
+    assert not matcher.classify('Stone Island jacket', 'see more photos').excluded
+
+
+def test_apply_brand_match():
+    product = {'title': 'Stone Island jacket'}
+    apply_brand_match(product, _matcher().classify(product['title']))
+    assert product == {'title': 'Stone Island jacket', 'brand': 'stone island', 'category': 'outerwear'}
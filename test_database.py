@@ -0,0 +1,151 @@
+"""
+Тесты базы данных (database.py): миграции схемы со старой базы, история цен
+"""
+import hashlib
+import sqlite3
+from database import ProductDatabase, _MIGRATIONS, price_drop_percent
+from product import Product
+
+LINK = 'https://globalbunjang.com/product/123'
+# Тот же товар под ссылкой с параметрами отслеживания
+LINK_TRACKED = 'https://globalbunjang.com/product/123?ref=search&utm_source=x'
+LINK_FRUITS = 'https://fruitsfamily.com/product/a1b/stone-island-coat'
+
+
+def _create_baseline_db(path: str):
+    """База в исходной схеме: product_id - MD5 ссылки, метки времени - текст CURRENT_TIMESTAMP"""
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id TEXT UNIQUE,
+            title TEXT,
+            link TEXT,
+            price TEXT,
+            image TEXT,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP,
+            first_seen_at TIMESTAMP
+        );
+        CREATE TABLE users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            subscribed INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+    rows = [
+        (LINK, 'Stone Island jacket', None, '2024-01-02 03:04:05'),
+        (LINK_TRACKED, 'Stone Island jacket', '2024-01-03 00:00:00', '2024-01-03 00:00:00'),
+        (LINK_FRUITS, 'Stone Island coat', None, '2024-01-04 00:00:00'),
+    ]
+    for link, title, sent_at, first_seen_at in rows:
+        conn.execute(
+            'INSERT INTO products (product_id, title, link, created_at, sent_at, first_seen_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (hashlib.md5(link.encode()).hexdigest(), title, link, '2024-01-01 00:00:00', sent_at, first_seen_at))
+    conn.execute("INSERT INTO users (user_id, username, created_at, last_active) "
+                 "VALUES (1, 'user', '2024-01-01 00:00:00', '2024-01-05 00:00:00')")
+    conn.commit()
+    conn.close()
+
+
+def test_migrations_from_baseline_schema(tmp_path):
+    path = str(tmp_path / 'products.db')
+    _create_baseline_db(path)
+
+    db = ProductDatabase(path)
+    try:
+        with db._read() as cursor:
+            cursor.execute('PRAGMA user_version')
+            assert cursor.fetchone()[0] == _MIGRATIONS[-1][0] == 6
+
+            cursor.execute('PRAGMA table_info(products)')
+            assert 'product_id' not in [column[1] for column in cursor.fetchall()]
+
+            # Дубликат с параметрами отслеживания склеен, отметка об отправке сохранена
+            cursor.execute('SELECT site, listing_id, created_at, first_seen_at, sent_at FROM products ORDER BY site')
+            rows = cursor.fetchall()
+            assert rows == [
+                (1, 123, 1704067200, 1704164645, 1704240000),
+                (2, int('a1b', 36), 1704067200, 1704326400, None),
+            ]
+
+            cursor.execute('SELECT created_at, last_active FROM users WHERE user_id = 1')
+            assert cursor.fetchone() == (1704067200, 1704412800)
+            cursor.execute("SELECT typeof(created_at) FROM products")
+            assert {row[0] for row in cursor.fetchall()} == {'integer'}
+    finally:
+        db.close()
+
+    # Повторное открытие: миграции уже применены, данные не меняются
+    db = ProductDatabase(path)
+    try:
+        with db._read() as cursor:
+            cursor.execute('SELECT count(*) FROM products')
+            assert cursor.fetchone()[0] == 2
+    finally:
+        db.close()
+
+
+def _product(listing_id: int, price: str) -> Product:
+    return Product.from_dict({'title': f'Stone Island {listing_id}', 'price': price,
+                              'link': f'https://globalbunjang.com/product/{listing_id}'})
+
+
+def test_record_prices_diff(tmp_path):
+    db = ProductDatabase(str(tmp_path / 'products.db'))
+    try:
+        # Первое появление - не изменение
+        assert db.record_prices([_product(1, '100,000원'), _product(2, '50,000원'), _product(3, '')]) == []
+        # Та же цена - ничего нового
+        assert db.record_prices([_product(1, '100,000원')]) == []
+
+        changes = db.record_prices([_product(1, '80,000원'), _product(2, '55,000원'), _product(4, '10,000원')])
+        assert [(change.product.listing_id, change.old_amount, change.new_amount, change.currency)
+                for change in sorted(changes, key=lambda change: change.product.listing_id)] == [
+            (1, 100000, 80000, 'KRW'),
+            (2, 50000, 55000, 'KRW'),
+        ]
+        drops = {change.product.listing_id: price_drop_percent(change) for change in changes}
+        assert drops[1] == 20.0
+        assert drops[2] < 0
+
+        with db._read() as cursor:
+            cursor.execute('SELECT site, listing_id, price FROM price_history ORDER BY listing_id, seen_at')
+            # Запись дописывается только при изменении (одна секунда - одна запись на товар)
+            assert {row[1] for row in cursor.fetchall()} == {1, 2, 4}
+    finally:
+        db.close()
+
+
+def test_record_prices_currency_change_is_not_compared(tmp_path):
+    db = ProductDatabase(str(tmp_path / 'products.db'))
+    try:
+        db.record_prices([_product(1, '100,000원')])
+        assert db.record_prices([_product(1, '$80')]) == []
+        # Следующее изменение сравнивается уже с ценой в долларах (суммы в центах)
+        assert [(change.old_amount, change.new_amount) for change in db.record_prices([_product(1, '$70')])] == [(8000, 7000)]
+        # Изменение меньше доллара тоже изменение
+        changes = db.record_prices([_product(1, '$69.99')])
+        assert [(change.old_amount, change.new_amount) for change in changes] == [(7000, 6999)]
+    finally:
+        db.close()
+
+
+def test_products_without_listing_id_are_keyed_by_link(tmp_path):
+    db = ProductDatabase(str(tmp_path / 'products.db'))
+    try:
+        item = Product.from_dict({'title': 'Stone Island coat', 'link': 'https://fruitsfamily.com/item/3kd9x'})
+        assert db.get_new_products([item]) == [item]
+        db.record_sent([item])
+        stats = db.new_filter_stats()
+        tracked = Product.from_dict({'title': 'Stone Island coat',
+                                     'link': 'https://fruitsfamily.com/item/3kd9x?utm_source=x'})
+        assert db.get_new_products([tracked], stats=stats) == []
+        assert stats['already_sent'] == 1 and stats['no_id'] == 0
+    finally:
+        db.close()
@@ -0,0 +1,74 @@
+"""
+Тесты конвейера парсинга и отправки (main.py) без сети и Telegram
+"""
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+import config
+import main
+from database import AsyncProductDatabase, ProductDatabase
+from parser import BunjangParser
+
+
+class FakeBot:
+    """Вместо TelegramBot: запоминает отправленные товары и заголовки уведомлений"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_product_to_all_users(self, user_ids, product, parser, header=None):
+        self.sent.append((product.listing_id, header))
+        return len(user_ids)
+
+
+def _api_payload(prices):
+    return json.dumps({'list': [{'pid': pid, 'name': f'Stone Island item {pid}', 'price': str(price), 'status': '0'}
+                                for pid, price in prices]}).encode()
+
+
+def _bot(tmp_path, prices):
+    parser = BunjangParser(use_selenium=False, brands_filter=config.BRANDS_TO_PARSE, use_api=True)
+
+    async def fetch_many(urls):
+        return {url: _api_payload(prices()) for url in urls}
+
+    parser.fetch_many = fetch_many
+    bot = main.BunjangBot.__new__(main.BunjangBot)
+    bot.bunjang_parser = parser
+    bot.db = AsyncProductDatabase(ProductDatabase(str(tmp_path / 'products.db')))
+    bot.bot = FakeBot()
+    bot.scrape_executor = ThreadPoolExecutor(2)
+
+    async def no_fruits(emit):
+        return 0
+
+    bot.scrape_fruits = no_fruits
+    return bot
+
+
+def test_price_drop_alert_for_sent_bunjang_listing(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'BRANDS_TO_PARSE', [{'name': 'stone island'}])
+    monkeypatch.setattr(config, 'PRICE_HISTORY_ENABLED', True)
+    monkeypatch.setattr(config, 'PRICE_DROP_ALERT_PERCENT', 10)
+    # Паузы между сообщениями не нужны
+    sleep = asyncio.sleep
+    monkeypatch.setattr(asyncio, 'sleep', lambda delay, *args: sleep(0, *args))
+
+    prices = {3: 100000, 2: 50000, 1: 70000}
+    bot = _bot(tmp_path, lambda: sorted(prices.items(), reverse=True))
+    try:
+        bot.db.sync.add_user(1)
+        asyncio.run(bot.parse_and_send())
+        assert sorted(bot.bot.sent) == [(1, None), (2, None), (3, None)]
+
+        # Цена отправленного товара 2 снизилась на 20%, товара 3 - на 5% (ниже порога)
+        bot.bot.sent.clear()
+        prices.update({3: 95000, 2: 40000})
+        asyncio.run(bot.parse_and_send())
+        assert len(bot.bot.sent) == 1
+        listing_id, header = bot.bot.sent[0]
+        assert listing_id == 2
+        assert '20%' in header and '50,000 → 40,000 KRW' in header
+    finally:
+        bot.scrape_executor.shutdown()
+        bot.db.close()
@@ -0,0 +1,66 @@
+"""
+Тесты распознавания цен (price.py)
+"""
+from price import (extract_prices, find_price, format_minor_units, from_minor_units, parse_amount, parse_price,
+                   to_minor_units)
+
+
+def test_prefix_and_suffix_currency():
+    assert find_price('₩120,000') == (120000.0, 'KRW', '₩120,000')
+    assert find_price('$ 99.5') == (99.5, 'USD', '$ 99.5')
+    assert find_price('120,000원') == (120000.0, 'KRW', '120,000원')
+    assert find_price('100000 KRW') == (100000.0, 'KRW', '100000 KRW')
+    assert find_price('Price: 35,000 won') == (35000.0, 'KRW', '35,000 won')
+
+
+def test_number_before_prefix_symbol_is_not_price():
+    # Модель или размер перед ценой не должны забирать себе символ валюты
+    assert find_price('Nike Air Max 270 ₩150,000') == (150000.0, 'KRW', '₩150,000')
+    assert find_price('Size 95 $120') == (120.0, 'USD', '$120')
+    assert find_price('Jordan 1 USD 200') == (200.0, 'USD', 'USD 200')
+
+
+def test_find_price_in_currency():
+    assert find_price('$120 / 150,000원', currency='KRW').amount == 150000.0
+    assert find_price('$120', currency='KRW') is None
+
+
+def test_parse_price_default_currency():
+    assert parse_price('150,000', default_currency='KRW') == (150000.0, 'KRW', '150,000')
+    assert parse_price('150,000') is None
+    assert parse_price('', default_currency='KRW') is None
+
+
+def test_parse_amount():
+    assert parse_amount('120,000') == 120000.0
+    assert parse_amount('99.50') == 99.5
+    assert parse_amount('1.200.000') == 1200000.0
+
+
+def test_extract_prices_per_text():
+    texts = ['Nike Air Max 270 ₩150,000', 'no price here', 'Size 95 $120', '35,000']
+    assert extract_prices(texts) == [
+        (150000.0, 'KRW', '₩150,000'),
+        None,
+        (120.0, 'USD', '$120'),
+        None,
+    ]
+
+
+def test_extract_prices_does_not_cross_texts():
+    # Число в конце одного текста и символ валюты в начале следующего - не одна цена
+    assert extract_prices(['item 270', '₩ sold out']) == [None, None]
+    assert extract_prices(['item 270', '원']) == [None, None]
+
+
+def test_extract_prices_default_currency():
+    assert extract_prices(['35,000', ''], default_currency='KRW') == [(35000.0, 'KRW', '35,000'), None]
+
+
+def test_minor_units():
+    assert to_minor_units(120000.0, 'KRW') == 120000
+    assert to_minor_units(99.5, 'USD') == 9950
+    assert to_minor_units(1500.0, None) == 1500
+    assert from_minor_units(9950, 'USD') == 99.5
+    assert format_minor_units(120000, 'KRW') == '120,000'
+    assert format_minor_units(123456, 'EUR') == '1,234.56'
@@ -0,0 +1,60 @@
+"""
+Тесты ключей товаров (product.py): ID объявления из ссылки и ключ по ссылке без ID
+"""
+from product import LINK_KEY_SITE_CODE, Product, Site, db_key_for_link
+
+
+def _key(link: str):
+    return Product.from_dict({'title': 'Stone Island jacket', 'link': link}).db_key
+
+
+def test_bunjang_product_link():
+    assert _key('https://globalbunjang.com/product/123') == (Site.BUNJANG.code, 123)
+    assert _key('https://globalbunjang.com/product/123?ref=search') == (Site.BUNJANG.code, 123)
+
+
+def test_fruits_product_link():
+    assert _key('https://fruitsfamily.com/product/a1b/stone-island-coat') == (Site.FRUITS.code, int('a1b', 36))
+
+
+def test_fruits_item_and_goods_links():
+    for path in ('/item/3kd9x', '/goods/58213'):
+        key = _key('https://fruitsfamily.com' + path)
+        assert key is not None and key[0] == LINK_KEY_SITE_CODE
+        # Ключ стабилен и не зависит от параметров, якоря и www.
+        assert _key('https://www.fruitsfamily.com' + path + '/?utm_source=x#photos') == key
+    assert _key('https://fruitsfamily.com/item/3kd9x') != _key('https://fruitsfamily.com/goods/3kd9x')
+
+
+def test_bunjang_html_fallback_links():
+    # HTML-fallback Bunjang берет любую ссылку карточки кроме категорий и поиска
+    links = ['https://globalbunjang.com/en/products/123', 'https://globalbunjang.com/p/123?q=nike',
+             'https://m.bunjang.co.kr/products/123']
+    keys = [_key(link) for link in links]
+    assert all(key is not None and key[0] == LINK_KEY_SITE_CODE for key in keys)
+    assert len(set(keys)) == len(keys)
+    assert _key('https://globalbunjang.com/p/123') == keys[1]
+
+
+def test_link_key_fits_packed_key():
+    # seen_index.pack_key сдвигает ID на 3 бита - ключ должен оставаться 64-битным
+    key = _key('https://fruitsfamily.com/item/3kd9x')
+    assert 0 <= key[1] < 2 ** 60
+
+
+def test_no_link():
+    assert _key('') is None
+    assert db_key_for_link(None, '') is None
+    assert db_key_for_link(Site.BUNJANG, 'https://globalbunjang.com/product/7') == (Site.BUNJANG.code, 7)
+
+
+def test_price_keeps_cents_outside_krw():
+    krw = Product.from_dict({'link': 'https://globalbunjang.com/product/1', 'price': '120,000원'})
+    assert (krw.price_amount, krw.price_minor) == (120000, 120000)
+    assert isinstance(krw.price_amount, int)
+    usd = Product.from_dict({'link': 'https://globalbunjang.com/product/2', 'price': '$99.99'})
+    assert (usd.price_amount, usd.currency, usd.price_minor) == (99.99, 'USD', 9999)
+    eur = Product.from_dict({'link': 'https://fruitsfamily.com/product/a1b', 'price_amount': 12.5, 'currency': 'EUR'})
+    assert (eur.price_amount, eur.price_minor) == (12.5, 1250)
+    # Повторный разбор словаря (to_dict -> from_dict) сумму не меняет
+    assert Product.from_dict(usd.to_dict()).price_amount == 99.99
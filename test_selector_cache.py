@@ -0,0 +1,44 @@
+"""
+Тесты кэша стратегий (selector_cache.py): обмен стратегиями между основным процессом и обработчиками
+"""
+import config
+from selector_cache import FieldStrategy, SelectorCache, url_pattern
+
+URL = 'https://globalbunjang.com/search?q=nike'
+
+
+def _worker_cache(tmp_path):
+    cache = SelectorCache(str(tmp_path / 'worker.json'), enabled=True)
+    cache.persist = False
+    return cache
+
+
+def test_worker_gets_strategies_learned_elsewhere(tmp_path):
+    parent = SelectorCache(str(tmp_path / 'selector_cache.json'), enabled=True)
+    first, second = _worker_cache(tmp_path), _worker_cache(tmp_path)
+
+    # Первый обработчик выучил стратегию, основной процесс слил изменения
+    first.apply_page_state('bunjang', URL, parent.page_state('bunjang', URL))
+    first.learn('bunjang', url_pattern(URL), 'title', 'title_attr')
+    parent.merge(first.drain())
+
+    # Второй обработчик получает ее с задачей, хотя его копия кэша старше
+    second.apply_page_state('bunjang', URL, parent.page_state('bunjang', URL))
+    page = second.page('bunjang', URL)
+    strategies = [FieldStrategy(name, lambda card, text: None) for name in ('text', 'title_attr')]
+    assert page.order('title', strategies)[0].name == 'title_attr'
+    assert second.drain() == []
+
+
+def test_recheck_counts_pages_in_parent(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'SELECTOR_CACHE_RECHECK_PAGES', 3)
+    parent = SelectorCache(str(tmp_path / 'selector_cache.json'), enabled=True)
+    workers = [_worker_cache(tmp_path) for _ in range(3)]
+    rechecks = []
+    for index in range(6):
+        worker = workers[index % len(workers)]
+        worker.apply_page_state('bunjang', URL, parent.page_state('bunjang', URL))
+        rechecks.append(worker.page('bunjang', URL).recheck)
+    # Каждая третья страница шаблона, в каком бы процессе она ни разбиралась
+    assert rechecks == [False, False, True, False, False, True]
+